@@ -11,57 +11,270 @@
     This particular file contains all the main widget placement entries. It does not touch any of the images
     (as that is handled solely by the widget containers)
 """
+# Startup timing has to begin before anything else is imported
+from utils.Startup import startupTimer
+import argparse
+import os
+import time
+
 # GUI stuff
 import tkinter as tk
 import tkinter.font as tkFont
-from utils.WidgetContainers import Timer, PhaseImageWidget, DeviceCounterWidget
-
-# Needed for bindings
-from functools import partial
+import tkinter.filedialog as tkFileDialog
+import tkinter.messagebox as tkMessageBox
+from utils.WidgetContainers import Timer, PhaseImageWidget, DeviceCounterWidget, CanvasTimer, CanvasPhaseImage, CanvasDeviceCounter
+from utils.AssetManager import getAssetManager
+from utils.TickEngine import TickEngine
+from utils.FightState import FightState, TIMER_NAMES, DEFAULT_ACTION_COOLDOWNS, COALESCED_ACTIONS, buildTimerArgs
+from utils.RenderCoalescer import RenderCoalescer
+from utils.Startup import lazyImport
+
+# The timer bank needs NumPy, so it is only loaded when actually asked for
+TimerBankModule = lazyImport("utils.TimerBank")
+
+# Neither are the glyphs, the journal or any of the diagnostics (the profiler alone pulls in cProfile, pstats and
+# tracemalloc), since most sessions never turn them on
+GlyphCacheModule = lazyImport("utils.GlyphCache")
+FightJournalModule = lazyImport("utils.FightJournal")
+HotPathProfilerModule = lazyImport("utils.HotPathProfiler")
+LoopMonitorModule = lazyImport("utils.LoopMonitor")
 
 # Keyboard listener nonsense
 from utils import ModKeyListener
+from utils.ActionQueue import ActionQueue
+from utils.LatencyProbe import LatencyProbe
+from utils.Theme import Theme, ThemeManager, getThemeManager
+from utils.Profile import Profile, HOTKEY_NAMES, DEFAULT_PROFILE_PATH, getDefaultProfile, saveProfile, loadProfile, \
+                          loadWindowPositions, saveWindowPositions
+startupTimer.mark("imports")
+
+# The ways the overlay can be drawn: a tree of frames and labels, or a single canvas
+OVERLAY_LAYOUTS = ["widgets", "canvas"]
+
+# And the ways the timers can show their time: as text, or as images out of a GlyphCache
+TIMER_DISPLAYS = ["text", "glyphs"]
 
 class App(tk.Tk):
     """
         The main window for the app. This will only hold the available settings options and allow the user
         to initialize the overlay for use.
+
+        The config window is filled in from the first of the given profiles (the defaults otherwise). When
+        quick-launching, the config window is not even built and an overlay is started right away for every one
+        of the profiles, each with its own timers and hotkeys. The config window only shows up once all of
+        those overlays are closed.
+
+        Every overlay runs in this one process: they share the keyboard hook (each overlay's hotkeys live in
+        their own namespace of the one dispatch table), the tick engine (and, with useTimerBank, one TimerBank
+        that ticks every overlay's timers at once), the render coalescer and the decoded images and glyphs.
+
+        The layout (one of OVERLAY_LAYOUTS) and timer display (one of TIMER_DISPLAYS) pick how every overlay
+        started from this app is drawn. With monitorLoop, the event loop monitor (and its HUD on every overlay)
+        is running from the start instead of waiting for its hotkey. With journalFights, every fight is recorded
+        to a FightJournal of its own in JOURNAL_DIR, where only the most recent few journals are kept.
     """
-    def __init__(self, * , defalultBG = "#999999"):
+    def __init__(self, * , defalultBG = "#999999", profiles: list[Profile] = None, quickLaunch: bool = False, layout: str = "widgets",
+                 timerDisplay: str = "text", useTimerBank: bool = False, monitorLoop: bool = False, journalFights: bool = False):
         # Initialize our window
         tk.Tk.__init__(self)
         self.title("Kalos Timer")
-        self["bg"] = defalultBG
+
+        # Every window of the app (overlays included) takes its colors from the theme as it is created
+        self.themeManager = ThemeManager(self, Theme(background = defalultBG))
         self.nhFont = tkFont.Font(self, family = "Helvetica", size = 12)
         self.headerFont = tkFont.Font(self, family = "Helvetica", size = 30)
 
         # Initialize our class constants
-        self.expectedHotkeys = ["Start Timers", "Begin Check", "Fail Check", "10s Bind", "15s Bind",
-                        "Clear Device", "Reset Breath", "Reset Dive", "Reset Laser", "Reset Arrows",
-                        "Reset Bombs", "Reset FMA", "Add Device"]
+        self.expectedHotkeys = HOTKEY_NAMES
         self.expectedArgs = ["Device Timer", "Laser Timer", "Arrow Timer",
                              "FMA Timer", "Breath Timers", "Bomb Timer",
                              "Dive Timer"]
-        self.expArgsDefs = ["60", "15", "15", "150", "60, 45, 20, 20", "10", "20"]
-
-        # Initialize some class variables that will be passed to our overlay eventually
-        self.storedHotkeys = {argName:tk.StringVar(self, value = "       Set       ") for argName in self.expectedHotkeys}
-
-        # Creat the GUI now
+        self.CAPTURE_TIMEOUT = 10000 # ms before a hotkey capture gives up
+        self.UNSET_HOTKEY = "       Set       "
+        self.QUICK_LAUNCH_BUDGET = 0.1 # seconds from loading a profile to a usable overlay
+        self.OVERLAY_LAYOUT = layout
+        self.TIMER_DISPLAY = timerDisplay
+
+        # Initialize some class variables that will be passed to our overlay eventually. The profile also
+        # carries the red times and auto-resets that the config window does not expose
+        self.launchProfiles = profiles if profiles else [getDefaultProfile()]
+        self.profile = self.launchProfiles[0]
+        self.expArgsDefs = [", ".join(str(initTime) for initTime in self.profile.timerArgs[timerName]["initTime"]) for timerName in TIMER_NAMES]
+        self.storedHotkeys = {argName:tk.StringVar(self, value = self.profile.hotkeys.get(argName, self.UNSET_HOTKEY)) for argName in self.expectedHotkeys}
+        self.configBuilt = False
+
+        # Creat the GUI now (unless we are going straight to the overlay)
+        self.quickLaunch = quickLaunch
+        if self.quickLaunch:
+            self.withdraw()
+        else:
+            self.buildConfigWindow()
+
+        # We will also need our key listener to be able to determine what keys we want to hotkey. Anything it
+        # triggers is handed over to the tk loop through our action queue instead of running on the hook thread
+        # (and traced on its way to the screen by our latency probe)
+        self.latencyProbe = LatencyProbe(self)
+        self.hotPathProfiler = None
+        self.actionQueue = ActionQueue(self, probe = self.latencyProbe)
+        self.listenerClass = ModKeyListener.ModKeyListener(actionQueue = self.actionQueue)
+
+        # Everything the overlays share, so that every additional overlay only adds its own widgets and fight
+        self.tickEngine = TickEngine(self)
+        self.timerBank = TimerBankModule.TimerBank(self.tickEngine) if useTimerBank else None
+        self.renderer = RenderCoalescer(self, probe = self.latencyProbe)
+        self.sharedGlyphs = None
+
+        # The event loop monitor only runs (and only shows its HUD on the overlays) while it is toggled on, and
+        # neither it nor the profiler are even created until then
+        self.loopMonitor = None
+        self.loopHUDs = dict()
+        if monitorLoop:
+            self.getLoopMonitor().start()
+
+        # And keep track of every overlay that is currently active (overlay id -> overlay)
+        self.overlays = dict()
+        self.nextOverlayId = 0
+        self.OVERLAY_GAP = 10 # px between overlays launched side by side
+
+        # Every overlay takes the lowest free slot (overlay id -> slot), and each slot opens where an overlay in
+        # that slot was last dragged to, even across sessions
+        self.overlaySlots = dict()
+        self.windowPositions = loadWindowPositions()
+
+        # Every fight can get its own event journal, written in the background while its overlay is up
+        self.JOURNAL_FIGHTS = journalFights
+        self.JOURNAL_DIR = "./logs"
+        self.JOURNALS_KEPT = 20
+        self.fightJournals = dict()
+
+        # Some hotkeys act on the app itself rather than the overlay. They are bound once (in the app's own
+        # namespace) no matter how many overlays ask for them
+        self.appActions = {"Dump Latency": self.dumpLatencyReport, "Toggle Profiling": self.toggleProfiling,
+                           "Toggle Loop Monitor": self.toggleLoopMonitor}
+        self.APP_NAMESPACE = "app"
+        self.appHotkeys = set()
+
+        if self.quickLaunch:
+            for profile in self.launchProfiles:
+                self.launchOverlay(profile)
+
+            # None of the profiles could be launched, so there is nothing to wait for
+            if not self.overlays:
+                self.showConfigWindow()
+
+    def buildConfigWindow(self) -> None:
+        """ Creates the config window, filled in from the current profile. """
         self.generateGUI()
-
-        # And change all backgrounds to match the overall window view
-        self.changeColor(self["bg"])
+        self.configBuilt = True
 
         # And associate the overlay argument passing to the bottom button
         self.startOverlayButton.bind("<Button-1>", self.executeOverlay)
 
-        # We will also need our key listener to be able to determine what keys we want to hotkey
-        self.listenerClass = ModKeyListener.ModKeyListener()
-
-        # And keep track of whether or not our overlay is currently active
-        self.overlay = None
-        self.overlayActive = False
+    def showConfigWindow(self) -> None:
+        """ Brings the config window up for an app that was quick-launched (building it if need be). """
+        if self.quickLaunch:
+            self.quickLaunch = False
+            if not self.configBuilt:
+                self.buildConfigWindow()
+            self.deiconify()
+
+    def collectProfile(self) -> Profile:
+        """ Builds (and validates) a profile out of whatever is currently entered in the config window. """
+        initTimeArgs = {argName:[int(val) for val in self.entryElems[self.expectedArgs[argInd]].get().split(",")] for argInd, argName in enumerate(TIMER_NAMES)}
+        redTimes = {argName:self.profile.timerArgs[argName]["redTime"] for argName in TIMER_NAMES}
+        autoResets = {argName:self.profile.timerArgs[argName]["autoReset"] for argName in TIMER_NAMES}
+        hotkeys = {settingName:hotkey.get() for settingName, hotkey in self.storedHotkeys.items() if hotkey.get() != self.UNSET_HOTKEY}
+        return Profile(buildTimerArgs(initTimeArgs, redTimes, autoResets), hotkeys)
+
+    def saveProfileAs(self) -> None:
+        """ Asks where to save the current settings and writes them out as a profile. """
+        try:
+            profile = self.collectProfile()
+        except ValueError as profileError:
+            tkMessageBox.showerror("Invalid Profile", str(profileError), parent = self)
+            return
+
+        profilePath = tkFileDialog.asksaveasfilename(parent = self, initialdir = os.path.dirname(DEFAULT_PROFILE_PATH),
+                                                     initialfile = os.path.basename(DEFAULT_PROFILE_PATH), defaultextension = ".json")
+        if profilePath:
+            saveProfile(profile, profilePath)
+            self.profile = profile
+
+    def openProfile(self) -> None:
+        """ Asks for a profile and fills the config window in with it. """
+        profilePath = tkFileDialog.askopenfilename(parent = self, initialdir = os.path.dirname(DEFAULT_PROFILE_PATH),
+                                                   filetypes = [("Profiles", "*.json")])
+        if not profilePath:
+            return
+        try:
+            self.profile = loadProfile(profilePath)
+        except (OSError, ValueError) as profileError:
+            tkMessageBox.showerror("Invalid Profile", str(profileError), parent = self)
+            return
+
+        for argInd, argName in enumerate(TIMER_NAMES):
+            self.entryElems[self.expectedArgs[argInd]].set(", ".join(str(initTime) for initTime in self.profile.timerArgs[argName]["initTime"]))
+        for settingName, hotkey in self.storedHotkeys.items():
+            hotkey.set(self.profile.hotkeys.get(settingName, self.UNSET_HOTKEY))
+
+    def destroy(self) -> None:
+        """ Dumps whatever latency samples (and profile) were gathered before closing the app. """
+        if self.latencyProbe.hasSamples():
+            self.dumpLatencyReport()
+        if self.hotPathProfiler is not None and self.hotPathProfiler.active:
+            self.toggleProfiling()
+        if self.loopMonitor is not None and self.loopMonitor.running:
+            self.toggleLoopMonitor()
+        self.closeJournal()
+        tk.Tk.destroy(self)
+
+    def closeJournal(self, overlayId: int = None) -> None:
+        """ Flushes and closes the journal of the given overlay's fight (or of every fight). """
+        overlayIds = list(self.fightJournals.keys()) if overlayId is None else [overlayId]
+        for curId in overlayIds:
+            fightJournal = self.fightJournals.pop(curId, None)
+            if fightJournal is not None:
+                fightJournal.close()
+
+    def dumpLatencyReport(self) -> None:
+        """ Writes the keypress-to-redraw latency percentiles gathered so far to a file. """
+        print("Latency report written to {}".format(self.latencyProbe.dumpReport()))
+
+    def toggleProfiling(self) -> None:
+        """ Starts profiling the running overlays, or stops and writes out everything profiled so far. """
+        # The profiler is only created the first time it is asked for
+        if self.hotPathProfiler is None:
+            hotPaths = HotPathProfilerModule.HOT_PATHS + [(ThemeManager, "setTheme")]
+            if self.timerBank is not None:
+                hotPaths.append((TimerBankModule.TimerBank, "updateTimer"))
+            self.hotPathProfiler = HotPathProfilerModule.HotPathProfiler(hotPaths = hotPaths)
+            self.actionQueue.profiler = self.hotPathProfiler
+        summaryPath = self.hotPathProfiler.toggle()
+        if summaryPath is None:
+            print("Profiling started")
+        else:
+            print("Profile written to {}".format(summaryPath))
+
+    def getLoopMonitor(self) -> "LoopMonitor":
+        """ Returns the event loop monitor, creating it the first time it is needed. """
+        if self.loopMonitor is None:
+            self.loopMonitor = LoopMonitorModule.LoopMonitor(self, engine = self.tickEngine)
+        return self.loopMonitor
+
+    def toggleLoopMonitor(self) -> None:
+        """ Starts monitoring the event loop (with a HUD on every overlay), or stops and exports the loop log. """
+        if not self.getLoopMonitor().running:
+            self.loopMonitor.reset()
+            self.loopMonitor.start()
+            for overlayId, overlay in self.overlays.items():
+                self.loopHUDs[overlayId] = LoopMonitorModule.LoopMonitorHUD(overlay, self.loopMonitor)
+            return
+
+        self.loopMonitor.stop()
+        for hud in self.loopHUDs.values():
+            hud.destroy()
+        self.loopHUDs = dict()
+        print("Loop log written to {}".format(self.loopMonitor.exportLog()))
 
     def recordHotkey(self, topLevelName: str) -> None:
         """
@@ -74,32 +287,62 @@ class App(tk.Tk):
         tempHKWindow.grab_set()
         tempHKWindow.title("Setting Hotkey for {}".format(topLevelName))
 
+        # Keeps track of the capture so that whichever of capture/timeout/cancel happens first wins
+        captureState = {"sid": None, "active": True}
+
         # create a destruction functor for it
         def termWindow(curWindow : tk.Toplevel):
             curWindow.grab_release()
             curWindow.destroy()
 
+        def endCapture() -> None:
+            """ Stops listening and releases the action queue once the capture is over for any reason. """
+            captureState["active"] = False
+            self.listenerClass.cancelCapture(captureState["sid"])
+            self.actionQueue.stop()
+
+        def onCapture(sid: int, keyCombo: str) -> None:
+            """ Runs on the tk loop once the listener has captured a combination. """
+            if not captureState["active"] or sid != captureState["sid"]:
+                return
+            endCapture()
+
+            # Once captured, present the value captured and re-enable the close button
+            doneButton.configure(state = "normal")
+            keyVar.set(keyCombo)
+            self.storedHotkeys[topLevelName].set(keyCombo)
+
+        def onTimeout(sid: int) -> None:
+            """ Gives up on the capture if nothing was pressed in time. """
+            if not captureState["active"] or sid != captureState["sid"]:
+                return
+            endCapture()
+            keyVar.set("Timed out")
+            doneButton.configure(state = "normal")
+
+        def onCancel() -> None:
+            """ Abandons the capture (if still running) and closes the window. """
+            if captureState["active"]:
+                endCapture()
+            termWindow(tempHKWindow)
+
         captureFrame = tk.Frame(tempHKWindow)
         tk.Label(captureFrame, text = "Captured Key: ", font = self.nhFont, pady = 8, padx = 50).pack(side = "left")
         keyVar = tk.StringVar(captureFrame, value = "...")
         tk.Label(captureFrame, textvariable = keyVar, font = self.nhFont, padx = 50).pack(side = "right")
         captureFrame.pack(side = "top")
-        doneButton = tk.Button(tempHKWindow, text = "Done", font = self.nhFont, command = lambda : termWindow(tempHKWindow), state = "disabled")
-        doneButton.pack(side = "bottom")
-        self.changeColor(self["bg"], container = tempHKWindow)
-
-        # start a new listener which will send a callback to set the hotkey for this window
-        listenerSID = self.listenerClass.startNewCapture()
-        while not self.listenerClass.checkCaptureStatus(listenerSID):
-            self.update() # work on queue while listener hasn't captured anything
-
-        # Once captured, present the value captured and re-enable the close button
-        doneButton.configure(state = "normal")
-        keyVar.set(self.listenerClass.getCapturedKey(listenerSID))
-        self.storedHotkeys[topLevelName].set(keyVar.get())
-
-        # And destroy our listener so it doesn't take up space
-        self.listenerClass.removeCaptures()
+        buttonFrame = tk.Frame(tempHKWindow)
+        doneButton = tk.Button(buttonFrame, text = "Done", font = self.nhFont, command = lambda : termWindow(tempHKWindow), state = "disabled")
+        doneButton.pack(side = "left")
+        tk.Button(buttonFrame, text = "Cancel", font = self.nhFont, command = onCancel).pack(side = "right")
+        buttonFrame.pack(side = "bottom")
+        tempHKWindow.protocol("WM_DELETE_WINDOW", onCancel)
+
+        # start a new capture which will let us know through the action queue once it has captured something (or
+        # timed out). There is no polling loop here; the tk loop simply sleeps until an event shows up
+        self.actionQueue.start()
+        captureState["sid"] = self.listenerClass.startNewCapture(onCapture = onCapture, timeout = self.CAPTURE_TIMEOUT/1000,
+                                                                 onTimeout = onTimeout)
 
     def generateGUI(self) -> None:
         """
@@ -143,101 +386,192 @@ class App(tk.Tk):
         self.buttonFrame = tk.Frame(self, pady = 4)
         self.startOverlayButton = tk.Button(self.buttonFrame, text = "Start Overlay", font = self.nhFont)
         self.startOverlayButton.pack(side = "bottom", fill = "x", expand = False)
+        tk.Button(self.buttonFrame, text = "Load Profile", font = self.nhFont, command = self.openProfile).pack(side = "left", fill = "x", expand = True)
+        tk.Button(self.buttonFrame, text = "Save Profile", font = self.nhFont, command = self.saveProfileAs).pack(side = "right", fill = "x", expand = True)
         self.buttonFrame.grid(column = 0, columnspan = 2, row = 2, sticky = "WE", padx = 10)
 
     def executeOverlay(self, event):
         """
             Starts the overlay along with all the relevant arguments passed to the window.
         """
+        startupTimer.mark("waiting in config window")
+
         # first we need to collect the arguments that were given to the window to pass into the overlay
-        expectedArgOrder = ["device", "laser", "arrow", "fma", "breath", "bomb", "dive"]
-        initTimeArgs = {argName:[int(val) for val in self.entryElems[self.expectedArgs[argInd]].get().split(",")] for argInd, argName in enumerate(expectedArgOrder)}
-
-        # And combine that with some pre-specified defaults to package into a full argument sequence
-        redTimeArgs = {"device": 10, 
-                      "laser": 5,
-                      "arrow": 5,
-                      "fma": 20,
-                      "breath": 5,
-                      "bomb": 5,
-                      "dive": 5}
-        autoResetArgs = {"device": True,
-                         "laser": True,
-                         "arrow": True,
-                         "bomb": True}
-        fullArgs = {argName:{"initTime": initTimeArgs[argName],
-                             "redTime": redTimeArgs[argName],
-                             "autoReset": autoResetArgs.get(argName, False)} for argName in expectedArgOrder}
-
-        # And then pass these collected values to the overlay
-        self.overlay = Overlay(fullArgs)
-        self.overlayActive = True
-        self.overlay.grab_set()
+        try:
+            self.profile = self.collectProfile()
+        except ValueError as profileError:
+            tkMessageBox.showerror("Invalid Settings", str(profileError), parent = self)
+            return
+
+        # The last settings used are remembered for next time (and for --profile)
+        try:
+            saveProfile(self.profile)
+        except OSError as saveError:
+            print("Could not save the default profile: {}".format(saveError))
+        self.launchOverlay(self.profile)
+
+    def launchOverlay(self, profile: Profile) -> int | None:
+        """
+            Starts a new overlay with the timers of the given profile and binds its hotkeys. Overlays that are
+            already up keep running. Returns the id of the new overlay, or None if its hotkeys could not be bound.
+        """
+        try:
+            self.checkHotkeys(profile.hotkeys)
+        except ValueError as hotkeyError:
+            tkMessageBox.showerror("Invalid Hotkeys", str(hotkeyError), parent = self)
+            return None
+        startupTimer.mark("hotkey lookup")
+
+        overlayId = self.nextOverlayId
+        self.nextOverlayId += 1
+
+        # Start journaling the new fight (making room for it among the old journals)
+        fightJournal = None
+        if self.JOURNAL_FIGHTS:
+            try:
+                FightJournalModule.pruneJournals(self.JOURNAL_DIR, keepCount = self.JOURNALS_KEPT - 1)
+            except OSError as pruneError:
+                print("Could not prune the old fight journals: {}".format(pruneError))
+            fightJournal = FightJournalModule.FightJournal("{}/fight_{}_{}.kjl".format(self.JOURNAL_DIR, time.strftime("%Y%m%d-%H%M%S"), overlayId))
+            fightJournal.start()
+            self.fightJournals[overlayId] = fightJournal
+
+        # And then pass these collected values to the overlay, along with everything it shares with the others
+        overlay = Overlay(profile.timerArgs, probe = self.latencyProbe, journal = fightJournal, layout = self.OVERLAY_LAYOUT,
+                          timerDisplay = self.TIMER_DISPLAY, engine = self.tickEngine, bank = self.timerBank,
+                          renderer = self.renderer, glyphs = self.getSharedGlyphs())
+        slot = min(set(range(len(self.overlays) + 1)) - set(self.overlaySlots.values()))
+        overlay.geometry("+{}+{}".format(*self.getSlotPosition(slot, overlay)))
+        overlay.associateMoveCallback(lambda x, y : self.saveOverlayPosition(slot, x, y))
+        self.overlaySlots[overlayId] = slot
+        self.overlays[overlayId] = overlay
+        if self.loopMonitor is not None and self.loopMonitor.running:
+            self.loopHUDs[overlayId] = LoopMonitorModule.LoopMonitorHUD(overlay, self.loopMonitor)
+        startupTimer.mark("overlay construction")
 
         # And finally we can use any keybinds that the user has set at this point
-        self.startExecutingKeybinds(self.overlay)
-
-    def startExecutingKeybinds(self, curOverlay : "Overlay") -> None:
-        """
-            Sets up the keyboard listener to now interface with the overlay functionalities.
-        """
-        def functionSelector(settingName: str) -> callable:
-            """
-                Maps particular known setting name attributes to their respective functions.
-            """
-            match settingName:
-                case 'Start Timers':
-                    return curOverlay.startP2
-                case 'Begin Check':
-                    return curOverlay.startPhaseCheck
-                case 'Fail Check':
-                    return curOverlay.failPhaseCheck
-                case '10s Bind':
-                    return partial(curOverlay.addBindTimer, 10)
-                case '15s Bind':
-                    return partial(curOverlay.addBindTimer, 15)
-                case 'Clear Device':
-                    return curOverlay.cleanseDevice
-                case 'Reset Breath':
-                    return curOverlay.startBreath
-                case 'Reset Dive':
-                    return curOverlay.startDive
-                case 'Reset Laser':
-                    return curOverlay.startLaser
-                case 'Reset Arrows':
-                    return curOverlay.startArrow
-                case 'Reset Bombs':
-                    return curOverlay.startBombs
-                case 'Reset FMA':
-                    return curOverlay.startFMA
-                case 'Add Device':
-                    return curOverlay.addDevice
-                case _:
-                    raise NotImplementedError
-
-        for settingName, hotkey in self.storedHotkeys.items():
-            if hotkey.get()[0] != " ": # Means we have a valid hotkey to bind
-                self.listenerClass.createHotkeyCallback(hotkey.get(), functionSelector(settingName))
-
-        # And finally we can bind the window termination as well
-        def terminateOverlay():
-            self.overlay.destroy()
-            self.listenerClass.removeHotkeyListeners()
+        self.startExecutingKeybinds(overlay, profile.hotkeys, overlayId)
+        startupTimer.mark("hotkey binding")
 
-        self.listenerClass.createHotkeyCallback('Esc', terminateOverlay)
+        # The overlay is usable once it has been drawn for the first time
+        self.after_idle(self.overlayReady)
+        return overlayId
 
-    def changeColor(self, color, container=None):
+    def getSlotPosition(self, slot: int, overlay: "Overlay") -> tuple[int, int]:
         """
-            Revursively changes the background colors of all widgets within a given container.
+            Returns where an overlay in the given slot opens: where the last one in it was dragged to (kept on
+            the desktop, in case a monitor was unplugged since), or side by side with the other slots otherwise.
         """
-        if container is None:
-            container = self  # set to root window
-        container.config(bg=color)
-        for child in container.winfo_children():
-            if child.winfo_children():
-                self.changeColor(color, child)
-            elif type(child) is tk.Label:
-                child.config(bg=color)
+        if slot not in self.windowPositions:
+            return slot*(overlay.width + self.OVERLAY_GAP), 0
+        x, y = self.windowPositions[slot]
+        left, top, right, bottom = overlay.getDesktopBounds()
+        return (min(max(left, x), max(left, right - overlay.width)),
+                min(max(top, y), max(top, bottom - overlay.height)))
+
+    def saveOverlayPosition(self, slot: int, x: int, y: int) -> None:
+        """ Remembers where the overlay in a slot was dragged to for the next session. """
+        self.windowPositions[slot] = (x, y)
+        try:
+            saveWindowPositions(self.windowPositions)
+        except OSError as saveError:
+            print("Could not save the overlay positions: {}".format(saveError))
+
+    def getSharedGlyphs(self) -> "GlyphCache | None":
+        """ Returns the glyph cache shared by every overlay (if the timers are drawn as glyphs at all). """
+        if self.TIMER_DISPLAY != "glyphs":
+            return None
+        if self.sharedGlyphs is None:
+            self.sharedGlyphs = GlyphCacheModule.GlyphCache(self, tkFont.Font(self, family = "Helvetica", size = 40))
+        return self.sharedGlyphs
+
+    def overlayReady(self) -> None:
+        """ Runs once the overlay has been drawn for the first time and reports how long that took. """
+        startupTimer.mark("overlay first redraw")
+        startupTimer.printReport()
+
+        if self.quickLaunch:
+            readyTime = startupTimer.getElapsedSince("profile load")
+            if startupTimer.enabled or readyTime > self.QUICK_LAUNCH_BUDGET:
+                print("Profile to ready: {:.1f} ms (budget {:.0f} ms)".format(readyTime*1000, self.QUICK_LAUNCH_BUDGET*1000))
+
+    def checkHotkeys(self, hotkeys: dict[str, str]) -> None:
+        """
+            Looks every hotkey up on the actual keyboard and raises a ValueError for one that has no keys on it or
+            that ends up on the same keys as another one (or as Esc, which closes the overlays). Profiles only check
+            how their hotkeys are spelled, so this is where different spellings of the same keys ("ctrl+a" and
+            "control+a") are caught.
+        """
+        dispatcher = self.listenerClass.dispatcher
+        boundKeys = {(0, scanCode):"Close Overlay" for scanCode in dispatcher.parseHotkey("esc")[1]}
+        for settingName, hotkey in hotkeys.items():
+            try:
+                modMask, scanCodes = dispatcher.parseHotkey(hotkey.lower())
+            except ValueError as hotkeyError:
+                raise ValueError("Hotkey '{}' for '{}' is not valid: {}".format(hotkey, settingName, hotkeyError))
+
+            for scanCode in scanCodes:
+                boundSetting = boundKeys.setdefault((modMask, scanCode), settingName)
+                if boundSetting == "Close Overlay":
+                    raise ValueError("Hotkey '{}' for '{}' is reserved for closing the overlay".format(hotkey, settingName))
+                if boundSetting != settingName:
+                    raise ValueError("Hotkey '{}' for '{}' is already bound to '{}'".format(hotkey, settingName, boundSetting))
+
+    def startExecutingKeybinds(self, curOverlay : "Overlay", hotkeys: dict[str, str], overlayId: int) -> None:
+        """
+            Sets up the keyboard listener to now interface with the overlay functionalities. The overlay's
+            hotkeys are bound in a namespace of their own, so they can be dropped along with the overlay.
+        """
+        overlayNamespace = "overlay{}".format(overlayId)
+        for settingName, hotkey in hotkeys.items():
+            if settingName in self.appActions:
+                if (settingName, hotkey.lower()) not in self.appHotkeys:
+                    self.appHotkeys.add((settingName, hotkey.lower()))
+                    self.listenerClass.createHotkeyCallback(hotkey, self.appActions[settingName], settingName, namespace = self.APP_NAMESPACE)
+                continue
+
+            self.listenerClass.createHotkeyCallback(hotkey, curOverlay.actionFor(settingName), settingName,
+                                                    cooldown = DEFAULT_ACTION_COOLDOWNS.get(settingName, 0.0),
+                                                    coalesce = settingName in COALESCED_ACTIONS, namespace = overlayNamespace)
+
+        # And finally we can bind the window termination as well (once, since it closes every overlay)
+        if ("Close Overlay", "esc") not in self.appHotkeys:
+            self.appHotkeys.add(("Close Overlay", "esc"))
+            self.listenerClass.createHotkeyCallback('Esc', self.closeAllOverlays, "Close Overlay", namespace = self.APP_NAMESPACE)
+
+        # Hotkeys only post to the queue, so it needs to be drained while the overlay is up
+        self.actionQueue.start()
+
+    def closeOverlay(self, overlayId: int) -> None:
+        """ Closes a single overlay along with its hotkeys and journal. The other overlays keep running. """
+        overlay = self.overlays.pop(overlayId, None)
+        if overlay is None:
+            return
+        self.overlaySlots.pop(overlayId, None)
+        if overlayId in self.loopHUDs:
+            self.loopHUDs.pop(overlayId).destroy()
+        overlay.destroy()
+        self.listenerClass.removeHotkeyListeners("overlay{}".format(overlayId))
+        self.closeJournal(overlayId)
+        if self.overlays:
+            return
+
+        # Once the last overlay is gone the app's own hotkeys go with it
+        self.listenerClass.removeHotkeyListeners(self.APP_NAMESPACE)
+        self.appHotkeys = set()
+        self.actionQueue.stop()
+
+        # A quick-launched app has no config window up yet, so bring it up now
+        self.showConfigWindow()
+
+    def closeAllOverlays(self) -> None:
+        """ Closes every overlay that is currently up. """
+        for overlayId in list(self.overlays.keys()):
+            self.closeOverlay(overlayId)
+
+    def setTheme(self, theme: Theme) -> None:
+        """ Switches every window of the app (and every one created from now on) to the given theme. """
+        self.themeManager.setTheme(theme)
 
 class Overlay(tk.Toplevel):
     """
@@ -245,38 +579,88 @@ class Overlay(tk.Toplevel):
         phase controller. All keybinds are handled through external callbacks that affect the overlay
         (Note that the callbacks are registered to a keyboard listener, not through the tk event loop).
 
-        This also has contains all the controls for the timers and expects the user inputs to be
-        passed in from the main window for processing.
+        The controls for the timers are forwarded to a FightState (see utils/FightState.py), which holds all
+        of the fight logic and expects the user inputs to be passed in from the main window for processing.
 
         The timerArgs argument expects a dictionary that maps each one of the known timer types: 
             ["device", "laser", "arrow", "fma", "breath", "bomb", "dive"]
 
         That maps to the following expected input argument values
             (initTime, redTime, autoReset)
+
+        The layout picks how the overlay is drawn. "widgets" builds a tree of frames and labels, while "canvas"
+        draws everything as items on a single canvas so that a tick only has to itemconfigure a few text items.
+        The timer display picks whether timers show "text" or "glyphs" (images of the time drawn once up front
+        by a GlyphCache, so that a tick only swaps images).
+
+        Several overlays can share one tick engine (optionally with a TimerBank on it), one render coalescer and
+        one glyph cache by passing them in. Anything not passed in is owned by the overlay itself.
     """    
-    def __init__(self, timerArgs: dict, *args, **kwargs):
+    def __init__(self, timerArgs: dict, *args, probe: LatencyProbe = None, journal: "FightJournal" = None, layout: str = "widgets",
+                 timerDisplay: str = "text", engine: TickEngine = None, bank: "TimerBank" = None, renderer: RenderCoalescer = None,
+                 glyphs: "GlyphCache" = None, **kwargs):
+        if layout not in OVERLAY_LAYOUTS:
+            raise ValueError("Unknown overlay layout '{}' (expected one of: {})".format(layout, ", ".join(OVERLAY_LAYOUTS)))
+        if timerDisplay not in TIMER_DISPLAYS:
+            raise ValueError("Unknown timer display '{}' (expected one of: {})".format(timerDisplay, ", ".join(TIMER_DISPLAYS)))
+        self.layout = layout
+
         # Set some basic options for our new top level window
         tk.Toplevel.__init__(self, *args, **kwargs)
 
-        # These are properties of the boss itself that may be modified by our hotkeys later
-        self.observablePhaseInd = tk.IntVar(self, value = 0)
+        # Our widgets take their colors from the app's theme as they are created (an overlay without an App
+        # installs the default one, after this window was already made, so it is colored by hand)
+        self.themeManager = getThemeManager(self)
+        self.configure(background = self.themeManager.theme.background)
 
         # Then declare some constants that we will use later
-        self.MULT_PHASE_TIMER = {"breath"}
         self.timFont = tkFont.Font(self, family = "Helvetica", size = 40)
         self.dscrptFont = tkFont.Font(self, family = "Helvetica", size = 15)
+        self.glyphs = None
+        if timerDisplay == "glyphs":
+            self.glyphs = glyphs if glyphs is not None else GlyphCacheModule.GlyphCache(self, self.timFont)
+
+        # The fight itself lives outside of tk; this window is only a view on top of it. All of its timers
+        # are driven by one shared tick engine so they advance (and redraw) together (and, if given a journal,
+        # every action and transition of the fight is recorded to it)
+        self.ownsEngine = engine is None
+        self.tickEngine = engine if engine is not None else TickEngine(self)
+        self.fight = FightState(timerArgs, engine = self.tickEngine, journal = journal, bank = bank)
+
+        # Widget updates are coalesced into a single flush per event loop turn
+        self.ownsRenderer = renderer is None
+        self.renderer = renderer if renderer is not None else RenderCoalescer(self, probe = probe)
 
         # Set up the UI now and encapsulate returned objects
         timerRefs, imageRefs = self.setupGUI()
-        self.timObjs = self.encapsulateTimers(timerRefs, timerArgs)
+        self.timObjs = self.encapsulateTimers(timerRefs)
         self.kalosImgObj = self.encapsulateHeader(imageRefs["phaseRefs"])
         self.dotImgObj = self.encapsulatePhaseIndicator(imageRefs["dotRefs"])
 
-        # And now we can associate functionality based on the current phase and timer states
+        # And now we can redraw the header whenever the phase changes (and the timers whenever their glyphs do)
         self.associatePhaseSetCallback(self.kalosImgObj.resetPhase)
-        self.timObjs["fma"].associateZeroTimerCallback(self.dotImgObj.incrementDevices)
-        self.timObjs["device"].associateZeroTimerCallback(self.dotImgObj.incrementDevices)
-        self.dotImgObj.associateMaxDeviceCallback(self.timObjs["device"].swapToWarning, self.timObjs["device"].swapToNormal)
+        if self.glyphs is not None:
+            self.glyphs.associateRebuildCallback(self.renderTimers)
+
+    def destroy(self) -> None:
+        """ Stops the shared tick engine (and pending renders) before tearing down the window so nothing lands on dead widgets. """
+        # Engines and renderers shared with other overlays keep running, only without anything of ours
+        if self.ownsEngine:
+            self.tickEngine.stop()
+        else:
+            self.fight.detach()
+        if self.ownsRenderer:
+            self.renderer.cancel()
+        else:
+            self.renderer.forgetWidgets(self)
+        if self.glyphs is not None:
+            self.glyphs.removeRebuildCallback(self.renderTimers)
+        self.themeManager.removeThemeCallback(self.applyCanvasTheme)
+        if self.resizeCallback is not None:
+            self.after_cancel(self.resizeCallback)
+        if self.moveCallback is not None:
+            self.after_cancel(self.moveCallback)
+        tk.Toplevel.destroy(self)
 
     ########################## MAIN FUNCTIONALITIES ###########################
     def startP2(self, *, devicesToStart: list[str] = ["device", "fma", "bomb"]) -> None:
@@ -284,107 +668,102 @@ class Overlay(tk.Toplevel):
             Starts the main timer functionalities. This force the current phase to 0 (just in case
             it had been modified using another method), and starts the device, fma, and bomb timers.
         """
-        self.curPhase = 0
-        for curDevice in devicesToStart:
-            self.timObjs[curDevice].resetTimer()
+        self.fight.startP2(devicesToStart = devicesToStart)
 
     def startBreath(self) -> None:
         """ Starts/Resets the breath timer """
-        self.timObjs["breath"].resetTimer()
+        self.fight.startBreath()
 
     def startFMA(self) -> None:
         """ Starts/Resets the fma timer """
-        self.timObjs["fma"].resetTimer()
+        self.fight.startFMA()
 
     def startLaser(self) -> None: 
         """ Starts/Resets the laser timer """
-        self.timObjs["laser"].resetTimer()
+        self.fight.startLaser()
 
     def startArrow(self) -> None:
         """ Starts/Resets the arrow timer """
-        self.timObjs["arrow"].resetTimer()
+        self.fight.startArrow()
 
     def startDive(self) -> None:
         """ Starts/Resets the dive timer """
-        self.timObjs["dive"].resetTimer()
+        self.fight.startDive()
 
-    def startBreath(self) -> None:
-        """ Starts/Resets the breath timer """
-        self.timObjs["breath"].resetTimer()
-    
     def startBombs(self) -> None:
         """ Starts / Resets the bomb timer """
-        self.timObjs["bomb"].resetTimer()
+        self.fight.startBombs()
 
     def incrementPhase(self) -> None:
         """ Increments the current phase of the boss by 1"""
-        self.curPhase = self.curPhase + 1
+        self.fight.incrementPhase()
 
     def decrementPhase(self) -> None:
         """ Decrements the current phase of the boss by 1 (mostly for debugging) """
-        self.curPhase = self.curPhase - 1
+        self.fight.decrementPhase()
 
     def cleanseDevice(self) -> None:
         """ Performs a device cleansing (reduces device count by 1) """
-        self.dotImgObj.decrementDevices()
+        self.fight.cleanseDevice()
 
     def addDevice(self) -> None:
         """ Adds a new device. (Should not generally be used unless fma timer is waaay off) """
-        self.dotImgObj.incrementDevices()
+        self.fight.addDevice()
 
     def addBindTimer(self, bindTime: int) -> None:
         """ Increments the FMA timer by a pre-specified amount. """
-        self.timObjs["fma"].addTime(bindTime)
+        self.fight.addBindTimer(bindTime)
 
     def startPhaseCheck(self, *, affectedDevices = ["device", "fma"]) -> None:
         """ Starts the phase Kalos phase check. """
-        for curDevice in affectedDevices:
-            if self.timObjs[curDevice].isLocked():
-                return
-            self.timObjs[curDevice].applyExtraTime(50)
-        self.incrementPhase()
+        self.fight.startPhaseCheck(affectedDevices = affectedDevices)
 
     def failPhaseCheck(self, *, affectedDevices = ["device", "fma"]) -> None:
         """ Forces the current Kalos phase check to fail (thereby forcing previous timers to be active again) """
-        for curDevice in affectedDevices:
-            if not self.timObjs[curDevice].isLocked():
-                return
-            self.timObjs[curDevice].removeExtraTime()
-        self.decrementPhase()
+        self.fight.failPhaseCheck(affectedDevices = affectedDevices)
+
+    def actionFor(self, settingName: str) -> callable:
+        """ Maps particular known setting name attributes to their respective functions. """
+        return self.fight.actionFor(settingName)
 
     ########################## OBJECT ENCAPSULATORS ###########################
 
-    def encapsulatePhaseIndicator(self, dotLabels: list[tk.Label]) -> DeviceCounterWidget:
+    def encapsulatePhaseIndicator(self, dotLabels: list[tk.Label] | list[int]) -> DeviceCounterWidget:
         """
             Encapsulates the four dots as a class to hide the internal functionality of the
             dot swapping.
         """
-        return DeviceCounterWidget(dotLabels)
+        if self.layout == "canvas":
+            return CanvasDeviceCounter(self.canvas, dotLabels, self.fight.devices, renderer = self.renderer)
+        return DeviceCounterWidget(dotLabels, self.fight.devices, renderer = self.renderer)
 
-    def encapsulateHeader(self, curImageLabel: tk.Label) -> PhaseImageWidget:
+    def encapsulateHeader(self, curImageLabel: tk.Label | int) -> PhaseImageWidget:
         """
             Encapsulates the header as a class that has methods that won't clutter our program
             space.
         """
+        if self.layout == "canvas":
+            return CanvasPhaseImage(self, self.canvas, curImageLabel, self.curPhase)
         return PhaseImageWidget(self, curImageLabel, self.curPhase)
 
-    def encapsulateTimers(self, allTimers: dict[str, tuple[tk.StringVar, tk.Label]], timerArgs: dict) -> dict[str, Timer]:
+    def encapsulateTimers(self, allTimers: dict[str, tuple[tk.StringVar, tk.Label] | int]) -> dict[str, Timer]:
         """
-            Takes in our timers as tuples of the string time representations and labels along with the
-            passed in user input specifications and creates an encapsulated timer that is much easier
-            to move around the class.
+            Takes in our timers as tuples of the string time representations and labels (or as canvas text
+            items) and attaches them to the matching timer states of the fight, creating an encapsulated timer
+            that is much easier to move around the class.
         """
         objTimers = dict()
         for key in allTimers.keys():
-            objTimers[key] = Timer(self, allTimers[key][0], allTimers[key][1], 
-                                   timerArgs[key]["initTime"], timerArgs[key]["redTime"], timerArgs[key]["autoReset"],
-                                   indSelector = (lambda : self.curPhase) if key in self.MULT_PHASE_TIMER else (lambda : 0))
+            if self.layout == "canvas":
+                objTimers[key] = CanvasTimer(self.canvas, allTimers[key], self.fight.timers[key], renderer = self.renderer, glyphs = self.glyphs)
+            else:
+                objTimers[key] = Timer(allTimers[key][0], allTimers[key][1], self.fight.timers[key], renderer = self.renderer, glyphs = self.glyphs)
             
         return objTimers
 
     ############################ GUI SETUP ###################################
 
-    def setupGUI(self) -> tuple[dict[str]]:
+    def setupGUI(self) -> tuple[dict[str], dict[str]]:
         """
             The main function that sets up all UI elements and encapsulates all functional return values 
             along with their potentially bound functions.
@@ -392,12 +771,39 @@ class Overlay(tk.Toplevel):
         ######  Window Properties ########
         self.geometry("400x335")
         self.width, self.height = 400, 335
-        self['bg'] = "#999999"
         self.wm_attributes("-topmost", True)
         self.overrideredirect(True) # prevents the WM from creating its decorations on this window
-        self.x, self.y = 0, 0 # used to define window adjustments
+        self.dragOrigin = None # (pointer x, pointer y, window x, window y) at the press that started a drag
+        self.dragPosition = None # latest position asked for by the drag that has not been applied yet
+        self.dragMoved = False
+        self.windowPosition = None # where the last drag put the window (tk may take a while to report it)
+        self.moveCallback = None
+        self.moveCallbacks = list()
+        self.desktopBounds = (0, 0, 0, 0) # (left, top, right, bottom) of the desktop, read at the start of every drag
+        self.MOVE_INTERVAL = 16 # ms between window moves while dragging (about one per frame)
+        self.SNAP_DISTANCE = 12 # px from a screen edge within which the window snaps onto it
+        self.RESIZE_DEBOUNCE = 50 # ms to wait for configure events to settle
+        self.resizeCallback = None
 
         ######  Widget organization ########
+        if self.layout == "canvas":
+            timerRefs, imageRefs = self.setupCanvasLayout()
+        else:
+            timerRefs, imageRefs = self.setupWidgetLayout()
+
+        # Bind specific actions to certain functions
+        self.bind("<ButtonPress-1>", self.startMove)
+        self.bind("<ButtonRelease-1>", self.stopMove)
+        self.bind("<B1-Motion>", self.moveWindow)
+        self.bind("<Configure>", self.resize)
+
+        return timerRefs, imageRefs
+
+    def setupWidgetLayout(self) -> tuple[dict[str, tuple[tk.StringVar, tk.Label]], dict[str]]:
+        """
+            Lays the overlay out as a grid of frames and labels. Returns the timer references along with
+            the phase image label and the dot labels.
+        """
         # First set up our hp meter on top with the divider image
         imageObject = self.setupPhaseImageLabel()
 
@@ -410,15 +816,6 @@ class Overlay(tk.Toplevel):
         # And finally we can deal with the bomb and dive timers
         bdTimers = self.setupBombDiveRow()
 
-        # Set up some proper colors so they are consistent across widgets
-        self.changeColor(self['bg'])
-
-        # Bind specific actions to certain functions
-        self.bind("<ButtonPress-1>", self.startMove)
-        self.bind("<ButtonRelease-1>", self.stopMove)
-        self.bind("<B1-Motion>", self.moveWindow)
-        self.bind("<Configure>", self.resize)
-
         return ({"device": laTimers["device"],
                 "laser": laTimers["laser"],
                 "arrow": laTimers["arrow"],
@@ -429,6 +826,98 @@ class Overlay(tk.Toplevel):
                 {"phaseRefs" : imageObject,
                  "dotRefs" : dotObjects})
 
+    def setupCanvasLayout(self) -> tuple[dict[str, int], dict[str]]:
+        """
+            Draws the same overlay onto a single canvas. Every box, description, dot and timer is an item created
+            once right here, so afterwards only the items that change are ever touched. Returns the timer text
+            items along with the phase image item and the dot items.
+        """
+        self.canvas = tk.Canvas(self, highlightthickness = 0, borderwidth = 0)
+        self.canvas.pack(fill = "both", expand = True)
+
+        # Descriptions are items rather than widgets, so the theme has to tell us when they should change
+        self.themeManager.associateThemeCallback(self.applyCanvasTheme)
+
+        # The rows are sized from the fonts just like the labels of the widget layout size their grid rows
+        imgPadding = 2
+        headerHeight = getAssetManager().fitSize("2-1", self.width - 2*imgPadding)[1] + 2*imgPadding
+        rowHeight = self.timFont.metrics("linespace") + self.dscrptFont.metrics("linespace") + 4
+        splitX = self.width*3//5
+        halfX = self.width//2
+
+        # First the phase image on top (its image is set by the header widget)
+        phaseItem = self.canvas.create_image(imgPadding, imgPadding, anchor = "nw")
+
+        # Then the devices (with their dots in place of a description) next to the laser/arrow timers
+        rowTop = headerHeight
+        deviceItem = self.drawTimerBox(0, rowTop, splitX, rowTop + rowHeight, None)
+        dotItems = list()
+        dotWidth = getAssetManager().getSize("emptyDot")[0]
+        for dotInd in range(4):
+            dotItems.append(self.canvas.create_image(4 + dotInd*dotWidth, rowTop + rowHeight - 2, anchor = "sw"))
+        self.canvas.create_text((4 + 4*dotWidth + splitX)//2, rowTop + rowHeight - 2, text = "Devices", font = self.dscrptFont, anchor = "s",
+                                fill = self.themeManager.theme.foreground, tags = "description")
+        self.drawBox(splitX, rowTop, self.width, rowTop + rowHeight)
+        laserItem = self.drawTimerBox(splitX, rowTop, (splitX + self.width)//2, rowTop + rowHeight, "Lasers", border = False)
+        arrowItem = self.drawTimerBox((splitX + self.width)//2, rowTop, self.width, rowTop + rowHeight, "Arrows", border = False)
+
+        # And the two rows of paired timers
+        rowTop += rowHeight
+        fmaItem = self.drawTimerBox(0, rowTop, halfX, rowTop + rowHeight, "FMA")
+        breathItem = self.drawTimerBox(halfX, rowTop, self.width, rowTop + rowHeight, "Breath")
+        rowTop += rowHeight
+        bombItem = self.drawTimerBox(0, rowTop, halfX, rowTop + rowHeight, "Bombs")
+        diveItem = self.drawTimerBox(halfX, rowTop, self.width, rowTop + rowHeight, "Dive")
+
+        return ({"device": deviceItem,
+                 "laser": laserItem,
+                 "arrow": arrowItem,
+                 "fma": fmaItem,
+                 "breath": breathItem,
+                 "bomb": bombItem,
+                 "dive": diveItem},
+                {"phaseRefs" : phaseItem,
+                 "dotRefs" : dotItems})
+
+    def drawBox(self, left: int, top: int, right: int, bottom: int) -> None:
+        """ Draws a grooved border (like the frames of the widget layout have) on the canvas. """
+        self.canvas.create_rectangle(left, top, right - 2, bottom - 2, outline = "#666666")
+        self.canvas.create_rectangle(left + 1, top + 1, right - 1, bottom - 1, outline = "#cccccc")
+
+    def drawTimerBox(self, left: int, top: int, right: int, bottom: int, description: str | None, *, border: bool = True) -> int:
+        """
+            Draws a timer with its description underneath on the canvas and returns the timer's text item.
+        """
+        if border:
+            self.drawBox(left, top, right, bottom)
+        centerX = (left + right)//2
+        if self.glyphs is not None:
+            timerItem = self.canvas.create_image(centerX, top + 2, image = self.glyphs.getGlyph("--", "black"), anchor = "n")
+        else:
+            timerItem = self.canvas.create_text(centerX, top + 2, text = "--", font = self.timFont, anchor = "n")
+        if description is not None:
+            self.canvas.create_text(centerX, bottom - 2, text = description, font = self.dscrptFont, anchor = "s",
+                                    fill = self.themeManager.theme.foreground, tags = "description")
+        return timerItem
+
+    def applyCanvasTheme(self, theme: Theme) -> None:
+        """ Recolors the descriptions on the canvas (the canvas itself follows the theme on its own). """
+        self.canvas.itemconfigure("description", fill = theme.foreground)
+
+    def createTimerLabel(self, master) -> tuple[tk.StringVar | None, tk.Label]:
+        """
+            Creates the label for a single timer along with the variable holding its text. Glyph labels show
+            an image instead, so they have no variable.
+        """
+        if self.glyphs is not None:
+            return None, tk.Label(master, image = self.glyphs.getGlyph("--", "black"))
+
+        # The color of the text shows the state of the timer, so it is not the theme's to change
+        timerVar = tk.StringVar(master, value = "--")
+        timerLab = tk.Label(master, textvariable = timerVar, font = self.timFont)
+        self.themeManager.excludeOption(timerLab, "foreground")
+        return timerVar, timerLab
+
     def setupPhaseImageLabel(self) -> tk.Label:
         """
             Sets up the phase display for kalos. Returns the PhotoImage object that is rendered by
@@ -447,8 +936,7 @@ class Overlay(tk.Toplevel):
             and the widgets used to represents the devices.
         """
         deviceFrame = tk.Frame(self, relief = "groove", borderwidth = 1)
-        curDeviceTime = tk.StringVar(deviceFrame, value = "--")
-        curDeviceLabel = tk.Label(deviceFrame, textvariable = curDeviceTime, font = self.timFont)
+        curDeviceTime, curDeviceLabel = self.createTimerLabel(deviceFrame)
         curDeviceLabel.pack(side = "top", fill = "x", expand = True)
         descriptionFrame = tk.Frame(deviceFrame)
         deviceDots = list()
@@ -465,16 +953,14 @@ class Overlay(tk.Toplevel):
         laFrame = tk.Frame(self, relief = "groove", borderwidth = 1) # main frame
 
         laserFrame = tk.Frame(laFrame) # laser partition
-        curLaserTime = tk.StringVar(laserFrame, value = "--")
-        curLaserLab = tk.Label(laserFrame, textvariable = curLaserTime, font = self.timFont)
+        curLaserTime, curLaserLab = self.createTimerLabel(laserFrame)
         curLaserLab.pack(side = "top", fill = "y", expand = True)
         lDescriptLabel = tk.Label(laserFrame, text = "Lasers", font = self.dscrptFont)
         lDescriptLabel.pack(side = "bottom", fill = "x", expand= True)
         laserFrame.pack(side = "left", fill = "both", expand = True, ipadx = 5)
 
         arrowFrame = tk.Frame(laFrame) # arrow partition
-        curArrowTime = tk.StringVar(laFrame, value = "--")
-        curArrowLab = tk.Label(arrowFrame, textvariable = curArrowTime, font = self.timFont)
+        curArrowTime, curArrowLab = self.createTimerLabel(arrowFrame)
         curArrowLab.pack(side = "top", fill = "y", expand = True)
         aDescriptLabel = tk.Label(arrowFrame, text = "Arrows", font = self.dscrptFont)
         aDescriptLabel.pack(side = "bottom", fill = "x", expand = True)
@@ -493,8 +979,7 @@ class Overlay(tk.Toplevel):
         """
         # first deal with FMA part
         fmaFrame = tk.Frame(self, relief = "groove", borderwidth = 1)
-        curFMATime = tk.StringVar(fmaFrame, value = "--")
-        curFMALab = tk.Label(fmaFrame, textvariable = curFMATime, font = self.timFont)
+        curFMATime, curFMALab = self.createTimerLabel(fmaFrame)
         curFMALab.pack(side = "top", fill = "y", expand = True)
         fmaDescriptLabel = tk.Label(fmaFrame, text = "FMA", font = self.dscrptFont)
         fmaDescriptLabel.pack(side = "bottom", expand = True)
@@ -502,8 +987,7 @@ class Overlay(tk.Toplevel):
 
         # And then the breath part
         breathFrame = tk.Frame(self, relief = "groove", borderwidth = 1)
-        curBreathTime = tk.StringVar(breathFrame, value = "--")
-        curBreathLab = tk.Label(breathFrame, textvariable = curBreathTime, font = self.timFont)
+        curBreathTime, curBreathLab = self.createTimerLabel(breathFrame)
         curBreathLab.pack(side = "top", fill = "y", expand = True)
         breathDescriptLabel = tk.Label(breathFrame, text = "Breath", font = self.dscrptFont)
         breathDescriptLabel.pack(side = "bottom", expand = True)
@@ -518,8 +1002,7 @@ class Overlay(tk.Toplevel):
         """
         # like before deal with the bomb part
         self.bombFrame = tk.Frame(self, relief = "groove", borderwidth = 1)
-        self.curBombTime = tk.StringVar(self.bombFrame, value = "--")
-        self.curBombLab = tk.Label(self.bombFrame, textvariable = self.curBombTime, font = self.timFont)
+        self.curBombTime, self.curBombLab = self.createTimerLabel(self.bombFrame)
         self.curBombLab.pack(side = "top", fill = "y", expand = True)
         self.bombDescriptLabel = tk.Label(self.bombFrame, text = "Bombs", font = self.dscrptFont)
         self.bombDescriptLabel.pack(side = "bottom", expand = True)
@@ -527,8 +1010,7 @@ class Overlay(tk.Toplevel):
 
         # And the diving timer
         self.diveFrame = tk.Frame(self, relief = "groove", borderwidth = 1)
-        self.curDiveTime = tk.StringVar(self.diveFrame, value = "--")
-        self.curDiveLab = tk.Label(self.diveFrame, textvariable = self.curDiveTime, font = self.timFont)
+        self.curDiveTime, self.curDiveLab = self.createTimerLabel(self.diveFrame)
         self.curDiveLab.pack(side = "top", fill = "y", expand = True)
         self.diveDescriptLabel = tk.Label(self.diveFrame, text = "Dive", font = self.dscrptFont)
         self.diveDescriptLabel.pack(side = "bottom", expand = True)
@@ -542,56 +1024,158 @@ class Overlay(tk.Toplevel):
             (self.width != event.width or self.height != event.height)):
             self.width, self.height = event.width, event.height
 
-            # resize image on resize
-            # TODO: Use the kalos context to resize the image on resizing
+            # resize image on resize. Configure events come in storms while an edge is dragged, so we
+            # only rescale once the size has settled
+            if self.resizeCallback is not None:
+                self.after_cancel(self.resizeCallback)
+            self.resizeCallback = self.after(self.RESIZE_DEBOUNCE, self.applyResize)
 
-            # We can do the same with text potentially
-            # TODO: Try text adjustment via ratio differences
+    def applyResize(self) -> None:
+        """ Rescales the phase image to the settled window width. """
+        self.resizeCallback = None
+        self.kalosImgObj.rescale(self.width)
+
+    def setTimerFontSize(self, fontSize: int) -> None:
+        """
+            Changes the size of the timer font. Glyphs are only redrawn if the size actually changed, after which
+            every timer drawing from them (in every overlay sharing the cache) is re-rendered with the new ones.
+        """
+        if self.glyphs is None:
+            self.timFont.configure(size = fontSize)
+        else:
+            self.glyphs.setFontSize(fontSize)
+
+    def renderTimers(self) -> None:
+        """ Re-renders every timer with its current state. """
+        for timer in self.timObjs.values():
+            timer.render()
 
     def startMove(self, event):
-        self.x = event.x
-        self.y = event.y
+        """
+            Remembers where the drag started. This is the only time the window position is asked of tk, every
+            motion after that is worked out from the pointer alone.
+        """
+        self.dragOrigin = (event.x_root, event.y_root, self.winfo_x(), self.winfo_y())
+        self.desktopBounds = self.getDesktopBounds()
+        self.dragMoved = False
 
     def stopMove(self, event):
-        self.x = None
-        self.y = None
+        """ Puts the window at its final position right away and lets everyone know where it ended up. """
+        if self.dragOrigin is None:
+            return
+        if self.moveCallback is not None:
+            self.after_cancel(self.moveCallback)
+        self.applyMove()
+        self.dragOrigin = None
+
+        if self.dragMoved:
+            for callback in list(self.moveCallbacks):
+                callback(*self.windowPosition)
 
     def moveWindow(self, event):
-        deltax = event.x - self.x
-        deltay = event.y - self.y
-        x = self.winfo_x() + deltax
-        y = self.winfo_y() + deltay
-        self.geometry(f"+{x}+{y}")
-
-    def changeColor(self, color, container=None):
         """
-            Revursively changes the background colors of all widgets within a given container.
+            Motion events come in much faster than the screen refreshes, so each one only records where the
+            window should go and the latest of those is applied once per MOVE_INTERVAL.
+        """
+        if self.dragOrigin is None:
+            return
+        pressX, pressY, windowX, windowY = self.dragOrigin
+        self.dragPosition = (windowX + event.x_root - pressX, windowY + event.y_root - pressY)
+        if self.moveCallback is None:
+            self.moveCallback = self.after(self.MOVE_INTERVAL, self.applyMove)
+
+    def applyMove(self) -> None:
+        """ Moves the window to the latest position of the drag (snapped to the screen edges). """
+        self.moveCallback = None
+        if self.dragPosition is None:
+            return
+        x, y = self.snapToEdges(*self.dragPosition)
+        self.dragPosition = None
+        self.dragMoved = True
+        self.windowPosition = (x, y)
+        self.geometry("+{}+{}".format(x, y))
+
+    def getDesktopBounds(self) -> tuple[int, int, int, int]:
+        """
+            Returns the (left, top, right, bottom) edges of the whole desktop, spanning every monitor. The screen
+            size tk reports is only that of the primary monitor (on Windows at least), while the virtual root
+            covers all of them, including monitors at negative coordinates.
         """
-        if container is None:
-            container = self  # set to root window
-        container.config(bg=color)
-        for child in container.winfo_children():
-            if child.winfo_children():
-                self.changeColor(color, child)
-            elif type(child) is tk.Label:
-                child.config(bg=color)
+        left, top = self.winfo_vrootx(), self.winfo_vrooty()
+        return left, top, left + self.winfo_vrootwidth(), top + self.winfo_vrootheight()
+
+    def snapToEdges(self, x: int, y: int) -> tuple[int, int]:
+        """ Snaps a window position onto any desktop edge that it is within SNAP_DISTANCE of. """
+        left, top, right, bottom = self.desktopBounds
+        if abs(x - left) <= self.SNAP_DISTANCE:
+            x = left
+        elif abs(right - (x + self.width)) <= self.SNAP_DISTANCE:
+            x = right - self.width
+        if abs(y - top) <= self.SNAP_DISTANCE:
+            y = top
+        elif abs(bottom - (y + self.height)) <= self.SNAP_DISTANCE:
+            y = bottom - self.height
+        return x, y
+
+    def associateMoveCallback(self, callback: callable) -> None:
+        """ Calls the given callback with the new position (x, y) every time the window is dragged somewhere. """
+        self.moveCallbacks.append(callback)
 
     ########################## PROPERTIES AND BINDINGS #############################
 
     @property
     def curPhase(self) -> int:
         """ Function for retrieving the current phase. (Used in passing current phase values to callbacks.) """
-        return self.observablePhaseInd.get()
+        return self.fight.curPhase
     
     @curPhase.setter
     def curPhase(self, pVal: int) -> None:
         """ Setter for the current phase. """
-        self.observablePhaseInd.set(pVal)
+        self.fight.curPhase = pVal
 
     def associatePhaseSetCallback(self, callback: callable, *args, **kwargs):
         """ Associates a callback whenever the phase property is changed. """
-        self.observablePhaseInd.trace_add('write', lambda var, index, mode : callback(self.curPhase, *args, **kwargs))
+        self.fight.associatePhaseSetCallback(callback, *args, **kwargs)
 
 if __name__ == "__main__":
-    window = App()
+    argParser = argparse.ArgumentParser(description = "Kalos Timer")
+    argParser.add_argument("--timings", action = "store_true", help = "print a breakdown of the startup phases")
+    argParser.add_argument("--journal", action = "store_true",
+                           help = "record every fight to a journal in ./logs (only the 20 most recent are kept)")
+    argParser.add_argument("--profile", action = "append", nargs = "?", const = DEFAULT_PROFILE_PATH, default = None,
+                           help = "skip the config window and launch an overlay from a saved profile (default: {}). "
+                                  "Repeat it to launch several overlays at once".format(DEFAULT_PROFILE_PATH))
+    argParser.add_argument("--layout", choices = OVERLAY_LAYOUTS, default = "widgets",
+                           help = "draw the overlay as a tree of widgets or on a single canvas (default: widgets)")
+    argParser.add_argument("--digits", choices = TIMER_DISPLAYS, default = "text",
+                           help = "show the timers as text or as pre-rendered glyph images (default: text)")
+    argParser.add_argument("--timer-bank", action = "store_true",
+                           help = "tick the timers of every overlay together in one NumPy TimerBank")
+    argParser.add_argument("--loop-monitor", action = "store_true",
+                           help = "monitor the event loop (and show its HUD on the overlays) from the start")
+    cmdArgs = argParser.parse_args()
+    startupTimer.enabled = cmdArgs.timings
+    startupTimer.mark("argument parsing")
+
+    if cmdArgs.profile is not None:
+        # A bad profile is reported before any window shows up
+        try:
+            profiles = [loadProfile(profilePath) for profilePath in cmdArgs.profile]
+        except (OSError, ValueError) as profileError:
+            argParser.error("could not load profile: {}".format(profileError))
+        startupTimer.mark("profile load")
+
+        window = App(profiles = profiles, quickLaunch = True, layout = cmdArgs.layout, timerDisplay = cmdArgs.digits,
+                     useTimerBank = cmdArgs.timer_bank, monitorLoop = cmdArgs.loop_monitor, journalFights = cmdArgs.journal)
+    else:
+        # The config window starts out with whatever was used last time
+        try:
+            profile = loadProfile(DEFAULT_PROFILE_PATH) if os.path.exists(DEFAULT_PROFILE_PATH) else None
+        except (OSError, ValueError) as profileError:
+            print("Ignoring the default profile: {}".format(profileError))
+            profile = None
+        window = App(profiles = [profile] if profile is not None else None, layout = cmdArgs.layout, timerDisplay = cmdArgs.digits,
+                     useTimerBank = cmdArgs.timer_bank, monitorLoop = cmdArgs.loop_monitor, journalFights = cmdArgs.journal)
+        startupTimer.mark("config window construction")
+        window.after_idle(lambda : (startupTimer.mark("config window first redraw"), startupTimer.printReport()))
     window.mainloop()
\ No newline at end of file
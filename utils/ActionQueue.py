@@ -0,0 +1,150 @@
+"""
+ActionQueue.py
+
+Hotkey callbacks are run on the keyboard library's hook thread, but anything that touches tk has to happen on the
+main loop. This queue is the handoff between the two: the hook thread only appends a timestamped action, and the
+tk loop drains the queue on a polling interval that tightens while actions are flowing and relaxes when idle.
+"""
+import collections
+import sys
+import time
+
+class ActionQueue():
+    """
+        A lock-free handoff queue from any thread into the tk main loop. Appending to and popping from opposite
+        ends of a deque are atomic operations, so producers never need to take a lock and never block. Anything
+        else the queue keeps track of (coalescing included) is only ever touched by the tk loop.
+
+        Every action is stamped when it is posted so that we can report how long it waited before running. When
+        given a LatencyProbe, each action is also traced from that stamp all the way to the next redraw, and when
+        given a HotPathProfiler, every action run while it is profiling is measured under its name.
+
+        Without a root (e.g. when replaying traces headlessly) nothing is ever scheduled, so whoever owns the
+        queue has to call drain themselves, and failing actions are raised instead of reported.
+    """
+    def __init__(self, root, *, minPollInterval: int = 2, maxPollInterval: int = 50, probe: "LatencyProbe" = None,
+                 profiler: "HotPathProfiler" = None):
+        # The tk object that will drain the queue
+        self.root = root
+        self.pendingActions = collections.deque()
+        self.probe = probe
+        self.profiler = profiler
+
+        # Polling intervals are in ms. We start tight and back off while the queue stays empty
+        self.MIN_POLL_INTERVAL = minPollInterval
+        self.MAX_POLL_INTERVAL = maxPollInterval
+        self.pollInterval = self.MIN_POLL_INTERVAL
+        self.nextCallback = None
+
+        # Every user of the queue (overlay, hotkey capture, ...) starts and stops it, and we only drain while
+        # at least one of them still needs us. With no users the tk loop stays completely idle
+        self.activeUsers = 0
+
+        # Number of coalescable actions that were dropped in favor of an identical one (see drain)
+        self.coalescedCount = 0
+
+        # Some bookkeeping for the latency between an action being posted and executed
+        self.executedCount = 0
+        self.totalLatency = 0.0
+        self.lastLatency = 0.0
+        self.maxLatency = 0.0
+        self.maxDepth = 0
+
+    def post(self, action: callable, actionName: str = None, *, coalesce: bool = False) -> None:
+        """
+            Queues an action to be run on the tk loop. This is safe to call from any thread.
+
+            Coalesced actions only run once for however many of them with the same name are waiting together,
+            which is meant for actions where running twice in a row is the same as running once (e.g. a timer
+            reset).
+        """
+        self.pendingActions.append((time.perf_counter(), actionName, action, coalesce))
+
+    def wrap(self, action: callable, actionName: str = None, *, coalesce: bool = False) -> callable:
+        """ Returns a callable that posts the given action instead of running it. """
+        return lambda : self.post(action, actionName, coalesce = coalesce)
+
+    def start(self) -> None:
+        """ Starts draining the queue from the tk loop. Every call must be matched with a call to stop. """
+        self.activeUsers += 1
+        if self.nextCallback is None and self.root is not None:
+            self.pollInterval = self.MIN_POLL_INTERVAL
+            self.nextCallback = self.root.after(self.pollInterval, self.drain)
+
+    def stop(self) -> None:
+        """
+            Releases one user of the queue and stops draining once nobody needs it anymore. Anything still
+            queued at that point stays there until the queue is started again.
+        """
+        self.activeUsers = max(0, self.activeUsers - 1)
+        if self.activeUsers == 0 and self.nextCallback is not None:
+            self.root.after_cancel(self.nextCallback)
+            self.nextCallback = None
+
+    def drain(self) -> None:
+        """
+            Runs every action that was queued when the drain began. Actions that arrive while draining are left
+            for the next turn so that a burst of keys can never starve the rest of the event loop.
+
+            Coalescing happens here rather than in post, so the hook thread never has to agree with us on what
+            is waiting: a coalesced action is dropped if one of the same name already ran in this drain.
+        """
+        self.nextCallback = None
+        queueDepth = len(self.pendingActions)
+        self.maxDepth = max(self.maxDepth, queueDepth)
+        coalescedNames = set()
+
+        for _ in range(queueDepth):
+            postTime, actionName, action, coalesce = self.pendingActions.popleft()
+            if coalesce:
+                if actionName in coalescedNames:
+                    self.coalescedCount += 1
+                    continue
+                coalescedNames.add(actionName)
+
+            # track enqueue-to-execute latency
+            self.lastLatency = time.perf_counter() - postTime
+            self.maxLatency = max(self.maxLatency, self.lastLatency)
+            self.totalLatency += self.lastLatency
+            self.executedCount += 1
+
+            # A single bad action should not kill the drain loop, so report it the same way tk would
+            if self.probe is not None:
+                self.probe.beginAction(actionName, postTime)
+            try:
+                if self.profiler is not None and self.profiler.active:
+                    self.profiler.runAction(actionName, action)
+                else:
+                    action()
+            except Exception:
+                if self.root is None:
+                    raise
+                self.root.report_callback_exception(*sys.exc_info())
+            finally:
+                if self.probe is not None:
+                    self.probe.endAction()
+
+        # Poll tightly while keys are flowing and back off while we are idle
+        if queueDepth:
+            self.pollInterval = self.MIN_POLL_INTERVAL
+        else:
+            self.pollInterval = min(self.pollInterval*2, self.MAX_POLL_INTERVAL)
+
+        # An action may well have been the one that stopped us
+        if self.activeUsers > 0 and self.root is not None:
+            self.nextCallback = self.root.after(self.pollInterval, self.drain)
+
+    def getQueueDepth(self) -> int:
+        """ Returns the number of actions waiting to be run. """
+        return len(self.pendingActions)
+
+    def getLatencyStats(self) -> dict[str, float]:
+        """ Reports the enqueue-to-execute latency of the actions that have been run so far (in seconds). """
+        return {"executed": self.executedCount,
+                "depth": len(self.pendingActions),
+                "maxDepth": self.maxDepth,
+                "coalesced": self.coalescedCount,
+                "lastLatency": self.lastLatency,
+                "meanLatency": self.totalLatency/self.executedCount if self.executedCount else 0.0,
+                "maxLatency": self.maxLatency,
+                "pollInterval": self.pollInterval}
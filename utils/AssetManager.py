@@ -0,0 +1,233 @@
+"""
+AssetManager.py
+
+Every image the overlay shows comes out of the resources folder, and every widget used to decode its own copy of
+them. The asset manager hands out tk images that are shared by every widget and every overlay, so each image is
+decoded by tk at most once for the whole process.
+
+Every resource is stacked into a single atlas, which is written to a cache folder as one PNG that tk reads
+natively, so native size images are copied by tk out of that one decoded image and never need PIL. Scaled variants
+that are asked for at startup are converted once and written to the same cache folder; cache entries are stamped
+with the modification time and size of their source so that editing a resource invalidates them, and only the last
+few sizes of each resource are kept. Sizes that only come up while a window is being resized are converted in
+memory and never touch the disk. PIL (and the PIL atlas) is only needed on a cache miss.
+"""
+import glob
+import os
+import struct
+import tkinter as tk
+import weakref
+import zlib
+from utils.Startup import lazyImport
+
+# PIL is only used when something has to be converted, so it is not imported until then
+Image = lazyImport("PIL.Image")
+ImageTk = lazyImport("PIL.ImageTk")
+
+def readPngSize(pngPath: str) -> tuple[int, int]:
+    """ Reads the (width, height) of a PNG straight out of its header without decoding it. """
+    with open(pngPath, "rb") as pngFile:
+        header = pngFile.read(24)
+    if header[:8] != b"\x89PNG\r\n\x1a\n":
+        raise ValueError("{} is not a PNG file".format(pngPath))
+    return struct.unpack(">II", header[16:24])
+
+class AssetManager():
+    """
+        Hands out shared tk images for every PNG in the resource directory. Resources are referred to by their
+        file name without the extension (e.g. "redDot" or "2-3").
+
+        Every resource has a fixed box in the atlas, worked out from the PNG headers alone. Native size tk images
+        are copied once each out of the cached atlas (decoded by tk in one go) and kept for the life of the
+        process. Scaled ones come from the cache folder and live for as long as some widget holds on to them.
+
+        The first cache miss decodes every resource with PIL into the RGBA atlas, which is then kept for any
+        later miss. Scaled images are resampled straight out of a resource's box in the atlas, while getImage at
+        native size hands out a cropped copy.
+    """
+    def __init__(self, resourceDir: str = "./resources", cacheDir: str = None, *, cachedSizes: int = 4):
+        self.RESOURCE_DIR = resourceDir
+        self.CACHE_DIR = cacheDir if cacheDir is not None else os.path.join(resourceDir, "cache")
+        self.CACHED_SIZES = cachedSizes # sizes of every resource kept in the cache folder
+
+        # Every resource we know about along with its native size (read from the header only)
+        self.sourcePaths = dict()
+        self.sourceSizes = dict()
+        for fileName in sorted(os.listdir(self.RESOURCE_DIR)):
+            name, extension = os.path.splitext(fileName)
+            if extension.lower() == ".png":
+                self.sourcePaths[name] = os.path.join(self.RESOURCE_DIR, fileName)
+                self.sourceSizes[name] = readPngSize(self.sourcePaths[name])
+
+        # Simple vertical stacking is plenty for a handful of resources, and means every box is known up front
+        self.regions = dict()
+        curTop = 0
+        for name, (width, height) in self.sourceSizes.items():
+            self.regions[name] = (0, curTop, width, curTop + height)
+            curTop += height
+        self.atlasSize = (max((width for width, _ in self.sourceSizes.values()), default = 1), max(1, curTop))
+
+        # The PIL atlas is only built the first time something has to be converted, and the tk one the first
+        # time a native size image is asked for
+        self.atlas = None
+        self.tkAtlas = None
+
+        # Shared tk images keyed by (name, size)
+        self.nativeImages = dict()
+        self.scaledImages = weakref.WeakValueDictionary()
+
+        # And a little bookkeeping on how often the cache saved us a conversion
+        self.cacheHits = 0
+        self.cacheMisses = 0
+
+    def loadAtlas(self) -> None:
+        """ Decodes every resource once and stacks them on top of each other inside a single atlas image. """
+        self.atlas = Image.new("RGBA", self.atlasSize)
+        for name, srcPath in self.sourcePaths.items():
+            with Image.open(srcPath) as srcImage:
+                self.atlas.paste(srcImage.convert("RGBA"), self.regions[name][:2])
+
+    def getRegion(self, name: str) -> tuple[int, int, int, int]:
+        """ Returns the (left, top, right, bottom) box of a resource inside the atlas. """
+        if self.atlas is None:
+            self.loadAtlas()
+        return self.regions[name]
+
+    def getAtlasCachePath(self) -> str:
+        """ Returns where the atlas of the current resources lives in the cache. """
+        sourceStamps = ";".join("{}:{}:{}".format(name, os.stat(srcPath).st_mtime_ns, os.stat(srcPath).st_size)
+                                for name, srcPath in self.sourcePaths.items())
+        return os.path.join(self.CACHE_DIR, "_atlas_{:08x}.png".format(zlib.crc32(sourceStamps.encode())))
+
+    def getTkAtlas(self) -> tk.PhotoImage:
+        """ Returns the atlas as a tk image, writing it to the cache first if the resources changed since. """
+        if self.tkAtlas is None:
+            atlasPath = self.getAtlasCachePath()
+            if os.path.exists(atlasPath):
+                self.cacheHits += 1
+            else:
+                self.cacheMisses += 1
+                os.makedirs(self.CACHE_DIR, exist_ok = True)
+                if self.atlas is None:
+                    self.loadAtlas()
+                self.atlas.save(atlasPath + ".tmp", format = "PNG")
+                os.replace(atlasPath + ".tmp", atlasPath)
+                for stalePath in glob.glob(os.path.join(glob.escape(self.CACHE_DIR), "_atlas_*.png")):
+                    if stalePath != atlasPath:
+                        os.remove(stalePath)
+            self.tkAtlas = tk.PhotoImage(file = atlasPath)
+        return self.tkAtlas
+
+    def getSize(self, name: str) -> tuple[int, int]:
+        """ Returns the native (width, height) of a resource. """
+        return self.sourceSizes[name]
+
+    def getImage(self, name: str, size: tuple[int, int] = None) -> "Image.Image":
+        """ Materializes a resource (optionally resampled to the given size) as its own PIL image. """
+        region = self.getRegion(name)
+        if size is None or size == self.getSize(name):
+            return self.atlas.crop(region)
+        return self.atlas.resize(size, Image.Resampling.LANCZOS, box = region)
+
+    def fitSize(self, name: str, fitWidth: int) -> tuple[int, int]:
+        """ Returns the size of a resource once shrunk (never enlarged) to fit the given width, keeping its aspect. """
+        width, height = self.getSize(name)
+        if fitWidth >= width:
+            return (width, height)
+        return (max(1, fitWidth), max(1, round(height*fitWidth/width)))
+
+    def getCachePath(self, name: str, size: tuple[int, int]) -> str:
+        """ Returns where the converted image for the given resource and size lives in the cache. """
+        srcStat = os.stat(self.sourcePaths[name])
+        return os.path.join(self.CACHE_DIR, "{}_{}x{}_{:x}-{:x}.png".format(name, size[0], size[1], srcStat.st_mtime_ns, srcStat.st_size))
+
+    def convertToCache(self, name: str, size: tuple[int, int]) -> str:
+        """ Converts a resource to the given size, writes it to the cache and prunes the other entries for it. """
+        cachePath = self.getCachePath(name, size)
+        os.makedirs(self.CACHE_DIR, exist_ok = True)
+
+        # Write to a temporary name first so that a crash never leaves a half written entry behind
+        self.getImage(name, size).save(cachePath + ".tmp", format = "PNG")
+        os.replace(cachePath + ".tmp", cachePath)
+        self.pruneCache(name, cachePath)
+        return cachePath
+
+    def pruneCache(self, name: str, livePath: str) -> None:
+        """
+            Drops every cache entry of a resource that was made from an older version of it, and all but the
+            most recently used of the rest.
+        """
+        srcStamp = os.path.basename(livePath).rsplit("_", 1)[1]
+        entryPattern = os.path.join(glob.escape(self.CACHE_DIR), "{}_*x*_*.png".format(glob.escape(name)))
+        currentPaths = list()
+        for entryPath in glob.glob(entryPattern):
+            if entryPath == livePath:
+                continue
+            if os.path.basename(entryPath).rsplit("_", 1)[1] != srcStamp:
+                os.remove(entryPath)
+            else:
+                currentPaths.append(entryPath)
+
+        currentPaths.sort(key = os.path.getmtime, reverse = True)
+        for entryPath in currentPaths[max(0, self.CACHED_SIZES - 1):]:
+            os.remove(entryPath)
+
+    def getPhotoImage(self, name: str, *, fitWidth: int = None, persist: bool = True) -> tk.PhotoImage:
+        """
+            Returns the shared tk image for a resource, optionally shrunk to fit the given width. Every caller
+            asking for the same resource at the same size receives the very same image.
+
+            Scaled images are only written to the cache folder if persist is set. Anything else (e.g. the sizes a
+            window passes through while it is being resized) is converted in memory when the cache misses.
+        """
+        size = self.getSize(name) if fitWidth is None else self.fitSize(name, fitWidth)
+        cacheKey = (name, size)
+
+        # Native size images are copied by tk out of its atlas, once per resource
+        if size == self.getSize(name):
+            if cacheKey not in self.nativeImages:
+                tkAtlas = self.getTkAtlas()
+                photoImage = tk.PhotoImage(width = size[0], height = size[1])
+                photoImage.tk.call(photoImage, "copy", tkAtlas, "-from", *self.regions[name])
+                self.nativeImages[cacheKey] = photoImage
+            return self.nativeImages[cacheKey]
+
+        photoImage = self.scaledImages.get(cacheKey)
+        if photoImage is None:
+            cachePath = self.getCachePath(name, size)
+            if os.path.exists(cachePath):
+                self.cacheHits += 1
+                os.utime(cachePath)
+                photoImage = tk.PhotoImage(file = cachePath)
+            elif persist:
+                self.cacheMisses += 1
+                photoImage = tk.PhotoImage(file = self.convertToCache(name, size))
+            else:
+                self.cacheMisses += 1
+                photoImage = ImageTk.PhotoImage(self.getImage(name, size))
+            self.scaledImages[cacheKey] = photoImage
+        return photoImage
+
+    def getMemoryUsage(self) -> dict[str, int]:
+        """
+            Reports the decoded image memory (in bytes) held by the PIL atlas and by the tk images that are still
+            alive (the tk atlas included). Scaled images that no widget holds on to anymore are not counted.
+        """
+        atlasBytes = 0 if self.atlas is None else self.atlas.size[0]*self.atlas.size[1]*len(self.atlas.getbands())
+        liveImages = list(self.nativeImages.values()) + list(self.scaledImages.values())
+        if self.tkAtlas is not None:
+            liveImages.append(self.tkAtlas)
+        tkBytes = sum(photoImage.width()*photoImage.height()*4 for photoImage in liveImages)
+        return {"atlasBytes": atlasBytes,
+                "tkImageBytes": tkBytes,
+                "tkImages": len(liveImages),
+                "totalBytes": atlasBytes + tkBytes}
+
+_sharedManager = None
+
+def getAssetManager() -> AssetManager:
+    """ Returns the process-wide asset manager, creating it on first use. """
+    global _sharedManager
+    if _sharedManager is None:
+        _sharedManager = AssetManager()
+    return _sharedManager
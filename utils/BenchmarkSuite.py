@@ -0,0 +1,420 @@
+"""
+BenchmarkSuite.py
+
+A repeatable benchmark of the overlay's hot paths, meant to be run the same way on any (headless) Linux box:
+    - the timer ticks, both headless and on an overlay (updateTimer and render of every running timer per tick), for
+      every overlay layout with the timers shown both as text and as glyphs
+    - several overlays ticking side by side, each on an engine of its own or all on shared ones (with and without a
+      TimerBank), along with the memory building them took
+    - PhaseImageWidget.forceRender at several window widths
+    - building an overlay (setupGUI and all) and switching the theme of a built one
+    - device counter increments
+    - hotkey matching on a stream of fake keyboard input
+
+Every benchmark is timed over several repeats and the median and minimum time per operation are saved as json.
+Benchmarks that need tk windows also record how many Python -> Tcl calls an operation took.
+Given the json of an earlier run as a baseline, every benchmark that got slower than the threshold allows is reported
+as a regression and the run fails (exit code 1), so two runs can be compared by hand or in CI.
+
+Anything that needs tk windows runs on whatever display is set. On a box without one, --xvfb starts a private Xvfb
+server for the run (xvfb-run works just as well). Without any display those benchmarks are skipped, which is
+recorded in the results. Run it from the repository root:
+    python -m utils.BenchmarkSuite --xvfb --baseline logs/bench_previous.json
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+import tkinter as tk
+import tracemalloc
+from utils.FightState import FightSimulator, DEFAULT_INIT_TIMES, buildTimerArgs, startEveryTimer
+from utils.HotkeyDispatcher import HotkeyDispatcher, HotkeyBinding, FakeInputSource, FAKE_MODIFIER_SCAN_CODES, FAKE_HOTKEYS
+
+RESULTS_VERSION = 1
+
+# Window widths the phase image is rendered at, and how many overlays are run side by side
+PHASE_IMAGE_WIDTHS = [200, 400, 800]
+OVERLAY_COUNTS = [1, 4]
+
+# Every tkapp method that crosses into Tcl from the tkinter side
+TCL_ENTRY_POINTS = ["call", "eval", "setvar", "getvar", "globalsetvar", "globalgetvar", "createcommand", "deletecommand"]
+
+class TclCallCounter():
+    """
+        Stands in for the tkapp object of a root window and counts every call into Tcl. Widgets and variables
+        take their tkapp from their master, so everything created under the root after the swap goes through us.
+    """
+    def __init__(self, tkapp):
+        self.tkapp = tkapp
+        self.callCount = 0
+        for entryPoint in TCL_ENTRY_POINTS:
+            setattr(self, entryPoint, self.countCalls(getattr(tkapp, entryPoint)))
+
+    def countCalls(self, tclFunc: callable) -> callable:
+        def countedCall(*args):
+            self.callCount += 1
+            return tclFunc(*args)
+        return countedCall
+
+    def __getattr__(self, name: str):
+        # everything we do not count goes straight to the real tkapp
+        return getattr(self.tkapp, name)
+
+def countWidgets(widget: tk.Misc) -> int:
+    """ Counts every widget below (and including) the given one. """
+    return 1 + sum(countWidgets(child) for child in widget.winfo_children())
+
+def timeOperation(operation: callable, *, number: int, repeat: int, setup: callable = None, warmup: int = 3,
+                  callCounter: TclCallCounter = None) -> dict[str, float]:
+    """
+        Runs the operation `number` times in each of `repeat` repeats (calling setup, untimed, before each repeat)
+        and reports the minimum and median time per call in microseconds. The first `warmup` repeats are thrown
+        away, so caches (and the CPU clock) have settled by the time we measure. Like timeit, the garbage
+        collector is held off while timing.
+
+        Given a TclCallCounter, the mean number of Tcl calls per operation over the measured repeats is reported
+        as well.
+    """
+    repeatTimes = list()
+    tclCalls = 0
+    gcWasEnabled = gc.isenabled()
+    try:
+        for repeatInd in range(warmup + repeat):
+            if setup is not None:
+                setup()
+            callsBefore = callCounter.callCount if callCounter is not None else 0
+            gc.disable()
+            startTime = time.perf_counter()
+            for _ in range(number):
+                operation()
+            repeatTimes.append((time.perf_counter() - startTime)/number*1e6)
+            if gcWasEnabled:
+                gc.enable()
+            if callCounter is not None and repeatInd >= warmup:
+                tclCalls += callCounter.callCount - callsBefore
+    finally:
+        if gcWasEnabled:
+            gc.enable()
+    repeatTimes = repeatTimes[warmup:]
+    results = {"number": number, "repeat": repeat, "minUs": min(repeatTimes), "medianUs": statistics.median(repeatTimes)}
+    if callCounter is not None:
+        results["tclCalls"] = tclCalls/(number*repeat)
+    return results
+
+########################## HEADLESS BENCHMARKS ###########################
+def benchFightTicks() -> dict[str, dict]:
+    """ One tick of every running timer (updateTimer and the state side of render) on a headless engine. """
+    simulator = None
+    def newFight():
+        nonlocal simulator
+        simulator = FightSimulator(buildTimerArgs(DEFAULT_INIT_TIMES))
+        startEveryTimer(simulator.fight)
+
+    def tick():
+        simulator.clock.advance(1.0)
+        simulator.engine.runPass()
+
+    # Only as many ticks per repeat as the shortest timer runs, so every repeat ticks the same timers
+    return {"fight.tick": timeOperation(tick, number = 10, repeat = 500, setup = newFight)}
+
+def benchHotkeyMatching() -> dict[str, dict]:
+    """ Matching of every event of a fake input stream against a full set of hotkeys. """
+    dispatcher = HotkeyDispatcher(modifierScanCodes = FAKE_MODIFIER_SCAN_CODES)
+    for modMask, scanCode in FAKE_HOTKEYS:
+        dispatcher.bindScanCode(modMask, scanCode, HotkeyBinding(lambda : None))
+    events = FakeInputSource(FAKE_HOTKEYS).generate(20000)
+    eventIter = iter(())
+
+    def restartInput():
+        nonlocal eventIter
+        dispatcher.resetHeld()
+        eventIter = iter(events)
+
+    processEvent = dispatcher.processEvent
+    return {"hotkey.match": timeOperation(lambda : processEvent(next(eventIter)), number = len(events), repeat = 20,
+                                          setup = restartInput)}
+
+HEADLESS_BENCHMARKS = [benchFightTicks, benchHotkeyMatching]
+
+########################## DISPLAY BENCHMARKS ###########################
+# Every display benchmark is handed the root of the run, whose tkapp is a TclCallCounter (see runSuite)
+def benchOverlayTicks(root: tk.Tk) -> dict[str, dict]:
+    """
+        One tick of every running timer on an overlay, including the render and redraw, for every layout and
+        timer display (the text display keeps the plain layout name).
+    """
+    from KalosTimer import Overlay, OVERLAY_LAYOUTS, TIMER_DISPLAYS
+    from utils.FightState import VirtualClock
+
+    results = dict()
+    for layout in OVERLAY_LAYOUTS:
+        for timerDisplay in TIMER_DISPLAYS:
+            benchSuffix = layout if timerDisplay == "text" else "{}.{}".format(layout, timerDisplay)
+            overlay = Overlay(buildTimerArgs(DEFAULT_INIT_TIMES), root, layout = layout, timerDisplay = timerDisplay)
+            clock = overlay.tickEngine.clock = VirtualClock(time.monotonic())
+            def tick():
+                clock.advance(1.0)
+                overlay.tickEngine.runPass()
+                root.update_idletasks()
+            def restartTimers():
+                startEveryTimer(overlay)
+                root.update_idletasks()
+
+            root.update()
+            tickResults = timeOperation(tick, number = 10, repeat = 50, setup = restartTimers, callCounter = root.tk)
+            tickResults["widgets"] = countWidgets(overlay)
+            tickResults["canvasItems"] = len(overlay.canvas.find_all()) if layout == "canvas" else 0
+            results["overlay.tick.{}".format(benchSuffix)] = tickResults
+
+            # and a render of every timer on its own, without any ticking
+            timers = list(overlay.timObjs.values())
+            def renderTimers():
+                for timer in timers:
+                    timer.render()
+                overlay.renderer.flush()
+                root.update_idletasks()
+            results["timer.render.{}".format(benchSuffix)] = timeOperation(renderTimers, number = 20, repeat = 20, callCounter = root.tk)
+            overlay.destroy()
+    return results
+
+def benchOverlayScaling(root: tk.Tk) -> dict[str, dict]:
+    """
+        One tick of every running timer on several overlays at once, with each overlay on an engine and renderer
+        of its own or all of them on shared ones (the way App runs them), optionally with a TimerBank. The memory
+        allocated while building the overlays is recorded along with it.
+    """
+    from KalosTimer import Overlay
+    from utils.FightState import VirtualClock
+    from utils.TickEngine import TickEngine
+    from utils.RenderCoalescer import RenderCoalescer
+    from utils.TimerBank import TimerBank
+
+    results = dict()
+    for overlayCount in OVERLAY_COUNTS:
+        for sharing in ["separate", "shared", "shared+bank"]:
+            clock = VirtualClock(time.monotonic())
+            sharedArgs = dict()
+            if sharing != "separate":
+                sharedArgs = {"engine": TickEngine(root, clock = clock), "renderer": RenderCoalescer(root)}
+                if sharing == "shared+bank":
+                    sharedArgs["bank"] = TimerBank(sharedArgs["engine"])
+
+            tracemalloc.start()
+            overlays = [Overlay(buildTimerArgs(DEFAULT_INIT_TIMES), root, **sharedArgs) for _ in range(overlayCount)]
+            root.update()
+            buildMemory = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+
+            engines = [sharedArgs["engine"]] if sharedArgs else [overlay.tickEngine for overlay in overlays]
+            for engine in engines:
+                engine.clock = clock
+            def tick():
+                clock.advance(1.0)
+                for engine in engines:
+                    engine.runPass()
+                root.update_idletasks()
+            def restartTimers():
+                for overlay in overlays:
+                    startEveryTimer(overlay)
+                root.update_idletasks()
+
+            scalingResults = timeOperation(tick, number = 10, repeat = 20, setup = restartTimers, callCounter = root.tk)
+            scalingResults["buildKiB"] = buildMemory/1024
+            results["overlays.tick.{}.{}".format(overlayCount, sharing)] = scalingResults
+            for overlay in overlays:
+                overlay.destroy()
+            for engine in engines:
+                engine.stop()
+    return results
+
+def benchPhaseImage(root: tk.Tk) -> dict[str, dict]:
+    """ Re-rendering the phase image (from the scaled image cache) at several window widths. """
+    from KalosTimer import Overlay
+
+    results = dict()
+    overlay = Overlay(buildTimerArgs(DEFAULT_INIT_TIMES), root)
+    root.update()
+    for width in PHASE_IMAGE_WIDTHS:
+        overlay.kalosImgObj.rescale(width)
+        root.update_idletasks()
+        def forceRender():
+            overlay.kalosImgObj.forceRender()
+            root.update_idletasks()
+        results["phaseImage.forceRender.{}".format(width)] = timeOperation(forceRender, number = 50, repeat = 10, callCounter = root.tk)
+    overlay.destroy()
+    return results
+
+def walkColors(container: tk.Misc, color: str) -> None:
+    """ Recolors a window the way the overlay used to before themes (kept around to compare against). """
+    container.config(bg = color)
+    for child in container.winfo_children():
+        if child.winfo_children():
+            walkColors(child, color)
+        elif type(child) is tk.Label:
+            child.config(bg = color)
+
+def benchOverlayConstruction(root: tk.Tk) -> dict[str, dict]:
+    """ Building (and tearing down) a whole overlay, and switching the theme of one (against the old walk). """
+    from KalosTimer import Overlay
+    from utils.Theme import Theme, getThemeManager
+
+    def buildOverlay():
+        overlay = Overlay(buildTimerArgs(DEFAULT_INIT_TIMES), root)
+        root.update_idletasks()
+        overlay.destroy()
+    results = {"overlay.construct": timeOperation(buildOverlay, number = 5, repeat = 5, callCounter = root.tk)}
+
+    overlay = Overlay(buildTimerArgs(DEFAULT_INIT_TIMES), root)
+    root.update_idletasks()
+    themeManager = getThemeManager(root)
+    themes = iter(())
+    def setTheme():
+        themeManager.setTheme(next(themes))
+        root.update_idletasks()
+    def restartThemes():
+        nonlocal themes
+        themes = iter([Theme(background = "#aaaaaa"), Theme(background = "#999999")]*20)
+    results["theme.set"] = timeOperation(setTheme, number = 40, repeat = 10, setup = restartThemes, callCounter = root.tk)
+
+    colors = iter(())
+    def walkOverlay():
+        walkColors(overlay, next(colors))
+        root.update_idletasks()
+    def restartColors():
+        nonlocal colors
+        colors = iter(["#aaaaaa", "#999999"]*20)
+    results["theme.walk"] = timeOperation(walkOverlay, number = 40, repeat = 10, setup = restartColors, callCounter = root.tk)
+    overlay.destroy()
+    return results
+
+def benchDeviceCounter(root: tk.Tk) -> dict[str, dict]:
+    """ A single device increment (or decrement, to stay within the four dots) along with its redraw. """
+    from KalosTimer import Overlay
+
+    overlay = Overlay(buildTimerArgs(DEFAULT_INIT_TIMES), root)
+    root.update()
+    deviceCounter = overlay.dotImgObj
+    steps = iter(())
+    def stepDevices():
+        next(steps)()
+        root.update_idletasks()
+    def restartSteps():
+        nonlocal steps
+        steps = iter(([deviceCounter.incrementDevices]*4 + [deviceCounter.decrementDevices]*4)*10)
+    results = {"deviceCounter.step": timeOperation(stepDevices, number = 80, repeat = 10, setup = restartSteps, callCounter = root.tk)}
+    overlay.destroy()
+    return results
+
+DISPLAY_BENCHMARKS = [benchOverlayTicks, benchOverlayScaling, benchPhaseImage, benchOverlayConstruction, benchDeviceCounter]
+
+########################## RUNNING AND COMPARING ###########################
+def startVirtualDisplay() -> subprocess.Popen | None:
+    """ Starts a private Xvfb server (if there is no display yet) and points DISPLAY at it. """
+    if os.environ.get("DISPLAY") or shutil.which("Xvfb") is None:
+        return None
+
+    # -displayfd has the server pick a free display number and tell us which one it got
+    readFd, writeFd = os.pipe()
+    xvfb = subprocess.Popen(["Xvfb", "-displayfd", str(writeFd), "-screen", "0", "1280x1024x24", "-nolisten", "tcp"],
+                            pass_fds = [writeFd], stderr = subprocess.DEVNULL)
+    os.close(writeFd)
+    with os.fdopen(readFd) as displayPipe:
+        displayNum = displayPipe.readline().strip()
+    if not displayNum:
+        xvfb.terminate()
+        return None
+    os.environ["DISPLAY"] = ":" + displayNum
+    return xvfb
+
+def runSuite(*, nameFilter: str = None) -> dict:
+    """ Runs every benchmark (whose name contains the filter) and returns the results, ready to be saved as json. """
+    results = dict()
+    skipped = list()
+    for benchFunc in HEADLESS_BENCHMARKS:
+        results.update(benchFunc())
+
+    try:
+        root = tk.Tk()
+    except tk.TclError:
+        root = None
+        skipped = [benchFunc.__name__ for benchFunc in DISPLAY_BENCHMARKS]
+    if root is not None:
+        root.withdraw()
+
+        # Every window of the run is created under the root, so swapping its tkapp counts all of their Tcl calls
+        root.tk = TclCallCounter(root.tk)
+        try:
+            for benchFunc in DISPLAY_BENCHMARKS:
+                results.update(benchFunc(root))
+        finally:
+            root.destroy()
+
+    if nameFilter is not None:
+        results = {benchName:result for benchName, result in results.items() if nameFilter in benchName}
+    return {"version": RESULTS_VERSION,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "tk": tk.TkVersion,
+            "skipped": skipped,
+            "results": results}
+
+def compareResults(baseline: dict, current: dict, threshold: float) -> list[tuple[str, float, float, bool]]:
+    """
+        Compares the median times of every benchmark found in both runs (the minimum of many short repeats is
+        far too easily a lucky one). Returns (name, baseline us, current us, regressed) for each, where regressed
+        means it got slower by more than the threshold (0.2 is 20%).
+    """
+    comparison = list()
+    for benchName, curResult in sorted(current["results"].items()):
+        baseResult = baseline["results"].get(benchName)
+        if baseResult is None:
+            continue
+        comparison.append((benchName, baseResult["medianUs"], curResult["medianUs"],
+                           curResult["medianUs"] > baseResult["medianUs"]*(1 + threshold)))
+    return comparison
+
+# benchmark
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Benchmarks the timer, render, image and hotkey hot paths.")
+    parser.add_argument("--output", default = None, help = "json file to save the results to (default: ./logs/bench_<time>.json)")
+    parser.add_argument("--baseline", default = None, help = "json results of an earlier run to compare against")
+    parser.add_argument("--threshold", type = float, default = 0.2, help = "slowdown that counts as a regression (default: 0.2 = 20%%)")
+    parser.add_argument("--filter", default = None, help = "only keep the benchmarks whose name contains this")
+    parser.add_argument("--xvfb", action = "store_true", help = "start a private Xvfb server if there is no display")
+    cliArgs = parser.parse_args()
+
+    xvfb = startVirtualDisplay() if cliArgs.xvfb else None
+    try:
+        suiteResults = runSuite(nameFilter = cliArgs.filter)
+    finally:
+        if xvfb is not None:
+            xvfb.terminate()
+
+    outputPath = cliArgs.output or "./logs/bench_{}.json".format(time.strftime("%Y%m%d-%H%M%S"))
+    if os.path.dirname(outputPath):
+        os.makedirs(os.path.dirname(outputPath), exist_ok = True)
+    with open(outputPath, "w") as outputFile:
+        json.dump(suiteResults, outputFile, indent = 1)
+
+    for benchName, result in suiteResults["results"].items():
+        tclCalls = "" if "tclCalls" not in result else ", {:.1f} Tcl calls".format(result["tclCalls"])
+        print("{:<32}{:>12.2f} us (min {:.2f} us{})".format(benchName, result["medianUs"], result["minUs"], tclCalls))
+    for benchName in suiteResults["skipped"]:
+        print("{:<32}{:>12}".format(benchName, "skipped (no display)"))
+    print("Results written to {}".format(outputPath))
+
+    if cliArgs.baseline is not None:
+        with open(cliArgs.baseline, "r") as baselineFile:
+            comparison = compareResults(json.load(baselineFile), suiteResults, cliArgs.threshold)
+        for benchName, baseUs, curUs, regressed in comparison:
+            print("{:<32}{:>12.2f} -> {:>10.2f} us ({:+.0%}){}".format(benchName, baseUs, curUs, curUs/baseUs - 1,
+                                                                      "  REGRESSION" if regressed else ""))
+        if any(regressed for *_, regressed in comparison):
+            sys.exit(1)
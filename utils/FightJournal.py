@@ -0,0 +1,177 @@
+"""
+FightJournal.py
+
+An append-only record of everything that happened during a fight: hotkey actions, timer resets, zero crossings,
+phase check time, device changes and phase changes. Recording has to be cheap enough to sit inside the tick and
+hotkey paths, so events are packed into a preallocated ring buffer and a background thread writes them out to
+disk in compact binary batches.
+
+File layout: the FILE_MAGIC header followed by batches. Each batch is a little-endian uint32 record count followed
+by that many RECORD_FORMAT records of (monotonic ns, event code, subject, value).
+"""
+import glob
+import os
+import struct
+import threading
+import time
+
+# Event codes. The subject of timer events is the timer's index in FightState.TIMER_NAMES, the subject of action
+# events is the action's index in FightState.ACTION_NAMES and the value depends on the event (usually a time).
+EVENT_ACTION = 1
+EVENT_RESET = 2
+EVENT_ZERO = 3
+EVENT_AUTO_RESET = 4
+EVENT_ADD_TIME = 5
+EVENT_APPLY_EXTRA = 6
+EVENT_REMOVE_EXTRA = 7
+EVENT_DEVICE_ADD = 8
+EVENT_DEVICE_REMOVE = 9
+EVENT_PHASE = 10
+EVENT_WARNING_ON = 11
+EVENT_WARNING_OFF = 12
+EVENT_NAMES = {EVENT_ACTION: "action", EVENT_RESET: "reset", EVENT_ZERO: "zero", EVENT_AUTO_RESET: "autoReset",
+               EVENT_ADD_TIME: "addTime", EVENT_APPLY_EXTRA: "applyExtra", EVENT_REMOVE_EXTRA: "removeExtra",
+               EVENT_DEVICE_ADD: "deviceAdd", EVENT_DEVICE_REMOVE: "deviceRemove", EVENT_PHASE: "phase",
+               EVENT_WARNING_ON: "warningOn", EVENT_WARNING_OFF: "warningOff"}
+
+FILE_MAGIC = b"KJNL\x01"
+RECORD_FORMAT = struct.Struct("<QBBi")
+BATCH_HEADER = struct.Struct("<I")
+
+class FightJournal():
+    """
+        Records fight events into a ring buffer of fixed size and flushes them from a background thread.
+
+        There is a single producer (the tk loop) and a single consumer (the flush thread). The producer only ever
+        writes the slot at its own write count and then bumps it, and the consumer only reads slots below that
+        count, so neither side ever takes a lock. If the consumer falls a whole buffer behind, the oldest events are
+        overwritten and counted as dropped.
+    """
+    def __init__(self, journalPath: str, *, capacity: int = 8192, flushInterval: float = 0.5):
+        self.JOURNAL_PATH = journalPath
+        self.CAPACITY = capacity
+        self.FLUSH_INTERVAL = flushInterval
+
+        # The preallocated ring buffer along with how many records were written to/read from it
+        self.buffer = bytearray(capacity*RECORD_FORMAT.size)
+        self.writeCount = 0
+        self.readCount = 0
+        self.droppedCount = 0
+
+        # Everything needed for the background flushing
+        self.journalFile = None
+        self.flushThread = None
+        self.stopEvent = threading.Event()
+
+    def record(self, eventCode: int, subject: int = 0, value: int = 0) -> None:
+        """ Records a single event. Never blocks and never touches the disk. """
+        RECORD_FORMAT.pack_into(self.buffer, (self.writeCount % self.CAPACITY)*RECORD_FORMAT.size,
+                                time.monotonic_ns(), eventCode, subject, value)
+        self.writeCount += 1
+
+    def start(self) -> None:
+        """ Opens the journal file and starts the flush thread. """
+        if self.flushThread is not None:
+            return
+
+        journalDir = os.path.dirname(self.JOURNAL_PATH)
+        if journalDir:
+            os.makedirs(journalDir, exist_ok = True)
+        self.journalFile = open(self.JOURNAL_PATH, "ab")
+        if self.journalFile.tell() == 0:
+            self.journalFile.write(FILE_MAGIC)
+
+        self.stopEvent.clear()
+        self.flushThread = threading.Thread(target = self.flushLoop, name = "FightJournal", daemon = True)
+        self.flushThread.start()
+
+    def close(self) -> None:
+        """ Stops the flush thread, writes out anything left in the buffer and closes the file. """
+        if self.flushThread is None:
+            return
+
+        self.stopEvent.set()
+        self.flushThread.join()
+        self.flushThread = None
+        self.flush()
+        self.journalFile.close()
+        self.journalFile = None
+
+    def flushLoop(self) -> None:
+        """ Body of the flush thread. """
+        while not self.stopEvent.wait(self.FLUSH_INTERVAL):
+            self.flush()
+
+    def flush(self) -> None:
+        """ Writes every record that has not been written yet as a single batch. """
+        writeCount = self.writeCount
+        if writeCount == self.readCount:
+            return
+
+        # If we fell an entire buffer behind, the oldest records have been overwritten already
+        if writeCount - self.readCount > self.CAPACITY:
+            self.droppedCount += writeCount - self.readCount - self.CAPACITY
+            self.readCount = writeCount - self.CAPACITY
+
+        # Copy the records out in at most two slices (the ring may wrap around)
+        startSlot = self.readCount % self.CAPACITY
+        recordCount = writeCount - self.readCount
+        endSlot = startSlot + recordCount
+        if endSlot <= self.CAPACITY:
+            batch = self.buffer[startSlot*RECORD_FORMAT.size:endSlot*RECORD_FORMAT.size]
+        else:
+            batch = self.buffer[startSlot*RECORD_FORMAT.size:] + self.buffer[:(endSlot - self.CAPACITY)*RECORD_FORMAT.size]
+        self.readCount = writeCount
+
+        self.journalFile.write(BATCH_HEADER.pack(recordCount))
+        self.journalFile.write(batch)
+        self.journalFile.flush()
+
+    def getStats(self) -> dict[str, int]:
+        return {"recorded": self.writeCount,
+                "flushed": self.readCount,
+                "pending": self.writeCount - self.readCount,
+                "dropped": self.droppedCount}
+
+    def measureOverhead(self, eventCount: int = 100000) -> float:
+        """ Returns the average cost of a single record call in microseconds. """
+        startTime = time.perf_counter()
+        for eventInd in range(eventCount):
+            self.record(EVENT_ACTION, 0, eventInd)
+        return (time.perf_counter() - startTime)/eventCount*1e6
+
+def readJournal(journalPath: str):
+    """ Yields every (monotonic ns, event code, subject, value) record stored in a journal file. """
+    with open(journalPath, "rb") as journalFile:
+        if journalFile.read(len(FILE_MAGIC)) != FILE_MAGIC:
+            raise ValueError("{} is not a fight journal".format(journalPath))
+
+        while True:
+            header = journalFile.read(BATCH_HEADER.size)
+            if len(header) < BATCH_HEADER.size:
+                return
+            recordCount, = BATCH_HEADER.unpack(header)
+            yield from RECORD_FORMAT.iter_unpack(journalFile.read(recordCount*RECORD_FORMAT.size))
+
+def pruneJournals(journalDir: str, *, keepCount: int = 20, maxBytes: int = 50*1024*1024) -> list[str]:
+    """
+        Deletes the oldest fight journals in a folder until at most keepCount of them (taking up at most maxBytes
+        together) are left. Returns the paths of the journals that were deleted.
+    """
+    journalPaths = sorted(glob.glob(os.path.join(glob.escape(journalDir), "fight_*.kjl")), key = os.path.getmtime, reverse = True)
+    keptBytes = 0
+    prunedPaths = list()
+    for journalInd, journalPath in enumerate(journalPaths):
+        keptBytes += os.path.getsize(journalPath)
+        if journalInd >= keepCount or keptBytes > maxBytes:
+            os.remove(journalPath)
+            prunedPaths.append(journalPath)
+    return prunedPaths
+
+# smoke test
+if __name__ == "__main__":
+    journal = FightJournal("./logs/journal_smoke_test.kjl")
+    journal.start()
+    print("Average record overhead: {:.3f} us".format(journal.measureOverhead()))
+    journal.close()
+    print(journal.getStats())
@@ -0,0 +1,747 @@
+"""
+FightState.py
+
+The fight itself without any tk attached to it. Every countdown, auto-reset, warning swap, phase lock and device
+count lives in here, so the whole fight can run without a display. Time is read from whatever clock the tick engine
+was given, which means a VirtualClock lets entire fights be simulated in a fraction of a second.
+
+The tk overlay is simply a view on top of these objects (see WidgetContainers.py).
+"""
+import math
+import random
+import time
+from utils.TickEngine import TickEngine
+from utils.FightJournal import (EVENT_ACTION, EVENT_RESET, EVENT_ZERO, EVENT_AUTO_RESET, EVENT_ADD_TIME, EVENT_APPLY_EXTRA,
+                                EVENT_REMOVE_EXTRA, EVENT_DEVICE_ADD, EVENT_DEVICE_REMOVE, EVENT_PHASE, EVENT_WARNING_ON,
+                                EVENT_WARNING_OFF)
+
+# Every timer known to the overlay, along with the defaults that are not exposed in the settings window
+TIMER_NAMES = ["device", "laser", "arrow", "fma", "breath", "bomb", "dive"]
+DEFAULT_INIT_TIMES = {"device": [60],
+                      "laser": [15],
+                      "arrow": [15],
+                      "fma": [150],
+                      "breath": [60, 45, 20, 20],
+                      "bomb": [10],
+                      "dive": [20]}
+DEFAULT_RED_TIMES = {"device": 10,
+                     "laser": 5,
+                     "arrow": 5,
+                     "fma": 20,
+                     "breath": 5,
+                     "bomb": 5,
+                     "dive": 5}
+DEFAULT_AUTO_RESETS = {"device": True,
+                       "laser": True,
+                       "arrow": True,
+                       "bomb": True}
+
+# Every hotkey action the fight knows about (see FightState.actionFor); journal entries refer to them by index
+ACTION_NAMES = ["Start Timers", "Begin Check", "Fail Check", "10s Bind", "15s Bind", "Clear Device", "Reset Breath",
+                "Reset Dive", "Reset Laser", "Reset Arrows", "Reset Bombs", "Reset FMA", "Add Device"]
+
+# Minimum time (in seconds) between two presses of an action's hotkey. Actions that stack (binds, device and phase
+# changes) should not fire twice off a single sloppy press
+DEFAULT_ACTION_COOLDOWNS = {"10s Bind": 0.5,
+                            "15s Bind": 0.5,
+                            "Clear Device": 0.25,
+                            "Add Device": 0.25,
+                            "Begin Check": 1.0,
+                            "Fail Check": 1.0}
+
+# Actions where running twice in a row is no different from running once, so repeats can be coalesced
+COALESCED_ACTIONS = {"Start Timers", "Reset Breath", "Reset Dive", "Reset Laser", "Reset Arrows", "Reset Bombs", "Reset FMA"}
+
+def buildTimerArgs(initTimes: dict[str, list[int]], redTimes: dict[str, int] = DEFAULT_RED_TIMES,
+                   autoResets: dict[str, bool] = DEFAULT_AUTO_RESETS) -> dict:
+    """
+        Packages the initial times of every timer with their red times and auto-reset flags into the full
+        argument sequence that is expected by FightState.
+    """
+    return {argName:{"initTime": initTimes[argName],
+                     "redTime": redTimes[argName],
+                     "autoReset": autoResets.get(argName, False)} for argName in TIMER_NAMES}
+
+class VirtualClock():
+    """
+        A clock that only moves when it is told to. Passing one to a TickEngine allows fights to be simulated
+        at whatever speed the machine can run them.
+    """
+    def __init__(self, startTime: float = 0.0):
+        self.now = startTime
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float) -> None:
+        """ Moves the clock forward by the given number of seconds. """
+        self.now += seconds
+
+class TimerState():
+    """
+        The state behind a single countdown. This holds everything that used to live in the timer widget
+        except for the widget itself; views attach through associateRenderCallback.
+
+        This method can take into account multiple times, but in order to do so will need to be provided a
+        function that takes in no arguments and returns the appropriate indexer at any given moment.
+    """
+    def __init__(self, initTime: list[int], redTime: int, autoReset: bool, indSelector: callable, engine: TickEngine,
+                 *, journal: "FightJournal" = None, journalId: int = 0):
+        # Save our values which will be used for the timer processes
+        self.initTime = initTime
+        self.redTime = redTime
+        self.autoReset = autoReset
+        self.indSelector = indSelector
+
+        # Our warning timer allows us to count down from 60s while maintaining the current timer underneath
+        self.isWarning = False
+        self.warningTime = 60
+
+        # Ticks are scheduled against absolute deadlines (in the engine's clock) rather than chained 1s delays,
+        # so callback run time and Tcl lateness never accumulate into the countdown
+        self.engine = engine
+        self.nextDeadline = None
+        self.tickCount = 0
+        self.lastLateness = 0.0
+        self.maxLateness = 0.0
+        self.totalLateness = 0.0
+        self.earlyTicks = 0
+        self.runStart = None
+        self.driftStart = math.nan
+        self.driftStartLateness = 0.0
+
+        # We can associate callbacks outisde of here since we are constantly updating values
+        self.zeroCallback = None
+        self.calledFlag = False
+        self.renderCallback = None
+
+        # Every transition is recorded to the journal (if any) under our journal id
+        self.journal = journal
+        self.journalId = journalId
+
+        # And use this to be able to check whether the timer is currently running
+        self.intTimer = 0
+        self.prevTimer = -1
+        self.timerLock = False      # used to prevent addTime from being added while memorizing old timer
+        self.isRunning = False
+
+        # And some class constants to be used later
+        self.TICK_PERIOD = 1.0
+        self.DRIFT_WINDOW = 600.0 # s of ticking before a drift rate is worth reporting
+
+        # Only register once we are fully set up since the engine may inspect our deadline
+        self.engine.register(self)
+
+    def resetTimer(self) -> None:
+        """
+            Starts the timer if it is not already running, and, if it is, simply resets it.
+        """
+        self.restartTimer(self.engine.clock())
+
+    def restartTimer(self, anchor: float) -> None:
+        """
+            Resets the timer so that its next tick lands exactly one period after the given monotonic
+            anchor. Auto-resets anchor on the tick deadline itself so they never lose time.
+        """
+        # if a process is already under way, we need to remove it so that the timer
+        # properly counts the next second
+        self.cancelTick()
+
+        # reset time (and re-arm the zero callback for the new countdown)
+        self.intTimer = self.initTime[self.indSelector()]
+        self.calledFlag = False
+        self.render()
+        if self.journal is not None:
+            self.journal.record(EVENT_RESET, self.journalId, self.intTimer)
+
+        # and make sure the timer is running from the new anchor
+        self.isRunning = True
+        if self.runStart is None:
+            self.runStart = anchor
+        self.scheduleTick(anchor + self.TICK_PERIOD)
+
+    def updateTimer(self, now: float) -> bool:
+        """
+            Decrements the timer time by 1 second for every deadline that has passed by `now`, so a late
+            pass catches up instead of falling behind. Rendering is left to the tick engine so that every
+            timer can be redrawn in one batch. Returns whether any tick was processed.
+        """
+        deadline = self.nextDeadline
+        if deadline is None or deadline > now:
+            return False
+
+        # The engine ticks deadlines that are a few ms away along with the due ones. Those are not late at all,
+        # so they are counted on their own rather than as negative lateness
+        lateness = self.engine.clock() - deadline
+        if lateness < 0:
+            self.earlyTicks += 1
+            lateness = 0.0
+        self.lastLateness = lateness
+        self.maxLateness = max(self.maxLateness, lateness)
+        self.totalLateness += lateness
+        if math.isnan(self.driftStart):
+            self.driftStart = deadline
+            self.driftStartLateness = lateness
+
+        while deadline is not None and deadline <= now:
+            deadline = self.tick(deadline)
+
+        # The engine picks our new deadline up once the pass is over
+        self.nextDeadline = deadline
+        return True
+
+    def tick(self, deadline: float) -> float | None:
+        """
+            Performs a single one second step of the timer that was due at the given deadline. Returns
+            the deadline of the following tick or None if the timer has stopped.
+        """
+        self.tickCount += 1
+
+        # Reset if at 0 and auto-reset is enabled
+        if self.intTimer == 0:
+            nextDeadline = None
+            if self.autoReset:
+                self.intTimer = self.initTime[self.indSelector()]
+                self.calledFlag = False
+                nextDeadline = deadline + self.TICK_PERIOD
+                if self.journal is not None:
+                    self.journal.record(EVENT_AUTO_RESET, self.journalId, self.intTimer)
+            else:
+                self.isRunning = False
+
+            # run our zero callback only once
+            if not self.calledFlag and self.zeroCallback:
+                self.zeroCallback()
+                self.calledFlag = True
+
+            return nextDeadline
+
+        # Otherwise simply decrement and change the label as necessary
+        if self.isWarning:
+            self.warningTime -= 1
+            if self.intTimer > 60:
+                self.intTimer -= 1
+        else:
+            self.intTimer -= 1
+
+        if self.intTimer == 0 and self.journal is not None:
+            self.journal.record(EVENT_ZERO, self.journalId)
+
+        # If previous time is no longer relevant, then remove the timer lock
+        if self.timerLock and self.intTimer <= self.prevTimer:
+            self.prevTimer = -1
+            self.timerLock = False
+
+        return deadline + self.TICK_PERIOD
+
+    def scheduleTick(self, deadline: float) -> None:
+        """ Sets the absolute deadline of our next tick and lets the engine know about it. """
+        self.nextDeadline = deadline
+        self.engine.reschedule(self)
+
+    def cancelTick(self) -> None:
+        """ Cancels the pending tick (if there is one). """
+        self.nextDeadline = None
+
+    def ensureTicking(self) -> None:
+        """ Starts ticking a full period from now if no tick is pending. Pending ticks keep their deadline
+            so any partially elapsed second is preserved. """
+        if self.nextDeadline is None:
+            now = self.engine.clock()
+            if self.runStart is None:
+                self.runStart = now
+            self.scheduleTick(now + self.TICK_PERIOD)
+
+    def detach(self) -> None:
+        """ Stops the timer for good and takes it off the engine (used when the engine outlives the fight). """
+        self.cancelTick()
+        self.engine.unregister(self)
+
+    def getDriftStats(self) -> dict[str, float | None]:
+        """
+            Reports how far the timer has slipped from its ideal tick grid. Every tick is computed from an
+            absolute deadline, so lateness never builds up from one tick to the next and the timer is only ever
+            behind the grid by the lateness of its latest tick (gridOffset), however long it has been running
+            (elapsed). totalLateness adds up the lateness of every pass the timer was ticked in, and earlyTicks
+            counts the passes that ticked it slightly ahead of its deadline (see TickEngine).
+
+            driftPerHour is how much the grid offset has grown since the first tick, per hour. A single late
+            tick says nothing about a rate, so it stays None until the timer has ticked for DRIFT_WINDOW seconds.
+        """
+        now = self.engine.clock()
+        driftWindow = now - self.driftStart
+        driftPerHour = None
+        if driftWindow >= self.DRIFT_WINDOW:
+            driftPerHour = (self.lastLateness - self.driftStartLateness)*3600/driftWindow
+        return {"ticks": self.tickCount,
+                "gridOffset": self.lastLateness,
+                "elapsed": 0.0 if self.runStart is None else now - self.runStart,
+                "maxLateness": self.maxLateness,
+                "totalLateness": self.totalLateness,
+                "earlyTicks": self.earlyTicks,
+                "driftPerHour": driftPerHour}
+
+    def addTime(self, addTime: int) -> None:
+        """
+            Adds time to the timer. Does not memorize previous state like the
+            apply/remove functions do.
+        """
+        # avoid writing when timer is locked
+        if self.timerLock:
+            return
+
+        # Then just add the time and continue
+        self.intTimer += addTime
+        self.render()
+        if self.journal is not None:
+            self.journal.record(EVENT_ADD_TIME, self.journalId, addTime)
+        self.ensureTicking()
+
+    def associateZeroTimerCallback(self, callback: callable, *args, **kwargs) -> None:
+        """
+            Allow a timer to have a certain callback executed the moment the timer reaches 0.
+        """
+        self.zeroCallback = lambda : callback(*args, **kwargs)
+
+    def render(self) -> None:
+        """ Lets whatever view is attached to this timer know that it should redraw. """
+        if self.renderCallback is not None:
+            self.renderCallback()
+
+    def associateRenderCallback(self, callback: callable) -> None:
+        """ Attaches a view to the timer. The callback is run every time the displayed value may have changed. """
+        self.renderCallback = callback
+
+    def isRed(self) -> bool:
+        """ Whether the timer should currently be presented in the warning color. """
+        return self.intTimer <= self.redTime or self.isWarning
+
+    def getDisplayTime(self) -> int:
+        """ The number of seconds that should currently be presented to the user. """
+        return self.warningTime if self.isWarning else self.intTimer
+
+    def isLocked(self) -> bool:
+        return self.timerLock
+    
+    def swapToWarning(self) -> None:
+        """ Swaps the current timer display to the warning timer. """
+        self.warningTime = 60
+        self.intTimer = 60
+        self.isWarning = True
+        self.render()
+        if self.journal is not None:
+            self.journal.record(EVENT_WARNING_ON, self.journalId, self.warningTime)
+
+    def swapToNormal(self) -> None:
+        """ Disables warning time and presents the normal timer again """
+        self.isWarning = False
+        self.render()
+        if self.journal is not None:
+            self.journal.record(EVENT_WARNING_OFF, self.journalId, self.intTimer)
+
+    ############# PHASE CHECK FUNCTIONS #############
+    def applyExtraTime(self, newTime: int) -> None:
+        """ Applies extra time to the timer in seconds. Returns the incremented amount passed. """
+        # If we have already added extra time, prevent us from doing it again
+        if self.timerLock:
+            return
+
+        # We can memorize our previous location in case we need to remove the extra time
+        self.prevTimer = self.intTimer
+
+        # And then we can increment the timer by the requested amount of time
+        self.intTimer += newTime
+        self.timerLock = True
+        self.render()
+        if self.journal is not None:
+            self.journal.record(EVENT_APPLY_EXTRA, self.journalId, newTime)
+        self.ensureTicking()
+
+        return newTime
+
+    def removeExtraTime(self) -> None:
+        """ If any additional time exists from what was added above, forces the timer to go back
+            to its previous state (without any additional time). If all additional time has
+             elapsed, then nothing is done. Returns the time differential. """
+        if self.prevTimer >= self.intTimer:
+            return
+
+        # Otherwise return to the previous time; the pending tick keeps its deadline
+        differential = self.intTimer - self.prevTimer
+        self.intTimer = self.prevTimer
+        self.render()
+        if self.journal is not None:
+            self.journal.record(EVENT_REMOVE_EXTRA, self.journalId, differential)
+        self.ensureTicking()
+        self.timerLock = False
+
+        return differential
+
+class DeviceCounterState():
+    """
+        Keeps track of how many devices are currently active. Views are told about every single dot that
+        changes through the callback attached with associateRenderCallback.
+    """
+    def __init__(self, maxDeviceCnt: int = 4, initDeviceCnt: int = 0, *, journal: "FightJournal" = None):
+        self.curDeviceCnt = initDeviceCnt
+        self.deviceStates = [1]*self.curDeviceCnt + [0]*(maxDeviceCnt-self.curDeviceCnt)
+        self.maxDeviceCallbackE = None
+        self.maxDeviceCallbackL = None
+        self.renderCallback = None
+        self.journal = journal
+
+    def incrementDevices(self) -> None:
+        """ Increases the number of active devices by 1. """
+        # Ignore if at max capacity already
+        if self.curDeviceCnt == len(self.deviceStates):
+            return
+
+        # We can change only the single device that was adjusted
+        self.deviceStates[self.curDeviceCnt] = 1
+        self.render(self.curDeviceCnt)
+        self.curDeviceCnt += 1
+        if self.journal is not None:
+            self.journal.record(EVENT_DEVICE_ADD, 0, self.curDeviceCnt)
+
+        # And run our callback if we just touched max device count
+        if self.curDeviceCnt == len(self.deviceStates) and self.maxDeviceCallbackE:
+            self.maxDeviceCallbackE()
+
+    def decrementDevices(self) -> None:
+        """ Decreases the number of active devices by 1 """
+        # Ignore if at minimum capacity already
+        if self.curDeviceCnt == 0:
+            return
+        elif self.curDeviceCnt == len(self.deviceStates) and self.maxDeviceCallbackL:
+            self.maxDeviceCallbackL()
+
+        # We can change only the single device that was adjusted
+        self.curDeviceCnt -= 1
+        self.deviceStates[self.curDeviceCnt] = 0
+        self.render(self.curDeviceCnt)
+        if self.journal is not None:
+            self.journal.record(EVENT_DEVICE_REMOVE, 0, self.curDeviceCnt)
+
+    def render(self, devInd: int) -> None:
+        """ Lets the attached view know that a single device has changed state. """
+        if self.renderCallback is not None:
+            self.renderCallback(devInd, self.deviceStates[devInd])
+
+    def associateRenderCallback(self, callback: callable) -> None:
+        """ Attaches a view. The callback receives the index of the device that changed and its new state. """
+        self.renderCallback = callback
+
+    def associateMaxDeviceCallback(self, entryCallback: callable, leaveCallback: callable) -> None:
+        """ Once the max number of devices has been reached or is no longer reached, executes a callback only 
+        once until the device counter has been changed beyond the triggers."""
+        self.maxDeviceCallbackE = entryCallback
+        self.maxDeviceCallbackL = leaveCallback
+
+class FightState():
+    """
+        The whole Kalos fight: all seven timers, the device counter and the current phase, along with every
+        action that can be bound to a hotkey.
+
+        The timerArgs argument expects a dictionary that maps each one of the known timer types (TIMER_NAMES)
+        to their (initTime, redTime, autoReset) values, as produced by buildTimerArgs.
+
+        Given a TimerBank (which must be driven by the same engine) the timers are slots of the bank rather than
+        individual TimerStates.
+    """
+    def __init__(self, timerArgs: dict, *, engine: TickEngine, journal: "FightJournal" = None, bank: "TimerBank" = None):
+        # Constants describing the fight
+        self.MULT_PHASE_TIMER = {"breath"}
+        self.MAX_DEVICES = 4
+        self.PHASE_CHECK_TIME = 50
+
+        # The phase observers are run on every write, just like a tk variable trace
+        self.phaseInd = 0
+        self.phaseCallbacks = list()
+
+        # Build up all of our state objects
+        self.engine = engine
+        self.journal = journal
+        self.timers = dict()
+        for key in TIMER_NAMES:
+            indSelector = (lambda : self.curPhase) if key in self.MULT_PHASE_TIMER else (lambda : 0)
+            if bank is not None:
+                self.timers[key] = bank.createTimer(timerArgs[key]["initTime"], timerArgs[key]["redTime"], timerArgs[key]["autoReset"],
+                                                    indSelector, journal = journal, journalId = TIMER_NAMES.index(key))
+            else:
+                self.timers[key] = TimerState(timerArgs[key]["initTime"], timerArgs[key]["redTime"], timerArgs[key]["autoReset"],
+                                              indSelector = indSelector, engine = engine, journal = journal,
+                                              journalId = TIMER_NAMES.index(key))
+        self.devices = DeviceCounterState(self.MAX_DEVICES, journal = journal)
+
+        # And now we can associate functionality based on the current phase and timer states
+        self.timers["fma"].associateZeroTimerCallback(self.devices.incrementDevices)
+        self.timers["device"].associateZeroTimerCallback(self.devices.incrementDevices)
+        self.devices.associateMaxDeviceCallback(self.timers["device"].swapToWarning, self.timers["device"].swapToNormal)
+
+    ########################## MAIN FUNCTIONALITIES ###########################
+    def startP2(self, *, devicesToStart: list[str] = ["device", "fma", "bomb"]) -> None:
+        """
+            Starts the main timer functionalities. This force the current phase to 0 (just in case
+            it had been modified using another method), and starts the device, fma, and bomb timers.
+        """
+        self.curPhase = 0
+        for curDevice in devicesToStart:
+            self.timers[curDevice].resetTimer()
+
+    def startBreath(self) -> None:
+        """ Starts/Resets the breath timer """
+        self.timers["breath"].resetTimer()
+
+    def startFMA(self) -> None:
+        """ Starts/Resets the fma timer """
+        self.timers["fma"].resetTimer()
+
+    def startLaser(self) -> None:
+        """ Starts/Resets the laser timer """
+        self.timers["laser"].resetTimer()
+
+    def startArrow(self) -> None:
+        """ Starts/Resets the arrow timer """
+        self.timers["arrow"].resetTimer()
+
+    def startDive(self) -> None:
+        """ Starts/Resets the dive timer """
+        self.timers["dive"].resetTimer()
+
+    def startBombs(self) -> None:
+        """ Starts / Resets the bomb timer """
+        self.timers["bomb"].resetTimer()
+
+    def incrementPhase(self) -> None:
+        """ Increments the current phase of the boss by 1"""
+        self.curPhase = self.curPhase + 1
+
+    def decrementPhase(self) -> None:
+        """ Decrements the current phase of the boss by 1 (mostly for debugging) """
+        self.curPhase = self.curPhase - 1
+
+    def cleanseDevice(self) -> None:
+        """ Performs a device cleansing (reduces device count by 1) """
+        self.devices.decrementDevices()
+
+    def addDevice(self) -> None:
+        """ Adds a new device. (Should not generally be used unless fma timer is waaay off) """
+        self.devices.incrementDevices()
+
+    def addBindTimer(self, bindTime: int) -> None:
+        """ Increments the FMA timer by a pre-specified amount. """
+        self.timers["fma"].addTime(bindTime)
+
+    def startPhaseCheck(self, *, affectedDevices = ["device", "fma"]) -> None:
+        """ Starts the phase Kalos phase check. """
+        for curDevice in affectedDevices:
+            if self.timers[curDevice].isLocked():
+                return
+            self.timers[curDevice].applyExtraTime(self.PHASE_CHECK_TIME)
+        self.incrementPhase()
+
+    def failPhaseCheck(self, *, affectedDevices = ["device", "fma"]) -> None:
+        """ Forces the current Kalos phase check to fail (thereby forcing previous timers to be active again) """
+        for curDevice in affectedDevices:
+            if not self.timers[curDevice].isLocked():
+                return
+            self.timers[curDevice].removeExtraTime()
+        self.decrementPhase()
+
+    def actionFor(self, settingName: str) -> callable:
+        """
+            Maps the known hotkey setting names to their respective actions. With a journal attached, the
+            returned action also records itself (along with the phase it was pressed in) before running.
+        """
+        action = self.lookupAction(settingName)
+        if self.journal is None:
+            return action
+
+        actionId = ACTION_NAMES.index(settingName)
+        def journaledAction():
+            self.journal.record(EVENT_ACTION, actionId, self.curPhase)
+            action()
+        return journaledAction
+
+    def lookupAction(self, settingName: str) -> callable:
+        """ Returns the bare action behind a hotkey setting name. """
+        match settingName:
+            case 'Start Timers':
+                return self.startP2
+            case 'Begin Check':
+                return self.startPhaseCheck
+            case 'Fail Check':
+                return self.failPhaseCheck
+            case '10s Bind':
+                return lambda : self.addBindTimer(10)
+            case '15s Bind':
+                return lambda : self.addBindTimer(15)
+            case 'Clear Device':
+                return self.cleanseDevice
+            case 'Reset Breath':
+                return self.startBreath
+            case 'Reset Dive':
+                return self.startDive
+            case 'Reset Laser':
+                return self.startLaser
+            case 'Reset Arrows':
+                return self.startArrow
+            case 'Reset Bombs':
+                return self.startBombs
+            case 'Reset FMA':
+                return self.startFMA
+            case 'Add Device':
+                return self.addDevice
+            case _:
+                raise ValueError("Unknown action '{}'".format(settingName))
+
+    def detach(self) -> None:
+        """ Takes every timer of the fight off its engine (or bank), so a shared engine can carry on without it. """
+        for timer in self.timers.values():
+            timer.detach()
+
+    def getSnapshot(self) -> dict:
+        """ Returns a plain summary of the fight that can be compared between runs. """
+        return {"phase": self.curPhase,
+                "devices": self.devices.curDeviceCnt,
+                "timers": {key:{"time": timer.getDisplayTime(),
+                                "running": timer.isRunning,
+                                "locked": timer.isLocked(),
+                                "warning": timer.isWarning} for key, timer in self.timers.items()}}
+
+    ########################## PROPERTIES AND BINDINGS #############################
+
+    @property
+    def curPhase(self) -> int:
+        """ Function for retrieving the current phase. (Used in passing current phase values to callbacks.) """
+        return self.phaseInd
+
+    @curPhase.setter
+    def curPhase(self, pVal: int) -> None:
+        """ Setter for the current phase. """
+        self.phaseInd = pVal
+        if self.journal is not None:
+            self.journal.record(EVENT_PHASE, 0, pVal)
+        for callback in self.phaseCallbacks:
+            callback(self.phaseInd)
+
+    def associatePhaseSetCallback(self, callback: callable, *args, **kwargs) -> None:
+        """ Associates a callback whenever the phase property is changed. """
+        self.phaseCallbacks.append(lambda phase : callback(phase, *args, **kwargs))
+
+class FightSimulator():
+    """
+        Runs a FightState on a VirtualClock with a headless tick engine. Scripts are lists of
+        (seconds since start, hotkey setting name) pairs, so a whole fight can be replayed in milliseconds.
+
+        A real event loop never runs a pass exactly on its deadline. Given passLateness (a function returning
+        how many seconds late the next pass runs), every pass of the simulated fight is held up by that much.
+    """
+    def __init__(self, timerArgs: dict, *, startTime: float = 0.0, journal: "FightJournal" = None,
+                 passLateness: callable = None):
+        self.clock = VirtualClock(startTime)
+        self.engine = TickEngine(None, clock = self.clock)
+        self.fight = FightState(timerArgs, engine = self.engine, journal = journal)
+        self.startTime = startTime
+        self.passLateness = passLateness
+
+    def advanceTo(self, fightTime: float) -> None:
+        """ Runs every tick that is due up until the given time (in seconds since the start of the fight). """
+        targetTime = self.startTime + fightTime
+        nextDeadline = self.engine.getNextDeadline()
+        while nextDeadline is not None and nextDeadline <= targetTime:
+            if self.passLateness is not None:
+                nextDeadline += self.passLateness()
+            self.clock.now = max(self.clock.now, nextDeadline)
+            self.engine.runPass()
+            nextDeadline = self.engine.getNextDeadline()
+        self.clock.now = max(self.clock.now, targetTime)
+
+    def runScript(self, script: list[tuple[float, str]], *, endTime: float = None) -> dict:
+        """ Performs every scripted action at its time and returns a snapshot of the final fight state. """
+        for actionTime, settingName in sorted(script, key = lambda entry : entry[0]):
+            self.advanceTo(actionTime)
+            self.fight.actionFor(settingName)()
+
+        if endTime is not None:
+            self.advanceTo(endTime)
+
+        return self.fight.getSnapshot()
+
+def startEveryTimer(fight: FightState) -> None:
+    """
+        Starts every timer of a fight (P2 and then every other reset action), the way benchmarks want a fight set
+        up. Overlays have the very same actions, so they can be passed in as well.
+    """
+    fight.startP2()
+    for startAction in [fight.startBreath, fight.startLaser, fight.startArrow, fight.startDive]:
+        startAction()
+
+# smoke test
+if __name__ == "__main__":
+    args = buildTimerArgs(DEFAULT_INIT_TIMES)
+
+    # Countdowns, auto-resets, binds and a phase check that is failed again
+    simulator = FightSimulator(args)
+    snapshot = simulator.runScript([(0, "Start Timers"), (30, "10s Bind"), (40, "Begin Check")], endTime = 40)
+    assert snapshot["phase"] == 1
+    assert snapshot["timers"]["device"] == {"time": 70, "running": True, "locked": True, "warning": False}
+    assert snapshot["timers"]["fma"]["time"] == 170 and snapshot["timers"]["fma"]["locked"]
+    snapshot = simulator.runScript([(45, "Fail Check")], endTime = 50)
+    assert snapshot["phase"] == 0
+    assert snapshot["timers"]["device"] == {"time": 15, "running": True, "locked": False, "warning": False}
+    assert snapshot["timers"]["fma"]["time"] == 115
+    assert snapshot["timers"]["bomb"]["time"] == 4 # reset at 11, 22, 33 and 44
+    assert not snapshot["timers"]["laser"]["running"]
+
+    # Devices come from both the device timer (61, 122, 183) and FMA (151), and the fourth swaps to the warning
+    simulator = FightSimulator(args)
+    snapshot = simulator.runScript([(0, "Start Timers")], endTime = 152)
+    assert snapshot["devices"] == 3
+    assert snapshot["timers"]["fma"] == {"time": 0, "running": False, "locked": False, "warning": False}
+    snapshot = simulator.runScript([], endTime = 200)
+    assert snapshot["devices"] == 4
+    assert snapshot["timers"]["device"] == {"time": 43, "running": True, "locked": False, "warning": True}
+    snapshot = simulator.runScript([(201, "Clear Device")])
+    assert snapshot["devices"] == 3
+    assert snapshot["timers"]["device"] == {"time": 60, "running": True, "locked": False, "warning": False}
+
+    # A rough 30 minute fight: devices get cleansed, binds land on FMA and three phase checks pass
+    script = [(0, "Start Timers")]
+    script += [(t, "Clear Device") for t in range(55, 1800, 60)]
+    script += [(t, "10s Bind") for t in range(30, 1800, 90)]
+    script += [(t, "Reset Breath") for t in range(0, 1800, 40)]
+    script += [(t, "Reset Dive") for t in range(5, 1800, 25)]
+    script += [(t, "Begin Check") for t in (400, 800, 1200)]
+
+    simulator = FightSimulator(args)
+    startTime = time.perf_counter()
+    snapshot = simulator.runScript(script, endTime = 1800)
+    elapsed = time.perf_counter() - startTime
+    assert snapshot == FightSimulator(args).runScript(script, endTime = 1800), "simulated fights are not deterministic"
+    assert snapshot["phase"] == 3
+
+    # On a virtual clock every tick runs exactly on its deadline, so nothing may have drifted
+    assert simulator.fight.timers["device"].tickCount == 1800
+    for key, timer in simulator.fight.timers.items():
+        driftStats = timer.getDriftStats()
+        assert driftStats["maxLateness"] == 0.0 and driftStats["earlyTicks"] == 0, (key, driftStats)
+    assert simulator.engine.maxLateness == 0.0
+
+    # An hour long fight where every pass runs up to 20 ms late must still tick on its grid: no tick is lost,
+    # the timers are never further behind than the latest pass, and the offset does not grow over the hour
+    hourScript = script + [(t + 1800, settingName) for t, settingName in script if settingName not in ("Start Timers", "Begin Check")]
+    jitter = random.Random(1)
+    lateSimulator = FightSimulator(args, passLateness = lambda : jitter.uniform(0.0, 0.02))
+    lateSnapshot = lateSimulator.runScript(hourScript, endTime = 3600)
+    assert lateSnapshot == FightSimulator(args).runScript(hourScript, endTime = 3600)
+    assert lateSimulator.fight.timers["device"].tickCount == 3600
+    for key, timer in lateSimulator.fight.timers.items():
+        driftStats = timer.getDriftStats()
+        assert driftStats["gridOffset"] <= 0.02 and driftStats["maxLateness"] <= 0.02, (key, driftStats)
+        assert driftStats["driftPerHour"] is None or abs(driftStats["driftPerHour"]) < 0.05, (key, driftStats)
+    assert lateSimulator.fight.timers["device"].getDriftStats()["driftPerHour"] is not None
+
+    print("Simulated 30 minutes in {:.1f} ms ({} engine passes)".format(elapsed*1000, simulator.engine.passCount))
+    print(snapshot)
+    print("Device drift over an hour of late passes:", lateSimulator.fight.timers["device"].getDriftStats())
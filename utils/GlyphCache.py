@@ -0,0 +1,165 @@
+"""
+GlyphCache.py
+
+Every time a timer label's text changes, tk has to lay out and draw 40pt text all over again. In glyph mode every
+value a timer can show is rasterized once up front (0 to 99 in every timer color), and a tick only swaps the image
+on the label (or canvas item) for one that is already sitting in the cache.
+
+Glyphs are drawn with PIL, which has to find the font file on its own, so the closest TrueType font on the system
+is used (see FONT_FILES) and PIL's built-in font is the last resort. Glyphs are sized from the tk font metrics, so
+they take up the same room that the text would.
+
+Drawing and encoding 200 separate glyphs through PIL would cost more than the whole overlay startup, so PIL only
+draws one strip of characters per color. Every glyph is then composed inside tk by copying characters out of the
+strip, which is only a couple of Tcl calls per glyph.
+"""
+import base64
+import io
+import time
+import tkinter as tk
+import tkinter.font as tkFont
+from utils.Startup import lazyImport
+
+# PIL is only needed while the glyphs are being drawn
+Image = lazyImport("PIL.Image")
+ImageDraw = lazyImport("PIL.ImageDraw")
+ImageFont = lazyImport("PIL.ImageFont")
+
+# Font files tried (in order) for a tk font family. Unknown families are tried by their own name
+FONT_FILES = {"helvetica": ["Helvetica.ttc", "Helvetica.ttf", "Arial.ttf", "arial.ttf", "LiberationSans-Regular.ttf",
+                            "FreeSans.ttf", "DejaVuSans.ttf"]}
+
+def loadFont(family: str, pixelSize: int) -> "ImageFont.FreeTypeFont":
+    """ Loads the closest TrueType font to the given family at the given size in pixels. """
+    for fontFile in FONT_FILES.get(family.lower(), [family]):
+        try:
+            return ImageFont.truetype(fontFile, pixelSize)
+        except OSError:
+            continue
+    return ImageFont.load_default(pixelSize)
+
+class GlyphCache():
+    """
+        Holds a tk image for every timer value (formatted like the timers format them) in every timer color.
+        The values 0 to maxValue and the "--" placeholder are drawn as soon as the cache is built; anything
+        else (e.g. a 150 second FMA) is drawn the first time it is asked for and kept from then on.
+
+        The whole cache is only redrawn when the font size actually changes (see setFontSize). Characters are
+        laid out on a fixed advance (the widest of them), which is how Helvetica lays out its digits anyway.
+    """
+    def __init__(self, root, font: tkFont.Font, colors: list[str] = ["black", "red"], *, maxValue: int = 99,
+                 textFormat: str = "{:>2}"):
+        self.root = root
+        self.font = font
+        self.COLORS = colors
+        self.MAX_VALUE = maxValue
+        self.TEXT_FORMAT = textFormat
+        self.PLACEHOLDER = "--"
+        self.CHARACTERS = "0123456789-"
+
+        # (text, color) -> tk image, for the font size the cache was last built at, along with the character
+        # strips (color -> tk image) they are copied out of
+        self.glyphs = dict()
+        self.strips = dict()
+        self.fontSize = None
+        self.pilFont = None
+        self.glyphHeight = 0
+        self.baseline = 0
+        self.advance = 0
+
+        # Everyone drawing from this cache (e.g. several overlays) is told whenever the glyphs are redrawn, since
+        # the images they currently show are gone along with the old glyphs
+        self.rebuildCallbacks = list()
+
+        # Bookkeeping on what the cache has cost us so far
+        self.buildCount = 0
+        self.buildTime = 0.0
+        self.missCount = 0
+
+        self.setFontSize(font.actual("size"))
+
+    def setFontSize(self, fontSize: int) -> bool:
+        """
+            Redraws every glyph for a new font size (in tk units, so negative sizes are pixels). Returns whether
+            anything had to be redrawn.
+        """
+        if fontSize == self.fontSize:
+            return False
+        self.fontSize = fontSize
+        self.font.configure(size = fontSize)
+        self.rebuild()
+        return True
+
+    def rebuild(self) -> None:
+        """ Draws the placeholder and every value up to maxValue in every color. """
+        buildStart = time.perf_counter()
+        pixelSize = -self.fontSize if self.fontSize < 0 else round(self.root.winfo_fpixels("{}p".format(self.fontSize)))
+        self.pilFont = loadFont(self.font.actual("family"), pixelSize)
+        self.glyphHeight = self.font.metrics("linespace")
+        self.baseline = self.font.metrics("ascent")
+        self.advance = max(max(self.font.measure(char), round(self.pilFont.getlength(char))) for char in self.CHARACTERS)
+
+        self.strips = {color:self.createStrip(color) for color in self.COLORS}
+        self.glyphs = dict()
+        for text in [self.PLACEHOLDER] + [self.TEXT_FORMAT.format(value) for value in range(self.MAX_VALUE + 1)]:
+            for color in self.COLORS:
+                self.glyphs[(text, color)] = self.createGlyph(text, color)
+
+        self.buildCount += 1
+        self.buildTime += time.perf_counter() - buildStart
+        for callback in list(self.rebuildCallbacks):
+            callback()
+
+    def associateRebuildCallback(self, callback: callable) -> None:
+        """ Calls the given callback every time the glyphs are redrawn. """
+        self.rebuildCallbacks.append(callback)
+
+    def removeRebuildCallback(self, callback: callable) -> None:
+        """ Stops calling a callback given to associateRebuildCallback. """
+        if callback in self.rebuildCallbacks:
+            self.rebuildCallbacks.remove(callback)
+
+    def rasterize(self, color: str) -> "Image.Image":
+        """
+            Draws every character side by side (one advance each) on a transparent background, on the same
+            baseline tk would put the text.
+        """
+        stripImage = Image.new("RGBA", (self.advance*len(self.CHARACTERS), self.glyphHeight), (0, 0, 0, 0))
+        stripDraw = ImageDraw.Draw(stripImage)
+        for charInd, char in enumerate(self.CHARACTERS):
+            stripDraw.text((self.advance*charInd + self.advance/2, self.baseline), char, font = self.pilFont, fill = color, anchor = "ms")
+        return stripImage
+
+    def createStrip(self, color: str) -> tk.PhotoImage:
+        """ Turns the rasterized characters of a color into a tk image. """
+        pngData = io.BytesIO()
+        self.rasterize(color).save(pngData, format = "PNG", compress_level = 1)
+        return tk.PhotoImage(master = self.root, data = base64.b64encode(pngData.getvalue()))
+
+    def createGlyph(self, text: str, color: str) -> tk.PhotoImage:
+        """ Composes the image for a text by copying each of its characters out of the strip (spaces stay blank). """
+        glyph = tk.PhotoImage(master = self.root, width = self.advance*len(text), height = self.glyphHeight)
+        strip = self.strips[color]
+        for charInd, char in enumerate(text):
+            if char == " ":
+                continue
+            stripX = self.advance*self.CHARACTERS.index(char)
+            glyph.tk.call(glyph.name, "copy", strip.name, "-from", stripX, 0, stripX + self.advance, self.glyphHeight,
+                          "-to", self.advance*charInd, 0)
+        return glyph
+
+    def getGlyph(self, text: str, color: str) -> tk.PhotoImage:
+        """ Returns the image for the given timer text in the given color, drawing it only if it was never drawn. """
+        glyph = self.glyphs.get((text, color))
+        if glyph is None:
+            self.missCount += 1
+            glyph = self.glyphs[(text, color)] = self.createGlyph(text, color)
+        return glyph
+
+    def getStats(self) -> dict[str, float]:
+        """ Reports how many glyphs are cached, how often the cache was (re)built and what that cost. """
+        return {"glyphs": len(self.glyphs),
+                "fontSize": self.fontSize,
+                "builds": self.buildCount,
+                "buildMs": self.buildTime*1000,
+                "misses": self.missCount}
@@ -0,0 +1,158 @@
+"""
+HotPathProfiler.py
+
+Profiles the app while it is running, so that a real raid can be looked at without restarting the overlay. While
+profiling is on, every Python call on the tk loop goes through cProfile and every allocation is traced by
+tracemalloc. Once it is turned off again, the full call stats are written out (to be opened with pstats, snakeviz,
+...) next to a summary of the callbacks that make up the overlay's hot paths (see HOT_PATHS) and of every hotkey
+action that was dispatched in the meantime.
+"""
+import cProfile
+import io
+import os
+import pstats
+import time
+import tracemalloc
+from utils.FightState import TimerState
+from utils.WidgetContainers import Timer, PhaseImageWidget
+
+# The callbacks that get a line of their own in the summary, as (class, method name). Overrides of the method in
+# subclasses (e.g. CanvasTimer.render) get their own line as well
+HOT_PATHS = [(TimerState, "updateTimer"), (Timer, "render"), (PhaseImageWidget, "forceRender")]
+
+class HotPathProfiler():
+    """
+        Turns cProfile and tracemalloc on and off around the running app.
+
+        Calls and times of the hot path callbacks come straight out of cProfile (the time includes everything
+        they call). Their allocations are everything allocated with the callback somewhere on the stack that is
+        still alive once profiling stops, so short-lived garbage does not show up but anything that piles up does.
+
+        Hotkey actions are all anonymous closures as far as cProfile is concerned, so the action queue runs them
+        through runAction instead, which measures each one under its action name (allocations there are how much
+        the traced memory grew over the call).
+    """
+    def __init__(self, *, hotPaths: list[tuple[type, str]] = HOT_PATHS, reportDir: str = "./logs", traceFrames: int = 32):
+        self.HOT_PATHS = list(hotPaths)
+        self.REPORT_DIR = reportDir
+        self.TRACE_FRAMES = traceFrames
+
+        # Everything belonging to the profiling session that is currently running (if any)
+        self.profiler = None
+        self.startSnapshot = None
+        self.startTime = 0.0
+        self.ownsTracing = False
+
+        # action name -> {"calls", "time", "allocated"} for the current session
+        self.actionStats = dict()
+
+    @property
+    def active(self) -> bool:
+        return self.profiler is not None
+
+    def toggle(self) -> str | None:
+        """ Starts profiling, or stops it and returns the path of the summary that was written. """
+        if self.active:
+            return self.stop()
+        self.start()
+        return None
+
+    def start(self) -> None:
+        """ Starts a new profiling session. """
+        if self.active:
+            return
+        self.actionStats = dict()
+
+        # Someone else may already be tracing allocations, in which case we leave their tracing alone
+        self.ownsTracing = not tracemalloc.is_tracing()
+        if self.ownsTracing:
+            tracemalloc.start(self.TRACE_FRAMES)
+        self.startSnapshot = tracemalloc.take_snapshot()
+
+        self.startTime = time.perf_counter()
+        self.profiler = cProfile.Profile()
+        self.profiler.enable()
+
+    def stop(self) -> str:
+        """ Stops the current session and writes out its results. Returns the path of the summary. """
+        self.profiler.disable()
+        profiler, self.profiler = self.profiler, None
+        profiledTime = time.perf_counter() - self.startTime
+        endSnapshot = tracemalloc.take_snapshot()
+        if self.ownsTracing:
+            tracemalloc.stop()
+
+        os.makedirs(self.REPORT_DIR, exist_ok = True)
+        reportBase = os.path.join(self.REPORT_DIR, "profile_{}".format(time.strftime("%Y%m%d-%H%M%S")))
+        profiler.dump_stats(reportBase + ".prof")
+        with open(reportBase + ".txt", "w") as summaryFile:
+            summaryFile.write(self.getSummary(profiler, endSnapshot, profiledTime))
+
+        self.startSnapshot = None
+        return reportBase + ".txt"
+
+    def runAction(self, actionName: str, action: callable) -> None:
+        """ Runs a dispatched hotkey action and adds it to the stats of its name. """
+        allocatedBefore = tracemalloc.get_traced_memory()[0]
+        callStart = time.perf_counter()
+        try:
+            action()
+        finally:
+            callTime = time.perf_counter() - callStart
+
+            # The action may well have been the one that stopped profiling
+            if self.active:
+                stats = self.actionStats.setdefault(actionName, {"calls": 0, "time": 0.0, "allocated": 0})
+                stats["calls"] += 1
+                stats["time"] += callTime
+                stats["allocated"] += tracemalloc.get_traced_memory()[0] - allocatedBefore
+
+    def getHotPathFunctions(self) -> dict[str, callable]:
+        """ Finds every function to summarize (label -> function), including overrides in subclasses. """
+        hotPathFuncs = dict()
+        for hotPathClass, methodName in self.HOT_PATHS:
+            pendingClasses = [hotPathClass]
+            while pendingClasses:
+                curClass = pendingClasses.pop()
+                pendingClasses.extend(curClass.__subclasses__())
+                if methodName in vars(curClass):
+                    hotPathFuncs["{}.{}".format(curClass.__name__, methodName)] = vars(curClass)[methodName]
+        return hotPathFuncs
+
+    def getSummary(self, profiler: cProfile.Profile, endSnapshot: tracemalloc.Snapshot, profiledTime: float) -> str:
+        """ Builds the summary of a finished session. """
+        callStats = pstats.Stats(profiler)
+        hotPathFuncs = self.getHotPathFunctions()
+
+        # Allocations that are still around are attributed to every hot path found on their stack
+        retained = {label:0 for label in hotPathFuncs}
+        codeRanges = {label:(func.__code__.co_filename, func.__code__.co_firstlineno,
+                             max((line for _, _, line in func.__code__.co_lines() if line is not None), default = func.__code__.co_firstlineno))
+                      for label, func in hotPathFuncs.items()}
+        for allocDiff in endSnapshot.compare_to(self.startSnapshot, "traceback"):
+            if allocDiff.size_diff <= 0:
+                continue
+            for label, (fileName, firstLine, lastLine) in codeRanges.items():
+                if any(frame.filename == fileName and firstLine <= frame.lineno <= lastLine for frame in allocDiff.traceback):
+                    retained[label] += allocDiff.size_diff
+
+        lines = ["Profiled {:.1f} s".format(profiledTime), "",
+                 "{:<32}{:>10}{:>12}{:>12}{:>14}".format("Callback", "Calls", "Total ms", "Mean us", "Retained KiB")]
+        for label, func in sorted(hotPathFuncs.items()):
+            funcCode = func.__code__
+            _, callCount, _, cumTime, _ = callStats.stats.get((funcCode.co_filename, funcCode.co_firstlineno, funcCode.co_name),
+                                                              (0, 0, 0.0, 0.0, None))
+            lines.append("{:<32}{:>10}{:>12.3f}{:>12.1f}{:>14.1f}".format(label, callCount, cumTime*1000,
+                         cumTime/callCount*1e6 if callCount else 0.0, retained[label]/1024))
+
+        lines += ["", "{:<32}{:>10}{:>12}{:>12}{:>14}".format("Hotkey action", "Calls", "Total ms", "Mean us", "Grown KiB")]
+        for actionName, stats in sorted(self.actionStats.items(), key = lambda item: str(item[0])):
+            lines.append("{:<32}{:>10}{:>12.3f}{:>12.1f}{:>14.1f}".format(str(actionName), stats["calls"], stats["time"]*1000,
+                         stats["time"]/stats["calls"]*1e6, stats["allocated"]/1024))
+
+        # And then the usual views, for anything that is not a hot path yet
+        statsText = io.StringIO()
+        pstats.Stats(profiler, stream = statsText).sort_stats("cumulative").print_stats(25)
+        lines += ["", "Top calls by cumulative time", statsText.getvalue().strip(), "", "Top allocation sites still alive"]
+        lines += [str(allocDiff) for allocDiff in endSnapshot.compare_to(self.startSnapshot, "lineno")[:15]]
+        return "\n".join(lines) + "\n"
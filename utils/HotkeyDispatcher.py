@@ -0,0 +1,330 @@
+"""
+HotkeyDispatcher.py
+
+The hook sees every single key the system receives, and nearly all of them are ordinary game input that has
+nothing to do with us. The dispatcher makes those keys as cheap as possible: held modifiers are tracked as a
+bitmask, every binding is stored under its (modifier mask, scan code) pair, and a key that is neither a modifier nor
+bound to anything is turned away by a single set membership check.
+
+Hotkeys are edge triggered: holding a bound key down only fires it once, no matter how many times the OS repeats the
+key. Every binding can also have a cooldown, and every press that was dropped along the way is counted. Since a key
+up can always get lost on the way to us, a key that is held without repeating for too long is no longer trusted to
+be held down.
+
+Bindings can be made under a namespace (e.g. one per overlay), so that several users of the same dispatcher can
+each remove their own bindings without touching anyone else's.
+
+Running this module benchmarks the per-keystroke cost of the keyboard library's way of matching hotkeys against the
+dispatcher on a synthetic stream of game input. The stream uses fixed scan codes (see FakeInputSource), so it runs
+the same on any box, keymap or not.
+"""
+import random
+import re
+import time
+from utils.Startup import lazyImport
+
+keyboard = lazyImport("keyboard")
+
+# Each modifier gets its own bit. Left and right variants share a bit, so "shift+a" matches either shift key
+MODIFIER_BITS = {"ctrl": 1, "shift": 2, "alt": 4, "alt gr": 8, "windows": 16}
+
+# Other names the keyboard library knows the modifiers by
+MODIFIER_ALIASES = {"control": "ctrl", "win": "windows", "command": "windows", "cmd": "windows", "option": "alt", "altgr": "alt gr"}
+
+# Scan codes of a standard (set 1) keyboard, so benchmarks never depend on the keymap of the box they run on
+FAKE_MODIFIER_SCAN_CODES = {29: 1, 97: 1, 42: 2, 54: 2, 56: 4, 100: 8, 125: 16, 126: 16}
+FAKE_HOTKEYS = [(0, 59), (0, 60), (0, 61), (0, 62), (0, 63), (0, 64), (0, 65), (0, 66), (2, 16), (2, 17), (1, 18),
+                (1, 19), (4, 20), (0, 1)] # f1-f8, shift+q/w, ctrl+e/r, alt+t and esc
+
+def splitHotkey(hotkey: str) -> tuple[int, str]:
+    """
+        Splits a single step hotkey into its modifier mask and the name of its one non-modifier key. This only looks
+        at the text, so it never needs the keyboard library (or a keymap): whether the key actually exists on this
+        keyboard is only found out once the hotkey is bound.
+    """
+    if "," in hotkey.replace(", ", ","):
+        raise ValueError("Multi-step hotkeys are not supported: {}".format(hotkey))
+
+    modMask = 0
+    keyName = None
+    for curName in re.split(r"\s?\+\s?", hotkey.lower()):
+        curName = curName.strip().replace("_", " ")
+        if not curName:
+            raise ValueError("Hotkeys may not have an empty key: {}".format(hotkey))
+        baseName = curName.split(" ", 1)[1] if curName.startswith(("left ", "right ")) else curName
+        baseName = MODIFIER_ALIASES.get(baseName, baseName)
+        if baseName in MODIFIER_BITS:
+            modMask |= MODIFIER_BITS[baseName]
+        elif keyName is None:
+            keyName = curName
+        else:
+            raise ValueError("Hotkeys may only contain a single non-modifier key: {}".format(hotkey))
+
+    if keyName is None:
+        raise ValueError("Hotkeys need a non-modifier key: {}".format(hotkey))
+    return modMask, keyName
+
+class HotkeyBinding():
+    """
+        A single callback bound to a hotkey, along with its cooldown (in seconds), when it last fired and the
+        namespace it was bound under.
+    """
+    def __init__(self, callback: callable, cooldown: float = 0.0, namespace: str = None):
+        self.callback = callback
+        self.cooldown = cooldown
+        self.namespace = namespace
+        self.lastFired = None
+
+class HotkeyDispatcher():
+    """
+        Maps single step hotkeys (any number of modifiers plus one other key) to their callbacks.
+
+        Unlike the keyboard library, a hotkey only cares about the modifiers that are held down, so a hotkey still
+        fires while movement keys are being held. Callbacks are run on whichever thread calls processEvent.
+
+        Key ups go missing every now and then (focus moving to an elevated window, the lock screen, the hook being
+        reinstalled while a key is held), which would leave a key stuck as held. A bound key that is pressed again
+        more than heldTimeout seconds after its last key down therefore counts as a new press, and given a
+        pressedCheck (scan code -> whether the key is down, e.g. keyboard.is_pressed) modifiers that have not
+        repeated for that long are checked before they count towards a hotkey.
+    """
+    def __init__(self, *, modifierScanCodes: dict[int, int] = None, heldTimeout: float = 1.5, pressedCheck: callable = None):
+        # scan code -> modifier bit. Resolved through the keyboard library unless given explicitly
+        self.modifierScanCodes = modifierScanCodes
+
+        # (modifier mask, scan code) -> bindings, along with every scan code that is worth looking at
+        self.bindings = dict()
+        self.boundScanCodes = set()
+        self.watchedScanCodes = set()
+
+        # The modifiers currently held down and the mask they make up, along with the bound keys that are
+        # currently held down (so that OS key repeats can be told apart from actual presses). Both map the scan
+        # code to the time of its latest key down
+        self.heldModifiers = dict()
+        self.modMask = 0
+        self.heldKeys = dict()
+        self.HELD_TIMEOUT = heldTimeout
+        self.pressedCheck = pressedCheck
+
+        # Counters for the matching throughput and for the invocations we dropped
+        self.processedCount = 0
+        self.matchedCount = 0
+        self.repeatDropped = 0
+        self.cooldownDropped = 0
+        self.staleReleased = 0
+
+    def resolveModifiers(self) -> dict[int, int]:
+        """ Looks up the scan codes of every modifier key on this system. """
+        if self.modifierScanCodes is None:
+            self.modifierScanCodes = dict()
+            for modName, modBit in MODIFIER_BITS.items():
+                for scanCode in keyboard.key_to_scan_codes(modName, False):
+                    self.modifierScanCodes[scanCode] = modBit
+        return self.modifierScanCodes
+
+    def parseHotkey(self, hotkey: str) -> tuple[int, tuple[int]]:
+        """ Splits a hotkey string into its modifier mask and the scan codes of its single non-modifier key. """
+        modMask, keyName = splitHotkey(hotkey)
+        return modMask, keyboard.key_to_scan_codes(keyboard.normalize_name(keyName))
+
+    def bind(self, hotkey: str, callback: callable, *, cooldown: float = 0.0, namespace: str = None) -> None:
+        """
+            Runs the callback every time the given hotkey is pressed, but never twice within the cooldown (in
+            seconds). Every scan code of the key shares the same cooldown. Hotkeys bound in several namespaces
+            fire in every one of them.
+        """
+        modMask, scanCodes = self.parseHotkey(hotkey)
+        binding = HotkeyBinding(callback, cooldown, namespace)
+        for scanCode in scanCodes:
+            self.bindScanCode(modMask, scanCode, binding)
+
+    def bindScanCode(self, modMask: int, scanCode: int, binding: HotkeyBinding) -> None:
+        """ Fires the binding every time the given key is pressed while exactly the given modifiers are held. """
+        self.bindings.setdefault((modMask, scanCode), list()).append(binding)
+        self.boundScanCodes.add(scanCode)
+        self.watchedScanCodes = self.boundScanCodes | set(self.resolveModifiers())
+
+    def clear(self, namespace: str = None) -> None:
+        """ Removes every binding made under the given namespace, or every binding at all without one. """
+        if namespace is not None:
+            self.bindings = {bindKey:[binding for binding in bindings if binding.namespace != namespace] for bindKey, bindings in self.bindings.items()}
+            self.bindings = {bindKey:bindings for bindKey, bindings in self.bindings.items() if bindings}
+            self.boundScanCodes = {scanCode for _, scanCode in self.bindings}
+            self.watchedScanCodes = self.boundScanCodes | set(self.resolveModifiers()) if self.boundScanCodes else set()
+            return
+
+        self.bindings = dict()
+        self.boundScanCodes = set()
+        self.watchedScanCodes = set()
+        self.resetHeld()
+
+    def resetHeld(self) -> None:
+        """ Forgets every key that is held down (e.g. when the hook is installed, as key ups may have been missed). """
+        self.heldModifiers = dict()
+        self.modMask = 0
+        self.heldKeys = dict()
+
+    def updateModMask(self) -> None:
+        """ Rebuilds the modifier mask out of the modifiers held down. """
+        self.modMask = 0
+        for heldScanCode in self.heldModifiers:
+            self.modMask |= self.modifierScanCodes[heldScanCode]
+
+    def expireModifiers(self, eventTime: float) -> None:
+        """ Drops the modifiers that have been quiet for too long and are no longer down according to pressedCheck. """
+        staleModifiers = [scanCode for scanCode, downTime in self.heldModifiers.items()
+                          if eventTime - downTime >= self.HELD_TIMEOUT and not self.pressedCheck(scanCode)]
+        if staleModifiers:
+            self.staleReleased += len(staleModifiers)
+            for scanCode in staleModifiers:
+                del self.heldModifiers[scanCode]
+            self.updateModMask()
+
+    def processEvent(self, event: "keyboard.KeyboardEvent") -> None:
+        """ Runs the callbacks bound to the key (and held modifiers) of a key down edge. """
+        self.processedCount += 1
+        scanCode = event.scan_code
+        if scanCode not in self.watchedScanCodes:
+            return
+
+        # Modifiers only ever change the mask
+        modBit = self.modifierScanCodes.get(scanCode)
+        if modBit is not None:
+            if event.event_type == keyboard.KEY_DOWN:
+                self.heldModifiers[scanCode] = event.time
+            else:
+                self.heldModifiers.pop(scanCode, None)
+            self.updateModMask()
+            return
+
+        if event.event_type != keyboard.KEY_DOWN:
+            self.heldKeys.pop(scanCode, None)
+            return
+
+        # A key down for a key that is already down is just the OS repeating it, unless it has been quiet for so
+        # long that its key up must have been lost
+        lastDown = self.heldKeys.get(scanCode)
+        self.heldKeys[scanCode] = event.time
+        if lastDown is not None:
+            if event.time - lastDown < self.HELD_TIMEOUT:
+                self.repeatDropped += 1
+                return
+            self.staleReleased += 1
+        if self.heldModifiers and self.pressedCheck is not None:
+            self.expireModifiers(event.time)
+
+        for binding in self.bindings.get((self.modMask, scanCode), ()):
+            if binding.lastFired is not None and event.time - binding.lastFired < binding.cooldown:
+                self.cooldownDropped += 1
+                continue
+            binding.lastFired = event.time
+            self.matchedCount += 1
+            binding.callback()
+
+    def getDispatchStats(self) -> dict[str, int]:
+        """ Reports how many events were seen, how many hotkeys fired and how many presses were dropped. """
+        return {"processed": self.processedCount,
+                "matched": self.matchedCount,
+                "repeatDropped": self.repeatDropped,
+                "cooldownDropped": self.cooldownDropped,
+                "staleReleased": self.staleReleased}
+
+class FakeInputSource():
+    """
+        Stands in for the keyboard hook. Produces a seeded stream of mostly unbound game input with the odd
+        hotkey (modifiers included) mixed in, where every press is followed by its release, and some keys are
+        held long enough for the OS to repeat them.
+    """
+    def __init__(self, hotkeys: list[tuple[int, int]], *, boundRatio: float = 0.02, repeatRatio: float = 0.05, seed: int = 0):
+        self.hotkeys = hotkeys
+        self.BOUND_RATIO = boundRatio
+        self.REPEAT_RATIO = repeatRatio
+        self.rng = random.Random(seed)
+
+        self.modScanCodes = dict()
+        for scanCode, modBit in sorted(FAKE_MODIFIER_SCAN_CODES.items()):
+            self.modScanCodes.setdefault(modBit, scanCode)
+        usedScanCodes = {scanCode for _, scanCode in hotkeys} | set(FAKE_MODIFIER_SCAN_CODES)
+        self.unboundScanCodes = [scanCode for scanCode in range(2, 90) if scanCode not in usedScanCodes]
+
+    def generate(self, eventCount: int) -> list["keyboard.KeyboardEvent"]:
+        """ Returns (at least) the given number of events, timestamped 20 ms apart. """
+        events = list()
+        while len(events) < eventCount:
+            if self.rng.random() < self.BOUND_RATIO:
+                modMask, scanCode = self.rng.choice(self.hotkeys)
+                mods = [modScanCode for modBit, modScanCode in self.modScanCodes.items() if modMask & modBit]
+            else:
+                scanCode, mods = self.rng.choice(self.unboundScanCodes), []
+            presses = 3 if self.rng.random() < self.REPEAT_RATIO else 1
+
+            eventTypes = [(keyboard.KEY_DOWN, modCode) for modCode in mods] + [(keyboard.KEY_DOWN, scanCode)]*presses
+            eventTypes += [(keyboard.KEY_UP, scanCode)] + [(keyboard.KEY_UP, modCode) for modCode in mods]
+            for eventType, eventScanCode in eventTypes:
+                events.append(keyboard.KeyboardEvent(eventType, eventScanCode, time = len(events)*0.02))
+        return events
+
+class PressedSetMatcher():
+    """
+        Matches hotkeys the way the keyboard library does, for comparison in the benchmark below: every key down
+        or up changes the set of keys held down, and every key down looks the sorted scan codes of that whole set
+        up among every combination of scan codes the hotkeys can be pressed with.
+    """
+    def __init__(self, modifierScanCodes: dict[int, int]):
+        self.modifierScanCodes = modifierScanCodes
+        self.hotkeys = dict()
+        self.pressedScanCodes = set()
+
+    def bind(self, modMask: int, scanCode: int, callback: callable) -> None:
+        """ Registers the callback under every combination of modifier keys (left, right, ...) making up the mask. """
+        combinations = [()]
+        for modBit in MODIFIER_BITS.values():
+            if modMask & modBit:
+                modScanCodes = [modScanCode for modScanCode, curBit in self.modifierScanCodes.items() if curBit == modBit]
+                combinations = [combination + (modScanCode,) for combination in combinations for modScanCode in modScanCodes]
+        for combination in combinations:
+            self.hotkeys.setdefault(tuple(sorted(combination + (scanCode,))), list()).append(callback)
+
+    def processEvent(self, event: "keyboard.KeyboardEvent") -> None:
+        if event.event_type == keyboard.KEY_DOWN:
+            self.pressedScanCodes.add(event.scan_code)
+            for callback in self.hotkeys.get(tuple(sorted(self.pressedScanCodes)), ()):
+                callback()
+        else:
+            self.pressedScanCodes.discard(event.scan_code)
+
+def benchmark(hotkeys: list[tuple[int, int]] = FAKE_HOTKEYS, eventCount: int = 200000, boundRatio: float = 0.02) -> dict[str, float]:
+    """
+        Times the per-keystroke cost (in microseconds) of matching a stream of mostly unbound game input against
+        the given (modifier mask, scan code) hotkeys, once the way the keyboard library matches them and once
+        through the dispatcher.
+    """
+    noop = lambda : None
+    matcher = PressedSetMatcher(FAKE_MODIFIER_SCAN_CODES)
+    dispatcher = HotkeyDispatcher(modifierScanCodes = FAKE_MODIFIER_SCAN_CODES)
+    for modMask, scanCode in hotkeys:
+        matcher.bind(modMask, scanCode, noop)
+        dispatcher.bindScanCode(modMask, scanCode, HotkeyBinding(noop))
+    events = FakeInputSource(hotkeys, boundRatio = boundRatio).generate(eventCount)
+
+    startTime = time.perf_counter()
+    for event in events:
+        matcher.processEvent(event)
+    libraryTime = time.perf_counter() - startTime
+
+    startTime = time.perf_counter()
+    for event in events:
+        dispatcher.processEvent(event)
+    dispatcherTime = time.perf_counter() - startTime
+
+    return {"events": len(events),
+            "libraryUs": libraryTime/len(events)*1e6,
+            "dispatcherUs": dispatcherTime/len(events)*1e6,
+            "speedup": libraryTime/dispatcherTime}
+
+# benchmark
+if __name__ == "__main__":
+    results = benchmark()
+    print("{} events against {} hotkeys".format(results["events"], len(FAKE_HOTKEYS)))
+    print("keyboard library : {:.3f} us/key".format(results["libraryUs"]))
+    print("dispatcher       : {:.3f} us/key ({:.1f}x faster)".format(results["dispatcherUs"], results["speedup"]))
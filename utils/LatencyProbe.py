@@ -0,0 +1,127 @@
+"""
+LatencyProbe.py
+
+Measures how long it takes for a keypress to turn into pixels on the overlay. Every dispatched hotkey action is
+traced through each stage it passes on its way to the screen, and the time from the hook receiving the key to
+each stage is collected into per action histograms that can be reported as percentiles.
+"""
+import math
+import os
+import time
+
+class LatencyHistogram():
+    """
+        A log-bucketed histogram of latencies (in seconds). Buckets grow geometrically, so percentiles are accurate
+        to within the given relative resolution no matter the magnitude, while memory stays constant.
+    """
+    def __init__(self, *, resolution: float = 0.02, minValue: float = 1e-6):
+        self.MIN_VALUE = minValue
+        self.LOG_BASE = math.log(1 + resolution)
+        self.buckets = dict()
+        self.count = 0
+        self.maxValue = 0.0
+
+    def record(self, value: float) -> None:
+        """ Adds a single latency sample to the histogram. """
+        bucketInd = int(math.log(max(value, self.MIN_VALUE)/self.MIN_VALUE)/self.LOG_BASE)
+        self.buckets[bucketInd] = self.buckets.get(bucketInd, 0) + 1
+        self.count += 1
+        self.maxValue = max(self.maxValue, value)
+
+    def percentile(self, pct: float) -> float:
+        """ Returns the (upper bound of the bucket holding the) given percentile of all samples. """
+        if self.count == 0:
+            return 0.0
+
+        targetCount = math.ceil(self.count*pct/100)
+        seenCount = 0
+        for bucketInd in sorted(self.buckets):
+            seenCount += self.buckets[bucketInd]
+            if seenCount >= targetCount:
+                return min(self.MIN_VALUE*math.exp((bucketInd + 1)*self.LOG_BASE), self.maxValue)
+        return self.maxValue
+
+class LatencyProbe():
+    """
+        Traces hotkey actions through the following stages:
+            hook     - the key reached ModKeyListener's hook and the action was queued
+            dispatch - the tk loop picked the action up
+            action   - the overlay action finished running
+            set      - the last widget value (StringVar.set or dot image) was pushed by the action
+            redraw   - tk finished redrawing the changed widgets (in the idle turn after the action)
+
+        Only one action runs at a time on the tk loop, so widgets can simply report to whatever trace is active.
+        Widget updates are usually deferred to the end of the event loop turn (see RenderCoalescer), so traces
+        that have finished running but are still waiting on their redraw get the set stage as well.
+    """
+    def __init__(self, root, *, reportDir: str = "./logs"):
+        self.root = root
+        self.REPORT_DIR = reportDir
+        self.STAGES = ["dispatch", "action", "set", "redraw"]
+
+        # Histograms are keyed by (action name, stage) and hold the time since the hook saw the key
+        self.histograms = dict()
+        self.activeTrace = None
+        self.redrawingTraces = list()
+
+    def beginAction(self, actionName: str, hookTime: float) -> None:
+        """ Starts tracing an action that is just about to be run. hookTime is in perf_counter seconds. """
+        self.activeTrace = {"name": actionName, "hook": hookTime, "dispatch": time.perf_counter()}
+
+    def markSet(self) -> None:
+        """ Called right after new values are pushed to widgets. Ignored while no action is being traced. """
+        setTime = time.perf_counter()
+        if self.activeTrace is not None:
+            self.activeTrace["set"] = setTime
+        for trace in self.redrawingTraces:
+            trace["set"] = setTime
+
+    def endAction(self) -> None:
+        """ Marks the end of the traced action and waits for the next idle turn to close the trace. """
+        trace = self.activeTrace
+        if trace is None:
+            return
+        self.activeTrace = None
+        trace["action"] = time.perf_counter()
+        self.redrawingTraces.append(trace)
+        self.root.after_idle(lambda : self.finishTrace(trace))
+
+    def finishTrace(self, trace: dict) -> None:
+        """ Stamps the redraw stage and records every stage of the trace into its histogram. """
+        # tk only queues its redraws once the values are pushed, which may well be after we were queued
+        # ourselves, so let every pending redraw run before calling the trace redrawn
+        self.root.update_idletasks()
+        trace["redraw"] = time.perf_counter()
+        self.redrawingTraces.remove(trace)
+        for stage in self.STAGES:
+            if stage in trace:
+                histKey = (trace["name"], stage)
+                if histKey not in self.histograms:
+                    self.histograms[histKey] = LatencyHistogram()
+                self.histograms[histKey].record(trace[stage] - trace["hook"])
+
+    def hasSamples(self) -> bool:
+        return len(self.histograms) > 0
+
+    def getReport(self) -> str:
+        """ Builds a table of p50/p95/p99 (in ms from the hook) for every action and stage seen so far. """
+        lines = ["{:<16}{:<10}{:>8}{:>10}{:>10}{:>10}{:>10}".format("Action", "Stage", "Count", "p50", "p95", "p99", "max")]
+        actionNames = sorted({actionName for actionName, _ in self.histograms})
+        for actionName in actionNames:
+            for stage in self.STAGES:
+                hist = self.histograms.get((actionName, stage))
+                if hist is None:
+                    continue
+                lines.append("{:<16}{:<10}{:>8}{:>10.3f}{:>10.3f}{:>10.3f}{:>10.3f}".format(
+                             actionName, stage, hist.count, hist.percentile(50)*1000, hist.percentile(95)*1000,
+                             hist.percentile(99)*1000, hist.maxValue*1000))
+        return "\n".join(lines)
+
+    def dumpReport(self) -> str:
+        """ Writes the current report to a timestamped file in the report directory and returns its path. """
+        os.makedirs(self.REPORT_DIR, exist_ok = True)
+        reportPath = os.path.join(self.REPORT_DIR, "latency_{}.txt".format(time.strftime("%Y%m%d-%H%M%S")))
+        with open(reportPath, "w") as reportFile:
+            reportFile.write("Keypress to redraw latency (ms since hook)\n")
+            reportFile.write(self.getReport() + "\n")
+        return reportPath
@@ -0,0 +1,184 @@
+"""
+LoopMonitor.py
+
+A watchdog on the tk event loop itself. A heartbeat is scheduled with after() at a fixed interval and every beat
+records how late it fired compared to when it was due, and how long the rest of that loop turn took (the time from
+the beat until tk went idle again). The tick engine reports every one of its passes as well, so the lateness of the
+timers' own after() chain is recorded next to the heartbeat's.
+
+Anything later than the stall threshold is flagged as a stall. Every sample is stamped with the wall clock, so an
+exported log can be lined up against whatever the game and OS were doing at the time.
+"""
+import collections
+import csv
+import os
+import time
+import tkinter as tk
+from utils.Theme import getThemeManager
+
+class LoopMonitor():
+    """
+        Samples the health of the event loop while it is running (see start/stop). Only the last logSize samples
+        are kept. Every sample holds:
+            wallTime - time.time() when it was taken
+            kind     - "beat" (heartbeat), "tick" (tick engine pass) or "stall" (either of them, over the threshold)
+            lateMs   - how late the callback fired compared to its target
+            turnMs   - how long the loop turn took (beats) or how long the pass took (ticks)
+            pending  - after() callbacks pending in tk
+            armed    - timers with a pending deadline on the tick engine (each is one logical timer chain)
+
+        Listeners (e.g. a LoopMonitorHUD) are called after every beat.
+    """
+    def __init__(self, root, *, engine: "TickEngine" = None, interval: int = 50, stallThreshold: float = 0.1,
+                 logSize: int = 100000, reportDir: str = "./logs"):
+        self.root = root
+        self.engine = engine
+        self.INTERVAL = interval # ms between heartbeats
+        self.STALL_THRESHOLD = stallThreshold # s
+        self.REPORT_DIR = reportDir
+        self.RATE_WINDOW = 1.0 # s over which ticks per second are counted
+
+        self.samples = collections.deque(maxlen = logSize)
+        self.listeners = list()
+        self.nextCallback = None
+        self.beatTarget = None
+
+        # Running figures for the HUD
+        self.lastLateness = 0.0
+        self.worstLateness = 0.0
+        self.lastTurn = 0.0
+        self.stallCount = 0
+        self.lastStallTime = None
+        self.tickTimes = collections.deque()
+
+    @property
+    def running(self) -> bool:
+        return self.nextCallback is not None
+
+    def start(self) -> None:
+        """ Starts the heartbeat and starts listening to the tick engine. """
+        if self.running:
+            return
+        if self.engine is not None:
+            self.engine.monitor = self
+        self.scheduleBeat()
+
+    def stop(self) -> None:
+        """ Stops the heartbeat. Everything sampled so far is kept until the next start. """
+        if self.nextCallback is not None:
+            self.root.after_cancel(self.nextCallback)
+            self.nextCallback = None
+        if self.engine is not None and self.engine.monitor is self:
+            self.engine.monitor = None
+
+    def reset(self) -> None:
+        """ Forgets every sample and the worst lateness seen so far. """
+        self.samples.clear()
+        self.tickTimes.clear()
+        self.worstLateness = 0.0
+        self.stallCount = 0
+        self.lastStallTime = None
+
+    def scheduleBeat(self) -> None:
+        self.beatTarget = time.perf_counter() + self.INTERVAL/1000
+        self.nextCallback = self.root.after(self.INTERVAL, self.beat)
+
+    def beat(self) -> None:
+        """ Records how late the heartbeat fired and waits for the loop to go idle to time the rest of the turn. """
+        beatTime = time.perf_counter()
+        self.nextCallback = None
+        lateness = max(0.0, beatTime - self.beatTarget)
+        self.root.after_idle(lambda : self.finishBeat(beatTime, lateness))
+        self.scheduleBeat()
+
+    def finishBeat(self, beatTime: float, lateness: float) -> None:
+        """ Closes the sample of a heartbeat once tk has gone idle. """
+        self.lastLateness = lateness
+        self.lastTurn = time.perf_counter() - beatTime
+        self.addSample("beat", lateness, self.lastTurn)
+        for listener in list(self.listeners):
+            listener()
+
+    def recordTick(self, lateness: float, passTime: float) -> None:
+        """ Called by the tick engine after every pass. """
+        self.tickTimes.append(time.perf_counter())
+        self.addSample("tick", lateness, passTime)
+
+    def addSample(self, kind: str, lateness: float, turnTime: float) -> None:
+        self.worstLateness = max(self.worstLateness, lateness)
+        if lateness > self.STALL_THRESHOLD:
+            kind = "stall"
+            self.stallCount += 1
+            self.lastStallTime = time.perf_counter()
+        self.samples.append((time.time(), kind, lateness*1000, turnTime*1000, self.getPendingCount(), self.getArmedCount()))
+
+    def getPendingCount(self) -> int:
+        """ Returns the number of after() callbacks tk has pending. """
+        return len(self.root.tk.splitlist(self.root.tk.call("after", "info")))
+
+    def getArmedCount(self) -> int:
+        """ Returns the number of timers waiting on a deadline of the tick engine. """
+        if self.engine is None:
+            return 0
+        return sum(1 for timer in self.engine.timers if timer.nextDeadline is not None)
+
+    def getTickRate(self) -> float:
+        """ Returns the tick engine passes per second over the last second. """
+        windowStart = time.perf_counter() - self.RATE_WINDOW
+        while self.tickTimes and self.tickTimes[0] < windowStart:
+            self.tickTimes.popleft()
+        return len(self.tickTimes)/self.RATE_WINDOW
+
+    def isStalled(self, *, within: float = 2.0) -> bool:
+        """ Whether a stall was flagged in the last `within` seconds. """
+        return self.lastStallTime is not None and time.perf_counter() - self.lastStallTime < within
+
+    def associateListener(self, callback: callable) -> None:
+        """ Calls the given callback after every heartbeat. """
+        self.listeners.append(callback)
+
+    def removeListener(self, callback: callable) -> None:
+        if callback in self.listeners:
+            self.listeners.remove(callback)
+
+    def exportLog(self) -> str:
+        """ Writes every sample kept so far to a timestamped csv file in the report directory and returns its path. """
+        os.makedirs(self.REPORT_DIR, exist_ok = True)
+        logPath = os.path.join(self.REPORT_DIR, "loop_{}.csv".format(time.strftime("%Y%m%d-%H%M%S")))
+        with open(logPath, "w", newline = "") as logFile:
+            logWriter = csv.writer(logFile)
+            logWriter.writerow(["wallTime", "localTime", "kind", "lateMs", "turnMs", "pending", "armed"])
+            for wallTime, kind, lateMs, turnMs, pending, armed in self.samples:
+                localTime = time.strftime("%H:%M:%S", time.localtime(wallTime)) + ".{:03d}".format(int(wallTime % 1*1000))
+                logWriter.writerow(["{:.3f}".format(wallTime), localTime, kind, "{:.3f}".format(lateMs), "{:.3f}".format(turnMs), pending, armed])
+        return logPath
+
+class LoopMonitorHUD():
+    """
+        A small label in the bottom right corner of a window showing the current lag, the worst lag and the tick
+        engine passes per second. It turns red for a while after a stall. The label is placed on top of whatever
+        else is in the window, so it works the same for every overlay layout.
+    """
+    def __init__(self, master: tk.Misc, monitor: LoopMonitor, *, refreshInterval: float = 0.25):
+        self.monitor = monitor
+        self.REFRESH_INTERVAL = refreshInterval # s between redraws, the monitor beats much more often than that
+        self.lastRefresh = 0.0
+
+        self.hudText = tk.StringVar(master, value = "lag -- ms")
+        self.hudLab = tk.Label(master, textvariable = self.hudText, font = ("Helvetica", 8), fg = "black", bg = "#dddddd")
+        self.hudLab.place(relx = 1.0, rely = 1.0, anchor = "se")
+        getThemeManager(master).excludeOption(self.hudLab, "foreground")
+        self.monitor.associateListener(self.refresh)
+
+    def refresh(self) -> None:
+        curTime = time.perf_counter()
+        if curTime - self.lastRefresh < self.REFRESH_INTERVAL:
+            return
+        self.lastRefresh = curTime
+        self.hudText.set("lag {:.0f} ms  worst {:.0f} ms  {:.1f} ticks/s".format(
+                         self.monitor.lastLateness*1000, self.monitor.worstLateness*1000, self.monitor.getTickRate()))
+        self.hudLab.configure(fg = "red" if self.monitor.isStalled() else "black")
+
+    def destroy(self) -> None:
+        self.monitor.removeListener(self.refresh)
+        self.hudLab.destroy()
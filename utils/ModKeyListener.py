@@ -1,146 +1,257 @@
 """
 ModKeyListener.py
 
-A class that is able to manage the recordings of various listeners. Keep in mind that these listeners do not have any
-timers set to them, so the moment a new listener is created it will run until it records any number of modifiers plus
-one non-modifier.
+A class that is able to manage the recordings of various listeners. Every capture is a session that records any
+number of modifiers plus one non-modifier, and then detaches itself (or gives up once its timeout runs out).
+
+All captures and hotkeys share a single keyboard hook, which is only installed while something needs it. Hotkeys
+can be bound under a namespace (one per overlay), so every overlay can drop its own hotkeys without touching the rest.
 """
-import keyboard
+import threading
 import time
+from utils.Startup import lazyImport
+from utils.HotkeyDispatcher import HotkeyDispatcher
+
+# The keyboard library is fairly heavy to import, and nothing needs it until a hook or capture is created
+keyboard = lazyImport("keyboard")
+
+class CaptureSession():
+    """
+        A single capture. Modifiers are collected as they are pressed (and dropped as they are released) until a
+        non-modifier is pressed, at which point the session holds the whole combination (e.g. "ctrl+shift+a").
+    """
+    def __init__(self, sid: int, onCapture: callable = None, onTimeout: callable = None):
+        self.sid = sid
+        self.onCapture = onCapture
+        self.onTimeout = onTimeout
+        self.modSet = set()
+        self.keyCombo = None
+        self.timeoutTimer = None
+
+    def feed(self, event: "keyboard.KeyboardEvent") -> bool:
+        """ Takes a single key event and returns whether the combination is now complete. """
+        if keyboard.is_modifier(event.scan_code):
+            if event.event_type == keyboard.KEY_DOWN:
+                self.modSet.add(event.name)
+            else:
+                # the modifier may well have been held since before the capture started
+                self.modSet.discard(event.name)
+            return False
+
+        # Releasing a key that was pressed before the capture started is not a capture
+        if event.event_type != keyboard.KEY_DOWN:
+            return False
+
+        self.keyCombo = "".join((mod+"+" for mod in self.modSet)) + event.name
+        return True
 
 class ModKeyListener():
     '''
-        Recreates the functionality of a key capturing screen. Essentially waits for an
-        indefinite amount of time until a whole key sequence consisting of N modifiers and
-        a single non-modifier is seen and is then no longer capturing.
+        Recreates the functionality of a key capturing screen. Any number of captures can run at the same
+        time; each one waits until a whole key sequence consisting of N modifiers and a single non-modifier
+        is seen (or until its timeout) and is then no longer capturing.
     '''
-    def __init__(self, * , debugFlag: bool = False):
-        # First set up our class variables
+    def __init__(self, * , debugFlag: bool = False, actionQueue: "ActionQueue" = None, hookKeyboard: bool = True):
+        # First set up our class variables. Finished captures only leave their combination behind in keysFound
         self.keysFound = dict()
-        self.listeners = list()
+        self.captureSessions = dict()
+        self.nextSid = 0
         self.hotkeyListeners = dict()
 
+        # Hotkeys are matched by us rather than by keyboard.add_hotkey so that recorded traces can be fed through
+        # exactly the same matching (see processEvent), and so that a single hook can turn away unbound keys as
+        # cheaply as possible (see HotkeyDispatcher). Modifiers that look stuck are checked against the keyboard
+        # library's own key state, but only for live input
+        pressedCheck = (lambda scanCode : keyboard.is_pressed(scanCode)) if hookKeyboard else None
+        self.dispatcher = HotkeyDispatcher(pressedCheck = pressedCheck)
+
+        # The one hook shared by captures and hotkeys. Sessions are started/cancelled on the tk loop but finish
+        # on the hook thread (or a timeout thread), so changes to them are made under a lock and always swap in
+        # a new dict, which lets the hook read it without ever locking
+        self.keyboardHook = None
+        self.hookKeyboard = hookKeyboard
+        self.sessionLock = threading.Lock()
+
+        # Hotkey callbacks run on the hook thread, so when given a queue we only post to it and let
+        # the tk loop run the actual callback
+        self.actionQueue = actionQueue
+
         # And then our consts
-        self.lInit = lambda : keyboard.hook(self.createGlobalQueueListener(self.keysFound, len(self.listeners)))
         self.debug = debugFlag
 
     def checkCaptureStatus(self, sid: int) -> bool:
         """ Reports whether or not the capture has terminated (written a value to the keysFound var) """
         return self.keysFound[sid] is not None
-    
+
     def getCapturedKey(self, sid: int) -> str:
         """ Returns a string representation of the captured key config """
         return self.keysFound[sid]
 
-    def startNewCapture(self) -> int:
+    def startNewCapture(self, onCapture: callable = None, *, timeout: float = None, onTimeout: callable = None) -> int:
+        """
+            Initializes a new capturing session and returns its SID.
+
+            If given, onCapture(sid, keyCombination) is called once the combination has been recorded. With
+            a timeout (in seconds) the session gives up on its own if nothing was recorded in time, calling
+            onTimeout(sid) if given. With an action queue attached both calls happen on the tk loop, so there
+            is no need to poll checkCaptureStatus.
+        """
+        with self.sessionLock:
+            sid = self.nextSid
+            self.nextSid += 1
+            session = CaptureSession(sid, onCapture, onTimeout)
+            self.keysFound[sid] = None
+            self.captureSessions = {**self.captureSessions, sid: session}
+            self.updateHook()
+
+        if timeout is not None:
+            session.timeoutTimer = threading.Timer(timeout, self.expireCapture, (sid,))
+            session.timeoutTimer.daemon = True
+            session.timeoutTimer.start()
+        return sid
+
+    def endCapture(self, sid: int) -> CaptureSession | None:
+        """
+            Detaches a session and returns it, or returns None if it had already ended. Whichever of
+            capture/timeout/cancel gets here first is the only one that gets the session.
+        """
+        with self.sessionLock:
+            session = self.captureSessions.get(sid)
+            if session is None:
+                return None
+            self.captureSessions = {curSid:curSession for curSid, curSession in self.captureSessions.items() if curSid != sid}
+            self.updateHook()
+
+        if session.timeoutTimer is not None:
+            session.timeoutTimer.cancel()
+        return session
+
+    def cancelCapture(self, sid: int) -> None:
         """
-            Initializes a new capturing mechanism and returns the SID of the listening mechanism.
+            Stops a single capture without waiting for it to record anything. Its completion callback
+            will never be called.
         """
-        self.listeners.append(self.lInit())
-        return len(self.listeners)-1
+        self.endCapture(sid)
+
+    def expireCapture(self, sid: int) -> None:
+        """ Runs on the timeout thread once a session has waited too long. """
+        session = self.endCapture(sid)
+        if session is None:
+            return
+        if self.debug:
+            print("Listener (sid:{}) timed out".format(sid))
+        if session.onTimeout is not None:
+            self.notify(lambda : session.onTimeout(sid), "Hotkey Capture")
 
     def removeCaptures(self) -> None:
         """
-            Removes any listeners currently active.
+            Removes any captures currently active along with every recorded combination.
         """
-        # First use the callback to remove all listeners regardless of state
-        for listener in self.listeners:
-            keyboard.unhook(listener)
+        for sid in list(self.captureSessions.keys()):
+            self.endCapture(sid)
 
         # then delete all saved keys found
         for key in list(self.keysFound.keys()):
             del self.keysFound[key]
 
-        # And clean the listener list
-        self.listeners = list()
-
     def getKeyCombinations(self) -> dict[int, str]:
         """
             Returns a dictionary representing the found keys along with the sids of the listeners
             that recorded them.
         """
         return self.keysFound.copy()
-    
+
     def getTotalCaptureCount(self) -> int:
         """
-            Returns the number of captures that are currently ongoing or have terminated and have
-            saved their resposnes.
+            Returns the number of captures that have been started so far.
         """
-        return len(self.listeners)
+        return self.nextSid
 
-    def createGlobalQueueListener(self, kObj: dict, sid: int = 0) -> callable:
-        """ 
-            Creates a set that allows us to listen to key combinations that are 
-            pressed from the keyboard. This allows us to infer complex key combinations
-            that were pressed. Note that it only captures a single key combination into kObj
-            and repeated calls must be made in order to capture more.
+    def getActiveCaptureCount(self) -> int:
+        """ Returns the number of captures still waiting for a combination. """
+        return len(self.captureSessions)
 
-            In order to ensure that listeners do not overwrite the same variable,
-            an sid should be provided to prevent collisions.
-        """
-        # closure container
-        modSet = set()
-        nonModKey = None
-
-        # We would like to only register valid combinations where only modifiers and a single
-        # non-modifier key can be pressed, so we can set that up here.
-        isNonMod = lambda keyEvent: not keyboard.is_modifier(keyEvent.scan_code)
+    def notify(self, callback: callable, actionName: str) -> None:
+        """ Runs a callback on the tk loop if we have an action queue, or right away otherwise. """
+        if self.actionQueue is not None:
+            self.actionQueue.post(callback, actionName)
+        else:
+            callback()
 
-        # Since we created a new object, we should also let our class know of its future
-        # availability
-        self.keysFound[sid] = None
+    def updateHook(self) -> None:
+        """ Installs the shared hook while any capture or hotkey needs it, and removes it otherwise. """
+        hookNeeded = bool(self.captureSessions) or bool(self.hotkeyListeners)
+        if not self.hookKeyboard or hookNeeded == (self.keyboardHook is not None):
+            return
+        if hookNeeded:
+            # Whatever was held down when the hook went away may well have been released since
+            self.dispatcher.resetHeld()
+            self.keyboardHook = keyboard.hook(self.processEvent)
+        else:
+            keyboard.unhook(self.keyboardHook)
+            self.keyboardHook = None
 
-        def queueModifier(event : keyboard.KeyboardEvent) -> None:
-            """
-                Takes a keyboard event and appends it to the pressed set if it is a key down
-                or removes it on key up.
-            """
-            # reference adjustment
-            nonlocal nonModKey
-
-            # If we have our non-mod key already set, then don't bother capturing anymore
-            if nonModKey is not None:
-                return
+    def createHotkeyCallback(self, hotkey: str, callback: callable, actionName: str = None, *,
+                             cooldown: float = 0.0, coalesce: bool = False, namespace: str = None) -> None:
+        """
+            Creates a global callback for a given hotkey and adds the callback to the class
+            for potential removal. If the class was given an action queue, the callback is
+            posted to it (under actionName) instead of being run on the hook thread.
 
-            # manage key ups
-            if(event.event_type == keyboard.KEY_UP) and not isNonMod(event):
-                modSet.remove(event.name)
-            else:
-                # and register key downs
-                if isNonMod(event):
-                    nonModKey = event.name
+            The callback only fires when the hotkey is first pressed (not while it is held), and never
+            twice within the cooldown (in seconds). Coalesced callbacks are not queued again while one is
+            still waiting to run (see ActionQueue.post).
+        """
+        if self.actionQueue is not None:
+            # Namespaced actions are queued under their own name so they never coalesce with another namespace's
+            queueName = actionName if actionName is not None else hotkey
+            if namespace is not None:
+                queueName = "{}:{}".format(namespace, queueName)
+            callback = self.actionQueue.wrap(callback, queueName, coalesce = coalesce)
 
-                    # And add it to our kObj[sid] to note the combination
-                    kObj[sid] = "".join((mod+"+" for mod in modSet)) + nonModKey
-                    if self.debug:
-                        print("Listener (sid:{}) recorded key combination : {}".format(sid, kObj[sid]))
-                else:
-                    modSet.add(event.name)
+        self.dispatcher.bind(hotkey.lower(), callback, cooldown = cooldown, namespace = namespace)
+        self.hotkeyListeners[(namespace, hotkey.lower())] = callback
+        with self.sessionLock:
+            self.updateHook()
 
-        return queueModifier
-    
-    def createHotkeyCallback(self, hotkey: str, callback: callable) -> None:
+    def processEvent(self, event: "keyboard.KeyboardEvent") -> None:
         """
-            Creates a global callback for a given hotkey and adds the callback to the class
-            for potential removal.
+            Fans a key event out to every running capture and then runs every hotkey bound to it. This is called
+            on the hook thread for live input, and by TraceReplay for recorded input.
         """
-        self.hotkeyListeners[hotkey.lower()] = (keyboard.add_hotkey(hotkey.lower(), callback = callback))
+        # Only running sessions are ever looked at, so finished captures cost nothing
+        captureSessions = self.captureSessions
+        if captureSessions:
+            for session in captureSessions.values():
+                if session.feed(event) and self.endCapture(session.sid) is not None:
+                    self.keysFound[session.sid] = session.keyCombo
+                    if self.debug:
+                        print("Listener (sid:{}) recorded key combination : {}".format(session.sid, session.keyCombo))
+
+                    # And let whoever started the capture know that it has completed
+                    if session.onCapture is not None:
+                        self.notify(lambda session = session : session.onCapture(session.sid, session.keyCombo), "Hotkey Capture")
 
-    def removeHotkeyListeners(self) -> None:
+        self.dispatcher.processEvent(event)
+
+    def removeHotkeyListeners(self, namespace: str = None) -> None:
         """
-            Removes all hotkey listeners that are currently active.
+            Removes all hotkey listeners that are currently active (or only those bound under the given namespace).
         """
-        # destroy the listener
-        for listener in self.hotkeyListeners.values():
-            keyboard.remove_hotkey(listener)
-
-        # And erase all references
-        self.hotKeyListeners = dict()
+        # erase all references (and drop the hook unless a capture still needs it)
+        if namespace is not None:
+            self.hotkeyListeners = {listenerKey:callback for listenerKey, callback in self.hotkeyListeners.items() if listenerKey[0] != namespace}
+        else:
+            self.hotkeyListeners = dict()
+        self.dispatcher.clear(namespace)
+        with self.sessionLock:
+            self.updateHook()
 
 # smoke test
 if __name__ == "__main__":
     test = ModKeyListener(debugFlag=True)
+    test.startNewCapture(timeout = 10)
     test.startNewCapture()
 
     while(True):
-        time.sleep(100000)
\ No newline at end of file
+        time.sleep(100000)
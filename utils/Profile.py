@@ -0,0 +1,122 @@
+"""
+Profile.py
+
+Everything that has to be set up in the config window before a fight (timer lengths, red times, auto-resets and
+hotkeys) bundled into a profile that can be saved to disk and launched straight from the command line.
+
+Profiles are validated both when saved and when loaded, so a broken file is rejected before any window is created.
+Hotkeys are only checked for their spelling here; they are looked up on the actual keyboard when they are bound.
+They are stored as compact json holding the timer arguments exactly as the overlay expects them (see
+buildTimerArgs), so loading a profile is nothing more than a parse and a check.
+"""
+import json
+import os
+from utils.FightState import TIMER_NAMES, ACTION_NAMES, DEFAULT_INIT_TIMES, buildTimerArgs
+from utils.HotkeyDispatcher import splitHotkey
+
+PROFILE_VERSION = 1
+DEFAULT_PROFILE_PATH = "./profiles/default.json"
+
+# Where every overlay was last dragged to, kept next to the profiles
+DEFAULT_POSITIONS_PATH = "./profiles/positions.json"
+
+# Hotkeys that act on the app itself rather than on the fight, and every hotkey a profile may bind
+APP_HOTKEY_NAMES = ["Dump Latency", "Toggle Profiling", "Toggle Loop Monitor"]
+HOTKEY_NAMES = ACTION_NAMES + APP_HOTKEY_NAMES
+
+class Profile():
+    """
+        A validated set of timer arguments (as produced by buildTimerArgs) and hotkeys (setting name -> hotkey).
+        Settings without a hotkey are simply left out of the hotkeys.
+    """
+    def __init__(self, timerArgs: dict, hotkeys: dict[str, str]):
+        self.timerArgs = timerArgs
+        self.hotkeys = hotkeys
+        self.validate()
+
+    def validate(self) -> None:
+        """
+            Raises a ValueError describing the first problem found with the profile. Hotkeys are split into their
+            modifiers and key exactly like the overlay will bind them, but without looking any key up, so this
+            never needs the keyboard library.
+        """
+        if not isinstance(self.timerArgs, dict) or set(self.timerArgs) != set(TIMER_NAMES):
+            raise ValueError("Profile timers must be exactly: {}".format(", ".join(TIMER_NAMES)))
+
+        for timerName, timerArg in self.timerArgs.items():
+            if not isinstance(timerArg, dict) or set(timerArg) != {"initTime", "redTime", "autoReset"}:
+                raise ValueError("Timer '{}' needs exactly an initTime, redTime and autoReset".format(timerName))
+            initTime = timerArg["initTime"]
+            if not isinstance(initTime, list) or not initTime or not all(type(val) is int and val > 0 for val in initTime):
+                raise ValueError("Timer '{}' needs a list of positive initial times".format(timerName))
+            if type(timerArg["redTime"]) is not int or timerArg["redTime"] < 0:
+                raise ValueError("Timer '{}' needs a non-negative red time".format(timerName))
+            if type(timerArg["autoReset"]) is not bool:
+                raise ValueError("Timer '{}' needs a true/false auto-reset".format(timerName))
+
+        if not isinstance(self.hotkeys, dict):
+            raise ValueError("Profile hotkeys must map setting names to hotkeys")
+        for settingName, hotkey in self.hotkeys.items():
+            if settingName not in HOTKEY_NAMES:
+                raise ValueError("Unknown hotkey setting '{}'".format(settingName))
+            if not isinstance(hotkey, str) or not hotkey.strip():
+                raise ValueError("Hotkey for '{}' must be a non-empty string".format(settingName))
+            try:
+                splitHotkey(hotkey)
+            except ValueError as hotkeyError:
+                raise ValueError("Hotkey '{}' for '{}' is not valid: {}".format(hotkey, settingName, hotkeyError))
+
+    def toDict(self) -> dict:
+        return {"version": PROFILE_VERSION, "timers": self.timerArgs, "hotkeys": self.hotkeys}
+
+def getDefaultProfile() -> Profile:
+    """ A profile with the default timers and no hotkeys. """
+    return Profile(buildTimerArgs(DEFAULT_INIT_TIMES), dict())
+
+def saveProfile(profile: Profile, profilePath: str = DEFAULT_PROFILE_PATH) -> None:
+    """ Validates a profile and writes it to disk. """
+    profile.validate()
+    writeJson(profile.toDict(), profilePath)
+
+def writeJson(jsonDict: dict, jsonPath: str) -> None:
+    """ Writes compact json to disk, creating its directory if needed. """
+    jsonDir = os.path.dirname(jsonPath)
+    if jsonDir:
+        os.makedirs(jsonDir, exist_ok = True)
+
+    # Write to a temporary name first so that a crash never leaves a half written file behind
+    with open(jsonPath + ".tmp", "w") as jsonFile:
+        json.dump(jsonDict, jsonFile, separators = (",", ":"))
+    os.replace(jsonPath + ".tmp", jsonPath)
+
+def loadWindowPositions(positionsPath: str = DEFAULT_POSITIONS_PATH) -> dict[int, tuple[int, int]]:
+    """
+        Reads back where every overlay slot was last dragged to (slot -> (x, y)). Positions are a nicety, so a
+        missing or broken file simply means no positions (and a broken entry means no position for that slot).
+    """
+    try:
+        with open(positionsPath, "r") as positionsFile:
+            positionsDict = json.load(positionsFile)
+    except (OSError, ValueError):
+        return dict()
+    if not isinstance(positionsDict, dict):
+        return dict()
+
+    return {int(slot):tuple(position) for slot, position in positionsDict.items()
+            if slot.isdigit() and isinstance(position, list) and len(position) == 2 and all(type(coord) is int for coord in position)}
+
+def saveWindowPositions(positions: dict[int, tuple[int, int]], positionsPath: str = DEFAULT_POSITIONS_PATH) -> None:
+    """ Writes the position of every overlay slot to disk. """
+    writeJson({str(slot):list(position) for slot, position in positions.items()}, positionsPath)
+
+def loadProfile(profilePath: str = DEFAULT_PROFILE_PATH) -> Profile:
+    """ Reads a profile back from disk, raising a ValueError if it is not a valid profile. """
+    with open(profilePath, "r") as profileFile:
+        try:
+            profileDict = json.load(profileFile)
+        except json.JSONDecodeError as decodeError:
+            raise ValueError("{} is not a valid profile: {}".format(profilePath, decodeError))
+
+    if not isinstance(profileDict, dict) or profileDict.get("version") != PROFILE_VERSION:
+        raise ValueError("{} is not a version {} profile".format(profilePath, PROFILE_VERSION))
+    return Profile(profileDict.get("timers"), profileDict.get("hotkeys"))
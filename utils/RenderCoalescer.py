@@ -0,0 +1,107 @@
+"""
+RenderCoalescer.py
+
+Every widget update is a round-trip into Tcl, and the overlay tends to push the same values over and over (a
+timer that is re-rendered several times in one event, a color that has not changed since the last tick, ...).
+This layer sits between the views and tk: it remembers what was last pushed to every widget, drops updates that
+would not change anything, and holds on to the rest until a single flush at the end of the event loop turn.
+"""
+
+class RenderCoalescer():
+    """
+        Collects widget updates and pushes them in one after_idle flush per event loop turn. Updates are keyed by
+        the widget and option they touch, so only the latest value for each key is ever pushed, and a value equal
+        to the one already on screen is never pushed at all.
+
+        If given a LatencyProbe, every flush that pushes something is reported to it.
+    """
+    def __init__(self, root, *, probe: "LatencyProbe" = None):
+        # The tk object used to schedule flushes
+        self.root = root
+        self.probe = probe
+
+        # The values last pushed to tk, and those waiting for the next flush (key -> (setter, value))
+        self.pushedValues = dict()
+        self.pendingValues = dict()
+        self.flushCallback = None
+
+        # Counters so we can see how many Tcl calls this actually saves
+        self.requestedCount = 0
+        self.unchangedCount = 0
+        self.coalescedCount = 0
+        self.pushedCount = 0
+        self.flushCount = 0
+
+    def setText(self, widget, textVar, value: str, *, force: bool = False) -> None:
+        """
+            Sets the value of a tk variable on the next flush. The update is keyed by the widget showing the
+            variable rather than the variable itself, so forgetWidgets drops it along with the widget.
+        """
+        self.request((str(widget), "textvariable", str(textVar)), textVar.set, value, force)
+
+    def configure(self, widget, option: str, value, *, force: bool = False) -> None:
+        """ Configures a single option of a widget on the next flush. """
+        self.request((str(widget), option), lambda newValue : widget.configure({option: newValue}), value, force)
+
+    def configureItem(self, canvas, itemId: int, option: str, value, *, force: bool = False) -> None:
+        """ Configures a single option of a canvas item on the next flush. """
+        self.request((str(canvas), itemId, option), lambda newValue : canvas.itemconfigure(itemId, {option: newValue}), value, force)
+
+    def request(self, key: tuple, setter: callable, value, force: bool = False) -> None:
+        """
+            Queues setter(value) to be run on the next flush unless the value already matches what is on screen.
+            Forced requests are always pushed.
+        """
+        self.requestedCount += 1
+
+        # Anything still pending for this key is superseded by the new value
+        if self.pendingValues.pop(key, None) is not None:
+            self.coalescedCount += 1
+
+        if not force and key in self.pushedValues and self.pushedValues[key] == value:
+            self.unchangedCount += 1
+            return
+
+        self.pendingValues[key] = (setter, value)
+        if self.flushCallback is None:
+            self.flushCallback = self.root.after_idle(self.flush)
+
+    def flush(self) -> None:
+        """ Pushes every pending update to tk. """
+        self.flushCallback = None
+        pendingValues, self.pendingValues = self.pendingValues, dict()
+
+        for key, (setter, value) in pendingValues.items():
+            setter(value)
+            self.pushedValues[key] = value
+        self.pushedCount += len(pendingValues)
+        self.flushCount += 1
+
+        if self.probe is not None and pendingValues:
+            self.probe.markSet()
+
+    def cancel(self) -> None:
+        """ Drops every pending update (used when the widgets are about to be destroyed). """
+        if self.flushCallback is not None:
+            self.root.after_cancel(self.flushCallback)
+            self.flushCallback = None
+        self.pendingValues = dict()
+
+    def forgetWidgets(self, widget) -> None:
+        """
+            Drops everything pending for and remembered about the given widget and every widget inside of it
+            (used when a window shared with other windows is about to be destroyed).
+        """
+        widgetPath = str(widget)
+        isInside = lambda key : key[0] == widgetPath or key[0].startswith(widgetPath + ".")
+        self.pendingValues = {key:pending for key, pending in self.pendingValues.items() if not isInside(key)}
+        self.pushedValues = {key:value for key, value in self.pushedValues.items() if not isInside(key)}
+
+    def getStats(self) -> dict[str, int]:
+        """ Reports how many updates were requested, how many reached tk and how many Tcl calls were saved. """
+        return {"requested": self.requestedCount,
+                "pushed": self.pushedCount,
+                "unchanged": self.unchangedCount,
+                "coalesced": self.coalescedCount,
+                "flushes": self.flushCount,
+                "tclCallsSaved": self.requestedCount - self.pushedCount - len(self.pendingValues)}
@@ -0,0 +1,76 @@
+"""
+Startup.py
+
+Helpers for getting the program usable as quickly as possible: modules that are expensive to import can be
+imported lazily (only executed on first use), and every startup phase can be timed so that we can see where the
+time actually goes.
+"""
+import importlib.util
+import sys
+import time
+
+def lazyImport(moduleName: str):
+    """
+        Returns a module whose code only runs the first time one of its attributes is used. Modules that have
+        already been imported are returned as is.
+    """
+    if moduleName in sys.modules:
+        return sys.modules[moduleName]
+
+    spec = importlib.util.find_spec(moduleName)
+    if spec is None:
+        raise ImportError("No module named '{}'".format(moduleName), name = moduleName)
+
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[moduleName] = module
+    loader.exec_module(module)
+    return module
+
+class StartupTimer():
+    """
+        Records how long each phase of startup took. Phases are marked as they finish, so each one covers the
+        time since the previous mark (or since this module was first imported).
+    """
+    def __init__(self):
+        self.startTime = time.perf_counter()
+        self.lastTime = self.startTime
+        self.phases = list()
+        self.enabled = False
+
+    def mark(self, phaseName: str) -> None:
+        """ Closes the current phase under the given name. """
+        curTime = time.perf_counter()
+        self.phases.append((phaseName, curTime - self.lastTime))
+        self.lastTime = curTime
+
+    def getElapsed(self) -> float:
+        """ Seconds since startup began. """
+        return time.perf_counter() - self.startTime
+
+    def getElapsedSince(self, phaseName: str) -> float:
+        """ Seconds since the given phase began. """
+        phaseStart = self.startTime
+        for curName, phaseTime in self.phases:
+            if curName == phaseName:
+                return time.perf_counter() - phaseStart
+            phaseStart += phaseTime
+        raise KeyError(phaseName)
+
+    def getReport(self) -> str:
+        """ Formats every phase (in ms) along with the running total. """
+        lines = ["{:<28}{:>10}{:>10}".format("Startup phase", "ms", "total")]
+        runningTotal = 0.0
+        for phaseName, phaseTime in self.phases:
+            runningTotal += phaseTime
+            lines.append("{:<28}{:>10.1f}{:>10.1f}".format(phaseName, phaseTime*1000, runningTotal*1000))
+        return "\n".join(lines)
+
+    def printReport(self) -> None:
+        """ Prints the breakdown if timings were requested. """
+        if self.enabled:
+            print(self.getReport())
+
+# The one timer used by the whole program; it starts counting as soon as anything imports this module
+startupTimer = StartupTimer()
@@ -0,0 +1,143 @@
+"""
+Theme.py
+
+The colors of every window are set through the tk option database instead of by walking the widget tree once it
+has been built. Options are looked up by tk itself as each widget is created, so a widget comes out in the right
+colors without a single extra call from Python.
+
+Changing the theme of windows that already exist is done by a small Tcl procedure that walks the tree inside the
+interpreter (one call from Python no matter how many widgets there are) and only reconfigures the widgets that are
+still showing the old theme colors. Widgets that were given colors of their own are left alone, and so are options
+that were excluded from the theme (e.g. the foreground of timer labels, which shows the state of the timer). Anything that is not
+a widget option (canvas items, ...) is updated by whoever drew it through a theme callback.
+"""
+import weakref
+import tkinter as tk
+
+# Widget classes that follow the theme (the ones the old changeColor walk used to recolor), along with the
+# options of each that the theme sets
+THEMED_CLASSES = {"Frame": ["background"],
+                  "Toplevel": ["background"],
+                  "Label": ["background", "foreground"],
+                  "Canvas": ["background"]}
+
+# The priority theme options are added at, which is above anything from the user's X resources like the old walk
+# was. Anything given explicitly at creation still wins
+THEME_PRIORITY = "interactive"
+
+# Reconfigures every themed widget under a window whose option still has its old value, skipping the excluded
+# options (a dict of path -> options). Returns how many options were changed
+RETHEME_PROC = """
+proc ::ktimerRetheme {window classOptions oldValues newValues excluded} {
+    set changed 0
+    set pending [list $window]
+    while {[llength $pending]} {
+        set widget [lindex $pending end]
+        set pending [lreplace $pending end end]
+        lappend pending {*}[winfo children $widget]
+        set widgetClass [winfo class $widget]
+        if {![dict exists $classOptions $widgetClass]} {
+            continue
+        }
+        set skipped [expr {[dict exists $excluded $widget] ? [dict get $excluded $widget] : {}}]
+        foreach option [dict get $classOptions $widgetClass] {
+            if {$option ni $skipped && [$widget cget -$option] eq [dict get $oldValues $option]} {
+                $widget configure -$option [dict get $newValues $option]
+                incr changed
+            }
+        }
+    }
+    return $changed
+}
+"""
+
+class Theme():
+    """ The colors windows are drawn in. """
+    def __init__(self, background: str = "#999999", foreground: str = "black"):
+        self.background = background
+        self.foreground = foreground
+
+    def getOptions(self) -> dict[str, str]:
+        """ Returns the value of every option a theme sets (option name -> value). """
+        return {"background": self.background, "foreground": self.foreground}
+
+DEFAULT_THEME = Theme()
+
+class ThemeManager():
+    """
+        Keeps the theme of one tk application. Every widget created after the theme is installed picks it up on
+        its own, and setTheme restyles the existing windows in place.
+    """
+    def __init__(self, root: tk.Tk, theme: Theme = DEFAULT_THEME):
+        self.root = root
+        self.theme = None
+        self.root.tk.eval(RETHEME_PROC)
+        themeManagers[root] = self
+
+        # Options that widgets keep to themselves (path -> option names), and everyone to tell about theme changes
+        self.excludedOptions = dict()
+        self.themeCallbacks = list()
+
+        # How many options the last theme change touched
+        self.lastChangedCount = 0
+        self.installTheme(theme)
+
+    def installTheme(self, theme: Theme) -> None:
+        """ Puts the theme in the option database (for every widget created from now on) and on the root. """
+        self.theme = theme
+        themeOptions = theme.getOptions()
+        for widgetClass, options in THEMED_CLASSES.items():
+            for option in options:
+                self.root.option_add("*{}.{}".format(widgetClass, option), themeOptions[option], THEME_PRIORITY)
+        self.root.configure(background = theme.background)
+
+    def excludeOption(self, widget: tk.Misc, option: str) -> None:
+        """ Keeps an option of a widget out of every future theme change. """
+        self.excludedOptions.setdefault(str(widget), list()).append(option)
+
+    def associateThemeCallback(self, callback: callable) -> None:
+        """ Calls the given callback with the new theme after every theme change. """
+        self.themeCallbacks.append(callback)
+
+    def removeThemeCallback(self, callback: callable) -> None:
+        if callback in self.themeCallbacks:
+            self.themeCallbacks.remove(callback)
+
+    def setTheme(self, theme: Theme) -> int:
+        """
+            Switches to a new theme, restyling every existing window along the way. Returns how many widget
+            options actually had to change.
+        """
+        oldOptions = self.theme.getOptions()
+        newOptions = theme.getOptions()
+        changedOptions = {option for option in newOptions if newOptions[option] != oldOptions[option]}
+        self.installTheme(theme)
+        self.lastChangedCount = 0
+        if not changedOptions:
+            return 0
+
+        # Only the options that changed are looked at, and only on the classes that use them. The walk starts at
+        # the root, whose children include every other window
+        classOptions = {widgetClass:[option for option in options if option in changedOptions] for widgetClass, options in THEMED_CLASSES.items()}
+        classOptions = {widgetClass:options for widgetClass, options in classOptions.items() if options}
+        self.excludedOptions = {widgetPath:options for widgetPath, options in self.excludedOptions.items()
+                                if self.root.tk.getboolean(self.root.tk.call("winfo", "exists", widgetPath))}
+        self.lastChangedCount = int(self.root.tk.call("::ktimerRetheme", ".", self.toTclDict(classOptions), self.toTclDict(oldOptions),
+                                                      self.toTclDict(newOptions), self.toTclDict(self.excludedOptions)))
+        for callback in list(self.themeCallbacks):
+            callback(theme)
+        return self.lastChangedCount
+
+    def toTclDict(self, pyDict: dict) -> tuple:
+        """ Flattens a dict (of strings or lists of strings) into a Tcl dict. """
+        return tuple(item for key, value in pyDict.items() for item in (key, tuple(value) if isinstance(value, list) else value))
+
+# One theme manager per tk application
+themeManagers = weakref.WeakKeyDictionary()
+
+def getThemeManager(widget: tk.Misc) -> ThemeManager:
+    """ Returns the theme manager of the application a widget belongs to, installing the default theme if needed. """
+    root = widget._root()
+    if root not in themeManagers:
+        ThemeManager(root)
+    return themeManagers[root]
@@ -0,0 +1,143 @@
+"""
+TickEngine.py
+
+A single tick source that drives every timer on an overlay. Rather than letting each timer run its own after()
+chain, the engine keeps exactly one callback armed for the earliest pending deadline and advances every timer
+that is due in one pass. Renders are held back until the pass is over so the overlay only redraws once per tick.
+"""
+import math
+import time
+
+class TickEngine():
+    """
+        Owns the one after() callback used by all registered timers. Timers only need to expose a nextDeadline
+        attribute (an absolute time in the engine's clock, or None when idle), an updateTimer(now) method that
+        processes every tick due by `now` and reports whether anything changed, and a render() method.
+
+        Passing None as the root gives a headless engine that never touches tk. It only records the deadline it
+        would have armed, and it is up to the owner to call runPass (see FightState.FightSimulator).
+
+        Given a LoopMonitor (see start), every pass is reported to it along with how late it ran.
+
+        Deadlines that land within the coalescing window of a pass are ticked in that same pass. Their deadlines
+        stay on their own grid, so pulling them a few milliseconds forward never adds drift, but timers started
+        together will always tick together.
+    """
+    def __init__(self, root, *, clock: callable = time.monotonic, coalesceWindow: float = 0.015):
+        # The tk object we schedule against along with the clock used for deadlines
+        self.root = root
+        self.clock = clock
+        self.COALESCE_WINDOW = coalesceWindow
+
+        # All timers that are driven by this engine
+        self.timers = list()
+
+        # The single pending callback and the deadline it was armed for
+        self.nextCallback = None
+        self.armedDeadline = None
+        self.inPass = False
+
+        # Some bookkeeping so we can confirm the engine keeps up
+        self.passCount = 0
+        self.updateCount = 0
+        self.lastLateness = 0.0
+        self.maxLateness = 0.0
+
+        # The LoopMonitor currently watching us (if any), which sets itself here when started
+        self.monitor = None
+
+    def register(self, timer) -> None:
+        """ Adds a timer to the engine. Its ticks will be driven from now on. """
+        self.timers.append(timer)
+        self.reschedule(timer)
+
+    def unregister(self, timer) -> None:
+        """ Removes a timer from the engine. """
+        if timer in self.timers:
+            self.timers.remove(timer)
+
+    def reschedule(self, timer) -> None:
+        """
+            Lets the engine know that a timer's deadline has changed. The callback only needs to be re-armed
+            if the new deadline is earlier than the one we are currently waiting on.
+        """
+        # Passes always re-arm once they are done, so there is nothing to do mid-pass
+        if self.inPass or timer.nextDeadline is None:
+            return
+
+        if self.armedDeadline is None or timer.nextDeadline < self.armedDeadline:
+            self.arm(timer.nextDeadline)
+
+    def arm(self, deadline: float) -> None:
+        """ Arms the single tk callback for the given absolute deadline. """
+        if self.nextCallback is not None:
+            self.root.after_cancel(self.nextCallback)
+
+        self.armedDeadline = deadline
+
+        # Headless engines (no root) are pumped by hand through runPass, usually on a virtual clock
+        if self.root is None:
+            return
+
+        delay = max(0, math.ceil((deadline - self.clock())*1000))
+        self.nextCallback = self.root.after(delay, self.runPass)
+
+    def runPass(self) -> None:
+        """
+            Advances every timer that is due, then renders all of the timers that changed in one batch and
+            re-arms for the next earliest deadline.
+        """
+        self.nextCallback = None
+        self.armedDeadline = None
+        passStart = time.perf_counter()
+        now = self.clock()
+        dueBy = now + self.COALESCE_WINDOW
+
+        # Keep track of how late we are relative to the earliest deadline that was actually due
+        dueDeadlines = [timer.nextDeadline for timer in self.timers if timer.nextDeadline is not None and timer.nextDeadline <= now]
+        passLateness = 0.0
+        if dueDeadlines:
+            passLateness = self.lastLateness = now - min(dueDeadlines)
+            self.maxLateness = max(self.maxLateness, self.lastLateness)
+
+        # Tick everything first and only then render, so all timers change on screen together
+        self.inPass = True
+        changedTimers = list()
+        try:
+            for timer in list(self.timers):
+                if timer.nextDeadline is not None and timer.nextDeadline <= dueBy:
+                    self.updateCount += 1
+                    if timer.updateTimer(dueBy):
+                        changedTimers.append(timer)
+        finally:
+            self.inPass = False
+        self.passCount += 1
+
+        for timer in changedTimers:
+            timer.render()
+        if self.monitor is not None:
+            self.monitor.recordTick(passLateness, time.perf_counter() - passStart)
+
+        # And continue running this on a loop
+        nextDeadline = self.getNextDeadline()
+        if nextDeadline is not None:
+            self.arm(nextDeadline)
+
+    def getNextDeadline(self) -> float | None:
+        """ Returns the earliest deadline out of all registered timers (or None if all are idle). """
+        return min((timer.nextDeadline for timer in self.timers if timer.nextDeadline is not None), default = None)
+
+    def stop(self) -> None:
+        """ Cancels the pending callback. Timers keep their state, but will no longer tick. """
+        if self.nextCallback is not None:
+            self.root.after_cancel(self.nextCallback)
+            self.nextCallback = None
+        self.armedDeadline = None
+
+    def getDriftStats(self) -> dict[str, float]:
+        """ Reports how late the engine's passes have been relative to the deadlines they were serving. """
+        return {"passes": self.passCount,
+                "timerUpdates": self.updateCount,
+                "timers": len(self.timers),
+                "lastLateness": self.lastLateness,
+                "maxLateness": self.maxLateness}
@@ -0,0 +1,340 @@
+"""
+TimerBank.py
+
+With several bosses tracked at once there can be hundreds of timers, and ticking each one of them as its own Python
+object (with its own intTimer, redTime, autoReset, timerLock, prevTimer, ...) is far too slow. A TimerBank keeps the
+state of every timer in contiguous NumPy arrays (one slot per timer) and ticks all of them at once: decrements,
+red threshold crossings, zero crossings and lock releases are each a handful of vectorized operations per tick, and
+only the slots whose display actually changed are handed back to their views.
+
+Each timer is still presented through the usual TimerState API by a TimerSlot, which simply reads and writes its
+own slot of the bank. Running this module benchmarks a bank against individual TimerStates.
+"""
+import math
+import time
+from utils.Startup import lazyImport
+from utils.TickEngine import TickEngine
+from utils.FightState import TimerState, FightState, VirtualClock, DEFAULT_INIT_TIMES, buildTimerArgs, startEveryTimer
+from utils.FightJournal import EVENT_ZERO, EVENT_AUTO_RESET
+
+# NumPy is only needed once a bank is actually created
+np = lazyImport("numpy")
+
+# Every field of a timer that lives in the bank, along with its dtype and the value of a fresh slot. Idle timers
+# have an infinite deadline in the bank (and a deadline of None through their TimerSlot). The last few fields only
+# describe the slot: the time it auto-resets to (-1 if that depends on the phase), and whether it has a view, a zero
+# callback or a journal that the bank has to call out to
+
+SLOT_FIELDS = {"intTimer": ("int64", 0),
+               "redTime": ("int64", 0),
+               "prevTimer": ("int64", -1),
+               "warningTime": ("int64", 60),
+               "tickCount": ("int64", 0),
+               "autoReset": ("bool", False),
+               "timerLock": ("bool", False),
+               "isWarning": ("bool", False),
+               "isRunning": ("bool", False),
+               "calledFlag": ("bool", False),
+               "nextDeadline": ("float64", math.inf),
+               "lastLateness": ("float64", 0.0),
+               "maxLateness": ("float64", 0.0),
+               "totalLateness": ("float64", 0.0),
+               "earlyTicks": ("int64", 0),
+               "driftStart": ("float64", math.nan),
+               "driftStartLateness": ("float64", 0.0),
+               "resetTime": ("int64", -1),
+               "hasView": ("bool", False),
+               "hasZeroCallback": ("bool", False),
+               "isJournaled": ("bool", False)}
+
+class TimerBank():
+    """
+        Holds the state of any number of timers in one array per field and registers with the tick engine as a
+        single timer. Slots are handed out by createTimer and recycled once released.
+
+        Within a tick every due slot that is not at zero is decremented together, and slots already at zero
+        auto-reset (or stop) together. Only slots at zero that have a zero callback (or reset to a phase dependent
+        time) are ticked one at a time, in slot order, after everything else, since their callbacks may touch
+        other slots.
+    """
+    def __init__(self, engine: TickEngine, *, capacity: int = 64):
+        self.engine = engine
+        self.TICK_PERIOD = 1.0
+
+        # The arrays themselves (field name -> array) along with the slot objects that present them
+        self.fields = {fieldName:np.full(capacity, default, dtype = dtype) for fieldName, (dtype, default) in SLOT_FIELDS.items()}
+        self.capacity = capacity
+        self.slotCount = 0
+        self.slots = list()
+        self.freeSlots = list()
+
+        # The earliest deadline of any slot (this is all the engine ever looks at) and the slots to redraw
+        self.nextDeadline = None
+        self.changedSlots = list()
+
+        self.engine.register(self)
+
+    def allocateSlot(self, timerSlot: "TimerSlot") -> int:
+        """ Hands out a fresh slot for the given timer, growing the arrays if they are full. """
+        if self.freeSlots:
+            slotInd = self.freeSlots.pop()
+            self.slots[slotInd] = timerSlot
+        else:
+            if self.slotCount == self.capacity:
+                self.grow(self.capacity*2)
+            slotInd = self.slotCount
+            self.slotCount += 1
+            self.slots.append(timerSlot)
+
+        for fieldName, (_, default) in SLOT_FIELDS.items():
+            self.fields[fieldName][slotInd] = default
+        return slotInd
+
+    def releaseSlot(self, slotInd: int) -> None:
+        """ Stops the timer in a slot and hands the slot back for reuse. """
+        self.fields["nextDeadline"][slotInd] = math.inf
+        self.fields["hasView"][slotInd] = False
+        self.slots[slotInd] = None
+        self.freeSlots.append(slotInd)
+
+    def grow(self, capacity: int) -> None:
+        """ Reallocates every array with room for the given number of slots. """
+        for fieldName, (dtype, default) in SLOT_FIELDS.items():
+            grownField = np.full(capacity, default, dtype = dtype)
+            grownField[:self.capacity] = self.fields[fieldName]
+            self.fields[fieldName] = grownField
+        self.capacity = capacity
+
+    def createTimer(self, initTime: list[int], redTime: int, autoReset: bool, indSelector: callable, *,
+                    journal: "FightJournal" = None, journalId: int = 0) -> "TimerSlot":
+        """ Creates a timer backed by this bank. Takes the same arguments as a TimerState (minus the engine). """
+        return TimerSlot(self, initTime, redTime, autoReset, indSelector, journal = journal, journalId = journalId)
+
+    def scheduleSlot(self, deadline: float) -> None:
+        """ Lets the engine know if a slot was just scheduled ahead of every other slot. """
+        if self.nextDeadline is None or deadline < self.nextDeadline:
+            self.nextDeadline = deadline
+            self.engine.reschedule(self)
+
+    def getEarliestDeadline(self) -> float | None:
+        """ Returns the earliest deadline of any slot (or None if every slot is idle). """
+        if self.slotCount == 0:
+            return None
+        earliest = self.fields["nextDeadline"][:self.slotCount].min()
+        return None if earliest == math.inf else float(earliest)
+
+    def getDisplay(self) -> tuple["np.ndarray", "np.ndarray"]:
+        """ Returns what every slot presents: its displayed time and whether it is red (see TimerState). """
+        intTimer = self.fields["intTimer"][:self.slotCount]
+        isWarning = self.fields["isWarning"][:self.slotCount]
+        displayTime = np.where(isWarning, self.fields["warningTime"][:self.slotCount], intTimer)
+        isRed = (intTimer <= self.fields["redTime"][:self.slotCount]) | isWarning
+        return displayTime, isRed
+
+    def updateTimer(self, now: float) -> bool:
+        """
+            Runs every tick of every slot that is due by `now` (catching late slots up one tick at a time) and
+            remembers the slots whose display changed. Returns whether any slot has to be redrawn.
+        """
+        deadlines = self.fields["nextDeadline"][:self.slotCount]
+        due = deadlines <= now
+        if not due.any():
+            self.nextDeadline = self.getEarliestDeadline()
+            return False
+
+        # Lateness is measured against the first deadline each slot was due at, and slots ticked ahead of their
+        # deadline are counted as early instead, as in TimerState
+        lateness = self.engine.clock() - deadlines[due]
+        self.fields["earlyTicks"][:self.slotCount][due] += lateness < 0
+        lateness = np.maximum(lateness, 0.0)
+        self.fields["lastLateness"][:self.slotCount][due] = lateness
+        self.fields["totalLateness"][:self.slotCount][due] += lateness
+        maxLateness = self.fields["maxLateness"][:self.slotCount]
+        maxLateness[due] = np.maximum(maxLateness[due], lateness)
+        driftStart = self.fields["driftStart"][:self.slotCount]
+        firstTick = due & np.isnan(driftStart)
+        self.fields["driftStartLateness"][:self.slotCount][firstTick] = lateness[firstTick[due]]
+        driftStart[firstTick] = deadlines[firstTick]
+
+        prevDisplay, prevRed = self.getDisplay()
+        while due.any():
+            self.tickSlots(due)
+            deadlines = self.fields["nextDeadline"][:self.slotCount]
+            due = deadlines <= now
+
+        # Only slots whose time or color changed are handed back to their views
+        displayTime, isRed = self.getDisplay()
+        changed = (displayTime != prevDisplay[:self.slotCount]) | (isRed != prevRed[:self.slotCount])
+        self.changedSlots = np.flatnonzero(changed & self.fields["hasView"][:self.slotCount]).tolist()
+        self.nextDeadline = self.getEarliestDeadline()
+        return bool(self.changedSlots)
+
+    def tickSlots(self, due: "np.ndarray") -> None:
+        """ Performs a single one second step of every slot in the due mask. """
+        slotCount = len(due)
+        fields = {fieldName:fieldArray[:slotCount] for fieldName, fieldArray in self.fields.items()}
+        intTimer = fields["intTimer"]
+        atZero = due & (intTimer == 0)
+        ticking = due & ~atZero
+
+        # Warning timers count down their warning time while the timer underneath stops at 60
+        fields["tickCount"][ticking] += 1
+        warning = ticking & fields["isWarning"]
+        fields["warningTime"][warning] -= 1
+        intTimer[warning & (intTimer > 60)] -= 1
+        intTimer[ticking & ~fields["isWarning"]] -= 1
+
+        for slotInd in np.flatnonzero(ticking & (intTimer == 0)):
+            self.slots[slotInd].recordZero()
+
+        # If previous time is no longer relevant, then remove the timer lock
+        unlock = ticking & fields["timerLock"] & (intTimer <= fields["prevTimer"])
+        fields["prevTimer"][unlock] = -1
+        fields["timerLock"][unlock] = False
+        fields["nextDeadline"][ticking] += self.TICK_PERIOD
+        if not atZero.any():
+            return
+
+        # Timers at zero without anything to call back auto-reset (or stop) in bulk
+        plainZero = atZero & ~fields["hasZeroCallback"]
+        reset = plainZero & fields["autoReset"] & (fields["resetTime"] >= 0)
+        stop = plainZero & ~fields["autoReset"]
+        fields["tickCount"][reset | stop] += 1
+        intTimer[reset] = fields["resetTime"][reset]
+        fields["calledFlag"][reset] = False
+        fields["nextDeadline"][reset] += self.TICK_PERIOD
+        fields["isRunning"][stop] = False
+        fields["nextDeadline"][stop] = math.inf
+        for slotInd in np.flatnonzero(reset & fields["isJournaled"]):
+            self.slots[slotInd].journal.record(EVENT_AUTO_RESET, self.slots[slotInd].journalId, int(intTimer[slotInd]))
+
+        # And the rest run their zero callbacks exactly like a TimerState does
+        for slotInd in np.flatnonzero(atZero & ~(reset | stop)):
+            timerSlot = self.slots[slotInd]
+            timerSlot.nextDeadline = timerSlot.tick(float(fields["nextDeadline"][slotInd]))
+
+    def render(self) -> None:
+        """ Redraws only the slots that changed during the last pass. """
+        for slotInd in self.changedSlots:
+            self.slots[slotInd].render()
+        self.changedSlots = list()
+
+def slotField(fieldName: str) -> property:
+    """ A TimerSlot attribute that reads and writes the slot's entry in one of the bank's arrays. """
+    def getField(self):
+        return self.bank.fields[fieldName][self.slot].item()
+    def setField(self, value):
+        self.bank.fields[fieldName][self.slot] = value
+    return property(getField, setField)
+
+class TimerSlot(TimerState):
+    """
+        A TimerState whose countdown lives in one slot of a TimerBank. Every TimerState method works unchanged
+        on top of the bank (its fields are simply read from and written to the slot), except that the slot is
+        never registered with the engine itself; the bank ticks it along with every other slot.
+    """
+    intTimer = slotField("intTimer")
+    redTime = slotField("redTime")
+    prevTimer = slotField("prevTimer")
+    warningTime = slotField("warningTime")
+    tickCount = slotField("tickCount")
+    autoReset = slotField("autoReset")
+    timerLock = slotField("timerLock")
+    isWarning = slotField("isWarning")
+    isRunning = slotField("isRunning")
+    calledFlag = slotField("calledFlag")
+    lastLateness = slotField("lastLateness")
+    maxLateness = slotField("maxLateness")
+    totalLateness = slotField("totalLateness")
+    earlyTicks = slotField("earlyTicks")
+    driftStart = slotField("driftStart")
+    driftStartLateness = slotField("driftStartLateness")
+
+    def __init__(self, bank: TimerBank, initTime: list[int], redTime: int, autoReset: bool, indSelector: callable, *,
+                 journal: "FightJournal" = None, journalId: int = 0):
+        self.bank = bank
+        self.slot = bank.allocateSlot(self)
+
+        # Everything that is not ticked stays on the object itself
+        self.initTime = initTime
+        self.indSelector = indSelector
+        self.engine = bank.engine
+        self.runStart = None
+        self.zeroCallback = None
+        self.renderCallback = None
+        self.journal = journal
+        self.journalId = journalId
+        self.TICK_PERIOD = bank.TICK_PERIOD
+        self.DRIFT_WINDOW = 600.0
+
+        self.redTime = redTime
+        self.autoReset = autoReset
+        self.bank.fields["resetTime"][self.slot] = initTime[0] if len(initTime) == 1 else -1
+        self.bank.fields["isJournaled"][self.slot] = journal is not None
+
+    @property
+    def nextDeadline(self) -> float | None:
+        deadline = self.bank.fields["nextDeadline"][self.slot].item()
+        return None if deadline == math.inf else deadline
+
+    @nextDeadline.setter
+    def nextDeadline(self, deadline: float | None) -> None:
+        self.bank.fields["nextDeadline"][self.slot] = math.inf if deadline is None else deadline
+
+    def associateZeroTimerCallback(self, callback: callable, *args, **kwargs) -> None:
+        """
+            Allow a timer to have a certain callback executed the moment the timer reaches 0.
+        """
+        TimerState.associateZeroTimerCallback(self, callback, *args, **kwargs)
+        self.bank.fields["hasZeroCallback"][self.slot] = True
+
+    def associateRenderCallback(self, callback: callable) -> None:
+        """ Attaches a view to the timer. The bank only redraws slots that have one. """
+        TimerState.associateRenderCallback(self, callback)
+        self.bank.fields["hasView"][self.slot] = callback is not None
+
+    def scheduleTick(self, deadline: float) -> None:
+        """ Sets the absolute deadline of our next tick and lets the bank know about it. """
+        self.nextDeadline = deadline
+        self.bank.scheduleSlot(deadline)
+
+    def recordZero(self) -> None:
+        """ Journals the slot reaching zero (the bank does the decrement itself). """
+        if self.journal is not None:
+            self.journal.record(EVENT_ZERO, self.journalId)
+
+    def detach(self) -> None:
+        """ Stops the timer for good and hands its slot back to the bank. """
+        self.bank.releaseSlot(self.slot)
+
+def benchmark(fightCount: int, seconds: int = 600, *, useBank: bool) -> tuple[float, list[dict]]:
+    """
+        Runs fightCount fights (7 timers each, all running) on one headless engine for the given number of
+        seconds. Returns the time spent ticking along with a snapshot of every fight.
+    """
+    clock = VirtualClock()
+    engine = TickEngine(None, clock = clock)
+    bank = TimerBank(engine) if useBank else None
+    fights = [FightState(buildTimerArgs(DEFAULT_INIT_TIMES), engine = engine, bank = bank) for _ in range(fightCount)]
+    for fightInd, fight in enumerate(fights):
+        startEveryTimer(fight)
+        # stagger the fights a little so they do not all hit zero on the same tick
+        fight.addBindTimer(fightInd % 15)
+
+    startTime = time.perf_counter()
+    nextDeadline = engine.getNextDeadline()
+    while nextDeadline is not None and nextDeadline <= seconds:
+        clock.now = nextDeadline
+        engine.runPass()
+        nextDeadline = engine.getNextDeadline()
+    return time.perf_counter() - startTime, [fight.getSnapshot() for fight in fights]
+
+# benchmark
+if __name__ == "__main__":
+    np.ndarray # import numpy up front so that it is not timed
+    for fightCount in [1, 10, 50, 200]:
+        stateTime, stateSnapshots = benchmark(fightCount, useBank = False)
+        bankTime, bankSnapshots = benchmark(fightCount, useBank = True)
+        print("{:>4} fights ({:>4} timers): TimerState {:>8.2f} ms, TimerBank {:>8.2f} ms ({:.1f}x){}".format(
+              fightCount, fightCount*7, stateTime*1000, bankTime*1000, stateTime/bankTime,
+              "" if stateSnapshots == bankSnapshots else "  MISMATCH"))
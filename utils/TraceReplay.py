@@ -0,0 +1,133 @@
+"""
+TraceReplay.py
+
+Replays keyboard traces (as recorded by the keyboard library) through the very same hotkey matching
+(ModKeyListener.processEvent) and fight actions (FightState.actionFor, which is what the overlay runs) that are used
+live. The fight runs on a VirtualClock, so a whole raid session can be reproduced in well under a second, or paced
+at any time compression factor to watch it unfold.
+
+Traces are stored as one KeyboardEvent.to_json() per line. Hotkeys are given as a json object mapping the setting
+names of the config window to their hotkeys, e.g. {"Start Timers": "f1", "Clear Device": "shift+q"}.
+"""
+import argparse
+import json
+import time
+from utils.Startup import lazyImport
+from utils.ActionQueue import ActionQueue
+from utils.ModKeyListener import ModKeyListener
+from utils.FightState import FightSimulator, DEFAULT_INIT_TIMES, DEFAULT_ACTION_COOLDOWNS, COALESCED_ACTIONS, buildTimerArgs
+
+keyboard = lazyImport("keyboard")
+
+def saveTrace(events: list["keyboard.KeyboardEvent"], tracePath: str) -> None:
+    """ Writes a list of keyboard events to a trace file. """
+    with open(tracePath, "w") as traceFile:
+        for event in events:
+            traceFile.write(event.to_json() + "\n")
+
+def loadTrace(tracePath: str) -> list["keyboard.KeyboardEvent"]:
+    """ Reads back every keyboard event stored in a trace file. """
+    with open(tracePath, "r") as traceFile:
+        return [keyboard.KeyboardEvent(**json.loads(line)) for line in traceFile if line.strip()]
+
+def recordTrace(tracePath: str, until: str = "esc") -> list["keyboard.KeyboardEvent"]:
+    """ Records every key event until the given key is pressed and saves them to a trace file. """
+    events = keyboard.record(until = until)
+    saveTrace(events, tracePath)
+    return events
+
+class TraceReplayer():
+    """
+        Feeds recorded keyboard events into a headless fight. Every event goes through a ModKeyListener (without
+        any keyboard hook of its own) whose hotkeys post to an action queue, just like the live app does, and the
+        queue is drained after every event.
+
+        The fight clock always follows the timestamps of the trace, so the final state does not depend on how
+        fast the trace is replayed.
+    """
+    def __init__(self, hotkeys: dict[str, str], timerArgs: dict, *, journal: "FightJournal" = None):
+        self.simulator = FightSimulator(timerArgs, journal = journal)
+        self.actionQueue = ActionQueue(None)
+        self.listener = ModKeyListener(actionQueue = self.actionQueue, hookKeyboard = False)
+        for settingName, hotkey in hotkeys.items():
+            self.listener.createHotkeyCallback(hotkey, self.simulator.fight.actionFor(settingName), settingName,
+                                               cooldown = DEFAULT_ACTION_COOLDOWNS.get(settingName, 0.0),
+                                               coalesce = settingName in COALESCED_ACTIONS)
+
+        # Time spent inside the hotkey matching alone
+        self.matchTime = 0.0
+
+    def replay(self, events: list["keyboard.KeyboardEvent"], *, compression: float = None, endTime: float = None) -> dict:
+        """
+            Replays the events and returns a report of the replay along with the final fight state. Without a
+            compression factor the trace is replayed as fast as possible, otherwise a trace second takes
+            1/compression wall seconds. endTime (in trace seconds) lets the fight keep running after the last event.
+        """
+        if not events:
+            return self.getReport(0.0, 0.0)
+
+        traceStart = events[0].time
+        replayStart = time.perf_counter()
+        for event in events:
+            fightTime = event.time - traceStart
+            if compression is not None:
+                delay = replayStart + fightTime/compression - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+
+            # Catch the fight up to the moment of the key, then match it and run whatever it triggered
+            self.simulator.advanceTo(fightTime)
+            matchStart = time.perf_counter()
+            self.listener.processEvent(event)
+            self.matchTime += time.perf_counter() - matchStart
+            self.actionQueue.drain()
+
+        traceTime = events[-1].time - traceStart
+        if endTime is not None and endTime > traceTime:
+            self.simulator.advanceTo(endTime)
+            traceTime = endTime
+        return self.getReport(traceTime, time.perf_counter() - replayStart)
+
+    def getReport(self, traceTime: float, replayTime: float) -> dict:
+        """ Summarizes the replay along with the final fight state. """
+        return {"events": self.listener.dispatcher.processedCount,
+                "hotkeys": self.listener.dispatcher.matchedCount,
+                "traceSeconds": traceTime,
+                "replaySeconds": replayTime,
+                "compression": traceTime/replayTime if replayTime > 0 else 0.0,
+                "eventsPerSecond": self.listener.dispatcher.processedCount/self.matchTime if self.matchTime > 0 else 0.0,
+                "repeatDropped": self.listener.dispatcher.repeatDropped,
+                "cooldownDropped": self.listener.dispatcher.cooldownDropped,
+                "coalesced": self.actionQueue.coalescedCount,
+                "final": self.simulator.fight.getSnapshot()}
+
+def printReport(report: dict) -> None:
+    """ Prints a replay report in a readable form. """
+    print("Replayed {} events ({} hotkeys) covering {:.1f} s in {:.1f} ms ({:.0f}x)".format(
+          report["events"], report["hotkeys"], report["traceSeconds"], report["replaySeconds"]*1000, report["compression"]))
+    print("Hotkey matching throughput: {:.0f} events/s".format(report["eventsPerSecond"]))
+    print("Dropped invocations: {} key repeats, {} within cooldown, {} coalesced".format(
+          report["repeatDropped"], report["cooldownDropped"], report["coalesced"]))
+
+    final = report["final"]
+    print("Final phase: {}, devices: {}".format(final["phase"], final["devices"]))
+    for timerName, timerState in final["timers"].items():
+        print("    {:<8}{:>6}{}{}{}".format(timerName, timerState["time"], "  running" if timerState["running"] else "",
+                                          "  locked" if timerState["locked"] else "", "  warning" if timerState["warning"] else ""))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Replays a recorded keyboard trace through the hotkey matching and fight logic.")
+    parser.add_argument("trace", help = "trace file (one KeyboardEvent json per line)")
+    parser.add_argument("hotkeys", help = "json file mapping setting names to hotkeys")
+    parser.add_argument("--speed", type = float, default = None, help = "time compression factor (default: as fast as possible)")
+    parser.add_argument("--end", type = float, default = None, help = "keep the fight running until this many seconds into the trace")
+    parser.add_argument("--record", action = "store_true", help = "record a new trace (until esc) before replaying it")
+    cliArgs = parser.parse_args()
+
+    if cliArgs.record:
+        recordTrace(cliArgs.trace)
+    with open(cliArgs.hotkeys, "r") as hotkeyFile:
+        hotkeys = json.load(hotkeyFile)
+
+    replayer = TraceReplayer(hotkeys, buildTimerArgs(DEFAULT_INIT_TIMES))
+    printReport(replayer.replay(loadTrace(cliArgs.trace), compression = cliArgs.speed, endTime = cliArgs.end))
@@ -4,308 +4,275 @@ WidgetContainers.py
 The main file got too big and these only really serve to be encapsulating classes for particular tk
 interfaces, so they will get pushed here as all of them serve a very similar purpose.
 """
+import collections
 import tkinter as tk
-from PIL import ImageTk, Image
+from utils.AssetManager import getAssetManager
+from utils.FightState import TimerState, DeviceCounterState
+from utils.RenderCoalescer import RenderCoalescer
 
 class Timer():
     """
         Creates a pseudo-control panel for timer widgets. Encapsulates them so that properties can be accessed
-        easily and also gives them an optional string ID which can be used to identify specific timers.
+        easily. All of the countdown logic lives in the TimerState that is passed in; this class is only the
+        view on top of it and forwards the timer API to the state.
 
-        This method can take into account multiple times, but in order to do so will need to be provided a
-        function that takes in no arguments and returns the appropriate indexer at any given moment.
+        Widget updates go through the given RenderCoalescer (if any), so repeated renders within one event
+        only cost a single Tcl call per changed value.
+
+        Given a GlyphCache the label shows pre-rendered images of the time instead of text (and has no
+        StringVar), so a render only swaps the label's image.
     """
-    def __init__(self, root: tk.Tk, timerStr: tk.StringVar, timerLab: tk.Label, initTime: list[int], redTime: int, autoReset: bool,
-                 indSelector: callable):
-        # Save our values which will be used for the timer processes
+    def __init__(self, timerStr: tk.StringVar, timerLab: tk.Label, state: TimerState, renderer: RenderCoalescer = None, *,
+                 glyphs: "GlyphCache" = None):
+        # Save our widgets along with the state that we are presenting
         self.timString = timerStr
         self.timLab = timerLab
-        self.initTime = initTime
-        self.redTime = redTime
-        self.autoReset = autoReset
-        self.indSelector = indSelector
-        self.root = root
-
-        # Our warning timer allows us to count down from 60s while maintaining the current timer underneath
-        self.isWarning = False
-        self.warningTime = 60
-
-        # Holds our next callback's ID to potentially allow us to reset it
-        self.nextCallback = None
-
-        # We can associate callbacks outisde of here since we are constantly updating values
-        self.zeroCallback = None
-        self.calledFlag = False
-
-        # And use this to be able to check whether the timer is currently running
-        self.intTimer = 0
-        self.prevTimer = -1
-        self.timerLock = False      # used to prevent addTime from being added while memorizing old timer
-        self.isRunning = False
+        self.state = state
+        self.renderer = renderer
+        self.glyphs = glyphs
 
         # And some class constants to be used later
         self.RED_COLOR = "red"
         self.BLACK_COLOR = "black"
 
-    def resetTimer(self) -> None:
-        """
-            Starts the timer if it is not already running, and, if it is, simply resets it.
-        """
-        # if a process is already under way, we need to remove it so that the timer
-        # properly counts the next second
-        if self.nextCallback is not None:
-            self.root.after_cancel(self.nextCallback)
-            self.isRunning = False
-
-        # reset time
-        self.intTimer = self.initTime[self.indSelector()]
-        self.render()
-
-        # and make sure the timer is running if it's not
-        if not self.isRunning:
-            self.isRunning = True
-            self.nextCallback = self.root.after(1000, self.updateTimer)
-
-    def updateTimer(self) -> None:
-        """
-            Decrements the timer time by 1 second and updates the timer color 
-        """
-        # Reset if at 0 and auto-reset is enabled
-        if self.intTimer == 0:
-            if self.autoReset:
-                self.resetTimer()
-                self.calledFlag = False
-        
-            # run our zero callback only once
-            if not self.calledFlag and self.zeroCallback:
-                self.zeroCallback()
-                self.calledFlag = True
-            
-            return
-        
-        # Otherwise simply decrement and change the label as necessary
-        if self.isWarning:
-            self.warningTime -= 1
-            if self.intTimer > 60:
-                self.intTimer -= 1
-        else:
-            self.intTimer -= 1
-        self.render()
+        # Whenever the state changes we want to be redrawn
+        self.state.associateRenderCallback(self.render)
 
-        # If previous time is no longer relevant, then remove the timer lock
-        if self.timerLock and self.intTimer <= self.prevTimer:
-            self.prevTimer = -1
-            self.timerLock = False
+    def render(self) -> None:
+        """ Redraws the timer"""
+        timColor = self.RED_COLOR if self.state.isRed() else self.BLACK_COLOR
+        timText = "{:>2}".format(self.state.getDisplayTime())
+
+        if self.glyphs is not None:
+            glyph = self.glyphs.getGlyph(timText, timColor)
+            if self.renderer is not None:
+                self.renderer.configure(self.timLab, "image", glyph)
+            else:
+                self.timLab.configure(image = glyph)
+        elif self.renderer is not None:
+            self.renderer.configure(self.timLab, "fg", timColor)
+            self.renderer.setText(self.timLab, self.timString, timText)
+        else:
+            self.timLab['fg'] = timColor
+            self.timString.set(timText)
 
-        # And continue running this on a loop
-        self.nextCallback = self.root.after(1000, self.updateTimer)
+    def resetTimer(self) -> None:
+        self.state.resetTimer()
 
     def addTime(self, addTime: int) -> None:
-        """
-            Adds time to the timer. Does not memorize previous state like the
-            apply/remove functions do.
-        """
-        # avoid writing when timer is locked
-        if self.timerLock:
-            return
-
-        if self.nextCallback is not None:
-            self.root.after_cancel(self.nextCallback)
-        
-        # Then just add the time and continue
-        self.intTimer += addTime
-        self.render()
-        self.nextCallback = self.root.after(1000, self.updateTimer)
+        self.state.addTime(addTime)
 
     def associateZeroTimerCallback(self, callback: callable, *args, **kwargs) -> None:
-        """
-            Allow a timer to have a certain callback executed the moment the timer reaches 0.
-        """
-        self.zeroCallback = lambda : callback(*args, **kwargs)
-
-    def render(self) -> None:
-        """ Redraws the timer"""
-        if self.intTimer <= self.redTime or self.isWarning:
-            self.timLab['fg'] = self.RED_COLOR
-        else:
-            self.timLab['fg'] = self.BLACK_COLOR
-
-        if self.isWarning:
-            self.timString.set("{:>2}".format(self.warningTime))
-        else:
-            self.timString.set("{:>2}".format(self.intTimer))
+        self.state.associateZeroTimerCallback(callback, *args, **kwargs)
 
     def isLocked(self) -> bool:
-        return self.timerLock
-    
+        return self.state.isLocked()
+
     def swapToWarning(self) -> None:
-        """ Swaps the current timer display to the warning timer. """
-        self.warningTime = 60
-        self.intTimer = 60
-        self.isWarning = True
-        self.render()
+        self.state.swapToWarning()
 
     def swapToNormal(self) -> None:
-        """ Disables warning time and presents the normal timer again """
-        self.isWarning = False
-        self.render()
+        self.state.swapToNormal()
 
-    ############# PHASE CHECK FUNCTIONS #############
     def applyExtraTime(self, newTime: int) -> None:
-        """ Applies extra time to the timer in seconds. Returns the incremented amount passed. """
-        # If we have already added extra time, prevent us from doing it again
-        if self.timerLock:
-            return
-
-        # First we want to reset the callback at this point so as get an accurate measure
-        if self.nextCallback is not None:
-            self.root.after_cancel(self.nextCallback)
+        return self.state.applyExtraTime(newTime)
 
-        # We can memorize our previous location in case we need to remove the extra time
-        self.prevTimer = self.intTimer
+    def removeExtraTime(self) -> None:
+        return self.state.removeExtraTime()
 
-        # And then we can increment the timer by the requested amount of time
-        self.intTimer += newTime
-        self.timerLock = True
-        self.render()
-        self.nextCallback = self.root.after(1000, self.updateTimer)
+    def getDriftStats(self) -> dict[str, float]:
+        return self.state.getDriftStats()
 
-        return newTime
+class CanvasTimer(Timer):
+    """
+        The same timer view for the canvas layout, where the time is a text item on the overlay's canvas rather
+        than a label with its own StringVar. Without a renderer both the text and the color go out in a single
+        itemconfigure call. In glyph mode the item is an image item instead.
+    """
+    def __init__(self, canvas: tk.Canvas, textItem: int, state: TimerState, renderer: RenderCoalescer = None, *,
+                 glyphs: "GlyphCache" = None):
+        self.canvas = canvas
+        self.textItem = textItem
+        Timer.__init__(self, None, None, state, renderer, glyphs = glyphs)
 
-    def removeExtraTime(self) -> None:
-        """ If any additional time exists from what was added above, forces the timer to go back
-            to its previous state (without any additional time). If all additional time has
-             elapsed, then nothing is done. Returns the time differential. """
-        if self.prevTimer >= self.intTimer:
-            return
-        
-        # Otherwise pause our callback and return to the previous time before continuing
-        if self.nextCallback is not None:
-            self.root.after_cancel(self.nextCallback)
-        
-        # And then continue the timer
-        differential = self.intTimer - self.prevTimer
-        self.intTimer = self.prevTimer
-        self.render()
-        self.nextCallback = self.root.after(1000, self.updateTimer)
-        self.timerLock = False
-
-        return differential
+    def render(self) -> None:
+        """ Redraws the timer"""
+        timColor = self.RED_COLOR if self.state.isRed() else self.BLACK_COLOR
+        timText = "{:>2}".format(self.state.getDisplayTime())
+
+        if self.glyphs is not None:
+            glyph = self.glyphs.getGlyph(timText, timColor)
+            if self.renderer is not None:
+                self.renderer.configureItem(self.canvas, self.textItem, "image", glyph)
+            else:
+                self.canvas.itemconfigure(self.textItem, image = glyph)
+        elif self.renderer is not None:
+            self.renderer.configureItem(self.canvas, self.textItem, "fill", timColor)
+            self.renderer.configureItem(self.canvas, self.textItem, "text", timText)
+        else:
+            self.canvas.itemconfigure(self.textItem, fill = timColor, text = timText)
 
 class DeviceCounterWidget():
     """
         Like the timers, we encapsulate the four dots that represents the devices to make things easier
-        for us. This will control the view and also allow us to bind a particular event using a 
-        stringvar's trace method as a callback source.
+        for us. The count itself is kept by a DeviceCounterState and this class only swaps the dot images
+        whenever the state tells it that a device has changed.
     """
-    def __init__(self, dotLabels: list[tk.Label], initDeviceCnt: int = 0):
-        # image sources
-        self.dotState = {0 : ImageTk.PhotoImage(Image.open("./resources/emptyDot.png")),
-                         1 : ImageTk.PhotoImage(Image.open("./resources/redDot.png"))}
+    def __init__(self, dotLabels: list[tk.Label], state: DeviceCounterState, renderer: RenderCoalescer = None):
+        # image sources (shared with every other widget through the asset manager)
+        assets = getAssetManager()
+        self.dotState = {0 : assets.getPhotoImage("emptyDot"),
+                         1 : assets.getPhotoImage("redDot")}
 
         # widget intrinsics
-        self.curDeviceCnt = initDeviceCnt
-        self.deviceStates = [1]*self.curDeviceCnt + [0]*(len(dotLabels)-self.curDeviceCnt)
         self.deviceLabels = dotLabels
-        self.maxDeviceCallbackE = None
-        self.maxDeviceCallbackL = None
+        self.state = state
+        self.renderer = renderer
+        self.state.associateRenderCallback(self.renderDevice)
 
         # finalize using a re-render
         self.forceRender()
-    
+
     def incrementDevices(self):
         """ Increases the number of active devices by 1. """
-        # Ignore if at max capacity already
-        if self.curDeviceCnt == len(self.deviceStates):
-            return
-        
-        # We can change only the single device that was adjusted
-        self.deviceStates[self.curDeviceCnt] = 1
-        self.deviceLabels[self.curDeviceCnt].configure(image = self.dotState[1])
-        self.curDeviceCnt += 1
-
-        # And run our callback if we just touched max device count
-        if self.curDeviceCnt == len(self.deviceStates):
-            self.maxDeviceCallbackE()
-    
+        self.state.incrementDevices()
+
     def decrementDevices(self):
-        # Ignore if at minimum capacity already
         """ Decreases the number of active devices by 1 """
-        if self.curDeviceCnt == 0:
-            return
-        elif self.curDeviceCnt == len(self.deviceStates):
-            self.maxDeviceCallbackL()
-        
-        # We can change only the single device that was adjusted
-        self.curDeviceCnt -= 1
-        self.deviceStates[self.curDeviceCnt] = 0
-        self.deviceLabels[self.curDeviceCnt].configure(image = self.dotState[0])
-    
+        self.state.decrementDevices()
+
+    def renderDevice(self, devInd: int, devState: int) -> None:
+        """ Re-renders the single device that was adjusted. """
+        if self.renderer is not None:
+            self.renderer.configure(self.deviceLabels[devInd], "image", self.dotState[devState])
+        else:
+            self.deviceLabels[devInd].configure(image = self.dotState[devState])
+
     def forceRender(self) -> None:
         """ Forces tkinter to re-render the dot widget in its entirety (including non-changing objects) """
         for devInd, devLabel in enumerate(self.deviceLabels):
-            devLabel.configure(image = self.dotState[self.deviceStates[devInd]])
+            if self.renderer is not None:
+                self.renderer.configure(devLabel, "image", self.dotState[self.state.deviceStates[devInd]], force = True)
+            else:
+                devLabel.configure(image = self.dotState[self.state.deviceStates[devInd]])
 
     def associateMaxDeviceCallback(self, entryCallback: callable, leaveCallback: callable) -> None:
         """ Once the max number of devices has been reached or is no longer reached, executes a callback only 
         once until the device counter has been changed beyond the triggers."""
-        self.maxDeviceCallbackE = entryCallback
-        self.maxDeviceCallbackL = leaveCallback
+        self.state.associateMaxDeviceCallback(entryCallback, leaveCallback)
+
+class CanvasDeviceCounter(DeviceCounterWidget):
+    """
+        The four device dots drawn as image items on the overlay's canvas.
+    """
+    def __init__(self, canvas: tk.Canvas, dotItems: list[int], state: DeviceCounterState, renderer: RenderCoalescer = None):
+        self.canvas = canvas
+        DeviceCounterWidget.__init__(self, dotItems, state, renderer)
+
+    def renderDevice(self, devInd: int, devState: int) -> None:
+        """ Re-renders the single device that was adjusted. """
+        if self.renderer is not None:
+            self.renderer.configureItem(self.canvas, self.deviceLabels[devInd], "image", self.dotState[devState])
+        else:
+            self.canvas.itemconfigure(self.deviceLabels[devInd], image = self.dotState[devState])
+
+    def forceRender(self) -> None:
+        """ Forces tkinter to re-render the dot items in their entirety (including non-changing objects) """
+        for devInd, dotItem in enumerate(self.deviceLabels):
+            if self.renderer is not None:
+                self.renderer.configureItem(self.canvas, dotItem, "image", self.dotState[self.state.deviceStates[devInd]], force = True)
+            else:
+                self.canvas.itemconfigure(dotItem, image = self.dotState[self.state.deviceStates[devInd]])
 
 class PhaseImageWidget():
     """
         This time we control the image that represents the current phase of the boss. This widget is
         entirely controlled by the overlay and this class only servers to encapsulate the methods
         that will be used to alter the state of the widget.
+
+        Scaled phase images are kept in a small LRU cache keyed by (phase, target width). Only the phase
+        on screen is rescaled when the window changes size; the others are scaled lazily when shown. The
+        images themselves come from the shared asset manager, so overlays of the same width share them.
     """
-    def __init__(self, master, phaseLabel: tk.Label, curPhase: int = 0):
+    def __init__(self, master, phaseLabel: tk.Label, curPhase: int = 0, *, cacheSize: int = 16):
         # constant for the image itself
         self.IMG_PADDING = 2
-        self.PHASE_IMGS = ["./resources/2-1.png",
-                           "./resources/2-2.png",
-                           "./resources/2-3.png",
-                           "./resources/2-4.png",
-                           "./resources/2-5.png"]
+        self.PHASE_IMGS = ["2-1", "2-2", "2-3", "2-4", "2-5"]
+        self.CACHE_SIZE = cacheSize
 
         # First store our resources for use later
         self.curPhase = curPhase
         self.curLabel = phaseLabel
         self.root = master
 
-        # And load all of our images since we will be using them all eventually
-        self.sources, self.imageRefs = self.loadResources(self.PHASE_IMGS)
+        # The cache of scaled images along with the one currently on screen (which must stay referenced
+        # even if the cache evicts it, or tk would blank the label)
+        self.scaledImages = collections.OrderedDict()
+        self.curImage = None
+        self.targetWidth = self.root.width - 2*self.IMG_PADDING
+
+        # Only the width we start at is worth keeping on disk for the next launch, the ones passed through while
+        # resizing are scaled in memory
+        self.startWidth = self.targetWidth
+
+        # The source images are decoded once for the whole process by the asset manager
+        self.assets = getAssetManager()
         self.forceRender()
 
-    def loadResources(self, inSrcs: list[str]) -> list[ImageTk.PhotoImage]:
-        """ Takes in a list of image sources and loads all of them into PhotoImage widgets for later use. """
-        sourceImg = list()
-        thumbImg = list()
+    def getScaledImage(self, phase: int, targetWidth: int) -> tk.PhotoImage:
+        """ Returns the image for the given phase scaled to fit the target width, scaling it only on a cache miss. """
+        cacheKey = (phase, targetWidth)
+        if cacheKey in self.scaledImages:
+            self.scaledImages.move_to_end(cacheKey)
+            return self.scaledImages[cacheKey]
+
+        self.scaledImages[cacheKey] = self.assets.getPhotoImage(self.PHASE_IMGS[phase], fitWidth = targetWidth,
+                                                                persist = targetWidth == self.startWidth)
 
-        for src in inSrcs:
-            sourceImg.append(Image.open(src))
-            phaseThumb = sourceImg[-1].copy()
-            phaseThumb.thumbnail((self.root.width - 2*self.IMG_PADDING, sourceImg[-1].size[1]))
-            thumbImg.append(ImageTk.PhotoImage(phaseThumb))
-        
-        return sourceImg, thumbImg
+        # Evict the least recently used images once we are over capacity
+        while len(self.scaledImages) > self.CACHE_SIZE:
+            self.scaledImages.popitem(last = False)
+
+        return self.scaledImages[cacheKey]
 
     def resetPhase(self, newPhase: int) -> None:
         """
             Resets the image to represent the phase that is currently being observed.
         """
-        self.curLabel.configure(image = self.imageRefs[newPhase])
+        self.curImage = self.getScaledImage(newPhase, self.targetWidth)
+        self.showImage(self.curImage)
         self.curPhase = newPhase
 
+    def showImage(self, image: tk.PhotoImage) -> None:
+        """ Puts the given image on screen. """
+        self.curLabel.configure(image = image)
+
+    def rescale(self, windowWidth: int) -> None:
+        """
+            Fits the phase image to a new window width. Only the phase on screen is rescaled right away.
+        """
+        newWidth = max(1, windowWidth - 2*self.IMG_PADDING)
+        if newWidth == self.targetWidth:
+            return
+        self.targetWidth = newWidth
+        self.forceRender()
+
     def forceRender(self) -> None:
         """
             Forces the widget to re-render the image that represents the current phase.
             This can be due to the window status changing.
         """
-        newThumbs = list()
-        for src in self.sources:
-            newThumbs.append(src.copy())
-            newThumbs[-1].thumbnail((self.root.width - 2*self.IMG_PADDING, src.size[1]))
-
-        # And replace all the thumbnails with the new size
-        self.imageRefs = [ImageTk.PhotoImage(thumb) for thumb in newThumbs]
-        self.curLabel.configure(image = self.imageRefs[self.curPhase])
\ No newline at end of file
+        self.resetPhase(self.curPhase)
+
+class CanvasPhaseImage(PhaseImageWidget):
+    """
+        The phase image drawn as an image item on the overlay's canvas.
+    """
+    def __init__(self, master, canvas: tk.Canvas, imageItem: int, curPhase: int = 0, *, cacheSize: int = 16):
+        self.canvas = canvas
+        self.imageItem = imageItem
+        PhaseImageWidget.__init__(self, master, None, curPhase, cacheSize = cacheSize)
+
+    def showImage(self, image: tk.PhotoImage) -> None:
+        """ Puts the given image on screen. """
+        self.canvas.itemconfigure(self.imageItem, image = image)